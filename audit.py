@@ -0,0 +1,252 @@
+"""
+Append-only change history of the library tables, for "who changed this
+footprint" and "what did the library look like when the board was released".
+
+Triggers on parts, module, module_parts and supplier write every change to
+audit_log as the full row after the change (the row before it, for deletes),
+keyed by the row's stable key (parts_uuid etc., so renames stay one history):
+
+    op  I insert, U update, D delete, S snapshot taken when auditing began
+
+The triggers are statement-level with transition tables, so a bulk edit of
+a thousand parts costs one INSERT ... SELECT rather than a thousand trigger
+calls. Updates that only touch UNTRACKED_COLUMNS (derived values this tool
+maintains itself) aren't recorded.
+
+audit_log is range-partitioned by month. New months are created ahead of
+time by ensure_audit_partitions(); anything that lands outside them goes to
+a default partition and is moved out when its month is created.
+
+Time travel reads the live table and swaps in the last recorded version of
+only the rows changed since the requested time, so a snapshot costs roughly
+the size of the library plus the changes since, not the whole history.
+Timestamps are transaction start times, as now() gives.
+
+AuditMixin is part of database.DatabaseManager and sets the log up and reads
+it through its cursor and schema fingerprints.
+"""
+import datetime
+import logging
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Audited tables and the columns identifying a row across updates.
+AUDIT_TABLES: Dict[str, Tuple[str, ...]] = {
+    "parts": ("parts_uuid",),
+    "module": ("module_uuid",),
+    "module_parts": ("module_uuid", "part_uuid"),
+    "supplier": ("supplier_name",),
+}
+
+# Derived columns (see part_values); changes to them alone aren't history.
+UNTRACKED_COLUMNS = ["value_magnitude", "value_unit", "value_sort_key", "part_number_sort_key"]
+
+# Columns left out of change lists: row identity and derived values.
+HIDDEN_HISTORY_COLUMNS = {"parts_uuid", "module_uuid"} | set(UNTRACKED_COLUMNS)
+
+OPERATIONS = {"S": "Snapshot", "I": "Added", "U": "Changed", "D": "Deleted"}
+
+# Who made a change: the application's user, which connections announce in
+# this setting (see connection_options), falling back to the database role
+# for writes from other tools. Many installs share one role, so current_user
+# alone would credit everyone with everything.
+CHANGED_BY_SETTING = "kicad_db_gui.user"
+CHANGED_BY_SQL = f"coalesce(nullif(current_setting('{CHANGED_BY_SETTING}', true), ''), current_user)"
+
+# UNTRACKED_COLUMNS as an array literal, quoted for use inside the
+# function's EXECUTE strings.
+_UNTRACKED_SQL = "ARRAY[" + ", ".join(f"''{column}''" for column in UNTRACKED_COLUMNS) + "]::text[]"
+
+# The trigger function. TG_ARGV holds the table's key columns; old_rows /
+# new_rows are the statement's transition tables. Updates pair old and new
+# rows on the key: a row whose key itself changed is logged as D + I.
+AUDIT_FUNCTION = f"""CREATE OR REPLACE FUNCTION audit_log_capture() RETURNS trigger LANGUAGE plpgsql AS $audit$
+DECLARE
+    key_sql text := (SELECT string_agg(format('r.%I::text', k), ' || ''/'' || ') FROM unnest(TG_ARGV) AS k);
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        EXECUTE format('INSERT INTO audit_log (table_name, op, row_key, row_data)
+                SELECT %L, ''I'', %s, to_jsonb(r) FROM new_rows AS r', TG_TABLE_NAME, key_sql);
+    ELSIF TG_OP = 'DELETE' THEN
+        EXECUTE format('INSERT INTO audit_log (table_name, op, row_key, row_data)
+                SELECT %L, ''D'', %s, to_jsonb(r) FROM old_rows AS r', TG_TABLE_NAME, key_sql);
+    ELSE
+        EXECUTE format('INSERT INTO audit_log (table_name, op, row_key, row_data)
+                SELECT %L, CASE WHEN o.k IS NULL THEN ''I'' WHEN n.k IS NULL THEN ''D'' ELSE ''U'' END,
+                       coalesce(n.k, o.k), coalesce(n.j, o.j)
+                FROM (SELECT %s AS k, to_jsonb(r) AS j FROM old_rows AS r) AS o
+                FULL JOIN (SELECT %s AS k, to_jsonb(r) AS j FROM new_rows AS r) AS n ON n.k = o.k
+                WHERE o.k IS NULL OR n.k IS NULL OR o.j - {_UNTRACKED_SQL} <> n.j - {_UNTRACKED_SQL}',
+                TG_TABLE_NAME, key_sql, key_sql);
+    END IF;
+    RETURN NULL;
+END
+$audit$"""
+
+# Idempotent DDL, applied in order by DatabaseManager.ensure_audit().
+AUDIT_SCHEMA_STATEMENTS = [
+    f"""CREATE TABLE IF NOT EXISTS audit_log (
+            audit_id bigserial NOT NULL,
+            changed_at timestamptz NOT NULL DEFAULT now(),
+            changed_by text NOT NULL DEFAULT {CHANGED_BY_SQL},
+            table_name text NOT NULL,
+            op char(1) NOT NULL,
+            row_key text NOT NULL,
+            row_data jsonb NOT NULL) PARTITION BY RANGE (changed_at)""",
+    # Logs created before changed_by followed the application user.
+    f"ALTER TABLE audit_log ALTER COLUMN changed_by SET DEFAULT {CHANGED_BY_SQL}",
+    "CREATE TABLE IF NOT EXISTS audit_log_default PARTITION OF audit_log DEFAULT",
+    # Per-row lookups (history, "last version before t") and "what changed
+    # since t"; each partition gets its own copy.
+    "CREATE INDEX IF NOT EXISTS audit_log_key_idx ON audit_log (table_name, row_key, changed_at, audit_id)",
+    "CREATE INDEX IF NOT EXISTS audit_log_time_idx ON audit_log (table_name, changed_at)",
+    """CREATE INDEX IF NOT EXISTS audit_log_part_number_idx ON audit_log ((row_data ->> 'kicad_part_number'))
+            WHERE table_name = 'parts'""",
+    AUDIT_FUNCTION,
+]
+
+
+def connection_options(user: str) -> str:
+    """libpq "options" announcing the application user, so the audit log
+    credits this connection's writes to them."""
+    escaped = user.replace("\\", "\\\\").replace(" ", "\\ ")
+    return f"-c {CHANGED_BY_SETTING}={escaped}"
+
+
+def key_expression(table: str, alias: str) -> str:
+    """SQL for a row's audit key, matching what the trigger stores."""
+    return " || '/' || ".join(f"{alias}.{column}::text" for column in AUDIT_TABLES[table])
+
+
+def audit_trigger_statements(table: str) -> List[str]:
+    """CREATE TRIGGER statements auditing one table."""
+    keys = ", ".join(f"'{column}'" for column in AUDIT_TABLES[table])
+    return [
+        f"""CREATE TRIGGER audit_{table}_insert AFTER INSERT ON {table}
+                REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION audit_log_capture({keys})""",
+        f"""CREATE TRIGGER audit_{table}_update AFTER UPDATE ON {table}
+                REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION audit_log_capture({keys})""",
+        f"""CREATE TRIGGER audit_{table}_delete AFTER DELETE ON {table}
+                REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION audit_log_capture({keys})""",
+    ]
+
+
+def month_partitions(today: datetime.date, months_ahead: int) -> List[Tuple[str, datetime.date, datetime.date]]:
+    """(name, start, end) of the monthly audit_log partitions from this month
+    through months_ahead months from now."""
+    partitions = []
+    year, month = today.year, today.month
+    for _ in range(months_ahead + 1):
+        start = datetime.date(year, month, 1)
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        partitions.append((f"audit_log_{start:%Y%m}", start, datetime.date(year, month, 1)))
+    return partitions
+
+
+def history_changes(versions: List[Tuple[datetime.datetime, str, str, dict]]
+                    ) -> List[Tuple[datetime.datetime, str, str, Dict[str, Tuple[Optional[object], Optional[object]]]]]:
+    """Turn (changed_at, changed_by, op, row) versions, oldest first, into
+    (changed_at, changed_by, action, {column: (before, after)}). Versions
+    changing no visible column are dropped."""
+    changes = []
+    previous: dict = {}
+    for changed_at, changed_by, op, row in versions:
+        if op == "D":
+            before, after = row, {}
+        else:
+            before, after = ({} if op in ("I", "S") else previous), row
+        columns = [column for column in dict.fromkeys(list(before) + list(after))
+                   if column not in HIDDEN_HISTORY_COLUMNS and before.get(column) != after.get(column)]
+        if columns or op in ("I", "D"):
+            changes.append((changed_at, changed_by, OPERATIONS.get(op, op),
+                            {column: (before.get(column), after.get(column)) for column in columns}))
+        previous = after
+    return changes
+
+
+class AuditMixin:
+    """Audit log setup and history queries of DatabaseManager."""
+
+    def ensure_audit(self, months_ahead: int = 2) -> None:
+        """Create the audit log (see audit.py), unless this version of it is
+        already applied, and its partitions for the coming months, and add the
+        triggers to any table not audited yet. A newly audited table gets a
+        snapshot of its current rows in the same transaction, under a lock
+        that holds off writers, so its history starts complete. Once set up,
+        this only reads the catalogs."""
+        fingerprint = self._fingerprint(AUDIT_SCHEMA_STATEMENTS)
+        try:
+            if not self._schema_applied("audit", fingerprint):
+                for statement in AUDIT_SCHEMA_STATEMENTS:
+                    self.cursor.execute(statement)
+                self._record_schema("audit", fingerprint)
+            self._create_audit_partitions(months_ahead)
+            for table in AUDIT_TABLES:
+                self.cursor.execute("SELECT 1 FROM pg_trigger WHERE tgrelid = %s::regclass AND tgname = %s",
+                                    (table, f"audit_{table}_update"))
+                if self.cursor.fetchone() is not None:
+                    continue
+                self.cursor.execute(f"LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE")
+                for statement in audit_trigger_statements(table):
+                    self.cursor.execute(statement)
+                self.cursor.execute(f"""INSERT INTO audit_log (table_name, op, row_key, row_data)
+                        SELECT %s, 'S', {key_expression(table, 'r')}, to_jsonb(r) FROM {table} AS r""", (table,))
+                logger.info("Auditing %s from now on (%d rows in the starting snapshot)", table, self.cursor.rowcount)
+            self.db_connection.commit()
+        except Exception:
+            self.db_connection.rollback()
+            raise
+
+    def _create_audit_partitions(self, months_ahead: int) -> None:
+        """Create missing monthly audit_log partitions, moving any rows the
+        default partition already holds for that month into the new one (a
+        partition can't be attached while the default has rows for it). Runs
+        in the caller's transaction."""
+        for name, start, end in month_partitions(datetime.date.today(), months_ahead):
+            self.cursor.execute("SELECT to_regclass(%s)", (name,))
+            if self.cursor.fetchone()[0] is not None:
+                continue
+            self.cursor.execute(f"CREATE TABLE {name} (LIKE audit_log INCLUDING DEFAULTS)")
+            self.cursor.execute(f"""WITH moved AS (
+                        DELETE FROM audit_log_default WHERE changed_at >= %s AND changed_at < %s RETURNING *)
+                    INSERT INTO {name} SELECT * FROM moved""", (start, end))
+            self.cursor.execute(f"ALTER TABLE audit_log ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)",
+                                (start, end))
+
+    def _as_of_query(self, table: str, as_of: object) -> Tuple[str, List[object]]:
+        """SELECT returning table's rows, with its own columns, as they were at
+        as_of. Rows unchanged since come straight from the table; for the
+        rest the last audited version up to as_of is used (none, or a
+        delete, means the row didn't exist then)."""
+        if table not in AUDIT_TABLES:
+            raise ValueError(f"Table is not audited: {table}")
+        changed_since = "SELECT row_key FROM audit_log WHERE table_name = %s AND changed_at > %s"
+        sql = f"""SELECT t.* FROM {table} AS t
+                WHERE NOT EXISTS (SELECT 1 FROM audit_log AS c WHERE c.table_name = %s AND c.changed_at > %s
+                                  AND c.row_key = {key_expression(table, 't')})
+                UNION ALL
+                SELECT r.* FROM (
+                    SELECT DISTINCT ON (a.row_key) a.op, a.row_data FROM audit_log AS a
+                    WHERE a.table_name = %s AND a.changed_at <= %s AND a.row_key IN ({changed_since})
+                    ORDER BY a.row_key, a.changed_at DESC, a.audit_id DESC) AS v
+                CROSS JOIN LATERAL jsonb_populate_record(NULL::{table}, v.row_data) AS r
+                WHERE v.op <> 'D'"""
+        return sql, [table, as_of, table, as_of, table, as_of]
+
+    def audit_started_at(self, table: str = "parts") -> Optional[datetime.datetime]:
+        """When history for table begins (its snapshot), or None if never."""
+        self.cursor.execute("SELECT min(changed_at) FROM audit_log WHERE table_name = %s", (table,))
+        return self.cursor.fetchone()[0]
+
+    def get_part_history(self, kicad_part_number: str) -> List[Tuple[datetime.datetime, str, str, dict]]:
+        """Every recorded version of a part, oldest first, as (changed_at,
+        changed_by, op, row). Found by part number through any version, then
+        followed by parts_uuid, so renames and deleted parts are covered."""
+        self.cursor.execute("""SELECT changed_at, changed_by, op, row_data FROM audit_log
+                WHERE table_name = 'parts' AND row_key IN (
+                    SELECT row_key FROM audit_log
+                    WHERE table_name = 'parts' AND row_data ->> 'kicad_part_number' = %s)
+                ORDER BY changed_at, audit_id""", (kicad_part_number,))
+        return self.cursor.fetchall()
@@ -0,0 +1,187 @@
+"""
+Resolves KiCad-exported BOMs against the parts database.
+
+A BOM is read from either a CSV export (the Symbol Fields Table / BOM
+exporter) or the XML netlist, reduced to (part number, quantity, references)
+lines, and resolved with one DatabaseManager.resolve_bom_part_numbers() call
+however long it is. Lines that name a module are expanded into the module's
+parts, and the quantities are then summed per physical part.
+"""
+import csv
+import logging
+import time
+import xml.etree.ElementTree as ET
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# CSV headers that may hold the database key, in order of preference. With a
+# database library the symbol's lib_id is "<library>:<kicad_part_number>",
+# so "Library:Key" style values are accepted too.
+PART_NUMBER_HEADERS = ("kicad_part_number", "kicad part number", "part number", "libpart", "lib part",
+                       "library part", "symbol", "lib_id")
+QUANTITY_HEADERS = ("qty", "quantity", "quantity per pcb")
+REFERENCE_HEADERS = ("reference", "references", "designator", "refs")
+DNP_HEADERS = ("dnp", "do not populate", "exclude_from_bom")
+DNP_VALUES = {"1", "y", "yes", "true", "dnp", "x"}
+
+
+@dataclass
+class BomLine:
+    """One line of a KiCad BOM, before resolution."""
+    kicad_part_number: str
+    quantity: int
+    references: List[str] = field(default_factory=list)
+
+
+@dataclass
+class ResolvedPart:
+    """Total requirement for one physical part across the whole BOM."""
+    kicad_part_number: str
+    description: str = ""
+    manufacturer: str = ""
+    manufacturer_part_number: str = ""
+    value: str = ""
+    quantity: int = 0
+    references: List[str] = field(default_factory=list)
+    # Modules this part was pulled in through (empty if placed directly).
+    via_modules: List[str] = field(default_factory=list)
+
+
+@dataclass
+class BomReport:
+    """Outcome of resolve_bom()."""
+    parts: List[ResolvedPart] = field(default_factory=list)
+    unresolved: List[BomLine] = field(default_factory=list)
+    lines_read: int = 0
+    elapsed_ms: float = 0.0
+
+
+def _key(value: str) -> str:
+    """Strip the "Library:" prefix of a lib_id, leaving the part number."""
+    value = (value or "").strip()
+    return value.rsplit(":", 1)[-1] if ":" in value else value
+
+
+def _split_references(text: str) -> List[str]:
+    return [ref for ref in text.replace(",", " ").split() if ref]
+
+
+def _find_header(fieldnames: List[str], candidates: Tuple[str, ...]) -> Optional[str]:
+    by_lower = {name.strip().lower(): name for name in fieldnames}
+    for candidate in candidates:
+        if candidate in by_lower:
+            return by_lower[candidate]
+    return None
+
+
+def read_csv_bom(path: str, part_number_column: Optional[str] = None) -> List[BomLine]:
+    """Read a KiCad CSV BOM. Quantity comes from a Qty column if there is one,
+    otherwise from the number of references on the line."""
+    with open(path, newline="", encoding="utf-8-sig") as f_in:
+        sample = f_in.read(4096)
+        f_in.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.DictReader(f_in, dialect=dialect)
+        fieldnames = reader.fieldnames or []
+        pn_column = part_number_column or _find_header(fieldnames, PART_NUMBER_HEADERS)
+        if pn_column is None:
+            raise ValueError(f"No part number column found in {path}; expected one of {', '.join(PART_NUMBER_HEADERS)}")
+        qty_column = _find_header(fieldnames, QUANTITY_HEADERS)
+        ref_column = _find_header(fieldnames, REFERENCE_HEADERS)
+        dnp_column = _find_header(fieldnames, DNP_HEADERS)
+
+        lines = []
+        for row in reader:
+            kicad_part_number = _key(row.get(pn_column) or "")
+            if not kicad_part_number:
+                continue
+            if dnp_column and (row.get(dnp_column) or "").strip().lower() in DNP_VALUES:
+                continue
+            references = _split_references(row.get(ref_column) or "") if ref_column else []
+            quantity_text = (row.get(qty_column) or "").strip() if qty_column else ""
+            quantity = int(float(quantity_text)) if quantity_text else max(len(references), 1)
+            lines.append(BomLine(kicad_part_number, quantity, references))
+    return lines
+
+
+def read_xml_bom(path: str) -> List[BomLine]:
+    """Read a KiCad XML netlist/BOM: one <comp> per placed symbol, keyed by
+    its <libsource part=...>. Symbols marked DNP or excluded from the BOM
+    are skipped."""
+    lines: Dict[str, BomLine] = {}
+    for comp in ET.parse(path).getroot().iter("comp"):
+        libsource = comp.find("libsource")
+        if libsource is None or not libsource.get("part"):
+            continue
+        excluded = {prop.get("name", "").lower() for prop in comp.iter("property")}
+        if excluded & {"dnp", "exclude_from_bom"}:
+            continue
+        kicad_part_number = libsource.get("part").strip()
+        line = lines.setdefault(kicad_part_number, BomLine(kicad_part_number, 0))
+        line.quantity += 1
+        line.references.append(comp.get("ref", ""))
+    return list(lines.values())
+
+
+def read_bom(path: str, part_number_column: Optional[str] = None) -> List[BomLine]:
+    """Read a BOM file, choosing the parser from the extension."""
+    if path.lower().endswith((".xml", ".net")):
+        return read_xml_bom(path)
+    return read_csv_bom(path, part_number_column)
+
+
+def resolve_bom(db_manager, lines: Iterable[BomLine], quantity_multiplier: int = 1) -> BomReport:
+    """Resolve BOM lines to parts in one database round trip and total the
+    quantities per part, expanding modules (and multiplying by
+    quantity_multiplier, e.g. a build quantity)."""
+    started = time.perf_counter()
+    lines = list(lines)
+    report = BomReport(lines_read=len(lines))
+    rows = db_manager.resolve_bom_part_numbers(sorted({line.kicad_part_number for line in lines}))
+
+    # bom part number -> [(resolved part row, per-unit count, module or "")]
+    resolutions: Dict[str, List[Tuple[tuple, int, str]]] = defaultdict(list)
+    for bom_part_number, module, per_unit, *part in rows:
+        resolutions[bom_part_number].append((tuple(part), per_unit, module or ""))
+
+    totals: Dict[str, ResolvedPart] = {}
+    for line in lines:
+        matches = resolutions.get(line.kicad_part_number)
+        if not matches:
+            report.unresolved.append(line)
+            continue
+        for (kicad_part_number, description, manufacturer, mpn, value), per_unit, module in matches:
+            resolved = totals.get(kicad_part_number)
+            if resolved is None:
+                resolved = totals[kicad_part_number] = ResolvedPart(kicad_part_number, description or "",
+                                                                    manufacturer or "", mpn or "", value or "")
+            resolved.quantity += line.quantity * per_unit * quantity_multiplier
+            resolved.references.extend(line.references)
+            if module and module not in resolved.via_modules:
+                resolved.via_modules.append(module)
+
+    report.parts = sorted(totals.values(), key=lambda part: part.kicad_part_number)
+    report.elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.info("Resolved %d BOM lines to %d parts (%d unresolved) in %.1f ms",
+                len(lines), len(report.parts), len(report.unresolved), report.elapsed_ms)
+    return report
+
+
+def write_bom_csv(report: BomReport, path: str) -> None:
+    """Export a resolved BOM, unresolved lines last."""
+    with open(path, "w", newline="", encoding="utf-8") as f_out:
+        writer = csv.writer(f_out)
+        writer.writerow(["KiCad Part Number", "Quantity", "Description", "Manufacturer", "MPN", "Value",
+                         "References", "Via Modules"])
+        for part in report.parts:
+            writer.writerow([part.kicad_part_number, part.quantity, part.description, part.manufacturer,
+                             part.manufacturer_part_number, part.value, " ".join(part.references),
+                             " ".join(part.via_modules)])
+        for line in report.unresolved:
+            writer.writerow([line.kicad_part_number, line.quantity, "UNRESOLVED", "", "", "", " ".join(line.references), ""])
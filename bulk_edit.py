@@ -0,0 +1,231 @@
+"""
+Edits that touch many parts at once: setting columns in bulk, previewed
+find/replace over one column, and finding and merging duplicate parts.
+Each is a single set-based statement in one transaction, journalled for
+undo like any other write.
+
+BulkEditMixin is part of database.DatabaseManager and works through its
+cursor, _build_part_filters and _commit.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from psycopg2.extras import execute_values
+
+from journal import update_ops
+from part_values import MPN_KEY_SQL, ValueRange, normalize_mpn, normalize_value
+
+
+@dataclass
+class DuplicateGroup:
+    """A set of parts that look like the same physical component."""
+    reason: str = ""
+    key: str = ""
+    kicad_part_numbers: List[str] = field(default_factory=list)
+
+
+def value_duplicate_groups(rows: Iterable[Tuple[str, str, str, str, str]]) -> List[DuplicateGroup]:
+    """The value pass of DatabaseManager.find_duplicate_groups, over
+    (kicad_part_number, component_type, footprint_ref, value,
+    manufacturer_part_number) rows.
+
+    Parts are hash-blocked on (component_type, footprint_ref, normalised
+    value). The value key comes from the leading quantity only, so "10k 1%"
+    blocks with "10k" but not with "10k1". Parts with different MPNs in a
+    block are alternates, not duplicates: a block with more than one MPN is
+    only offered for its parts without one."""
+    blocks: Dict[Tuple[str, str, str], List[Tuple[str, str]]] = {}
+    for kicad_part_number, component_type, footprint_ref, value, mpn in rows:
+        block_key = (component_type or "", footprint_ref or "", normalize_value(value, component_type))
+        blocks.setdefault(block_key, []).append((kicad_part_number, normalize_mpn(mpn)))
+
+    groups: List[DuplicateGroup] = []
+    for (component_type, footprint_ref, value_key), members in blocks.items():
+        if len({mpn_key for _pn, mpn_key in members if mpn_key}) > 1:
+            members = [(pn, mpn_key) for pn, mpn_key in members if not mpn_key]
+        part_numbers = [pn for pn, _mpn_key in members]
+        if len(part_numbers) > 1:
+            groups.append(DuplicateGroup(
+                "Same value/footprint",
+                f"{component_type} {value_key} {footprint_ref}".strip(),
+                sorted(part_numbers),
+            ))
+    return groups
+
+
+class BulkEditMixin:
+    """Bulk edit, find/replace and duplicate queries of DatabaseManager."""
+
+    # Whitelist of columns bulk edit may set. kicad_part_number is the row key
+    # and is deliberately left out - renaming many keys at once is never wanted.
+    BULK_EDITABLE_COLUMNS = {
+        "description", "datasheet", "footprint_ref", "symbol_ref", "model_ref",
+        "manufacturer_part_number", "manufacturer", "manufacturer_part_url",
+        "note", "value", "component_type",
+        "exclude_from_bom", "exclude_from_board", "exclude_from_sim",
+    }
+
+    # Text columns find/replace may rewrite (booleans make no sense here).
+    FIND_REPLACE_COLUMNS = BULK_EDITABLE_COLUMNS - {"exclude_from_bom", "exclude_from_board", "exclude_from_sim"}
+
+    def bulk_update_parts(self, kicad_part_numbers: List[str], changes: Dict[str, object]) -> int:
+        """Set the same column values on many parts in a single UPDATE and a
+        single transaction. Returns the number of rows changed."""
+        unknown = set(changes) - self.BULK_EDITABLE_COLUMNS
+        if unknown:
+            raise ValueError(f"Columns not editable in bulk: {', '.join(sorted(unknown))}")
+        if not changes or not kicad_part_numbers:
+            return 0
+
+        assignments = ", ".join(f"{column} = %s" for column in changes)
+        sql = f"""UPDATE parts AS p SET {assignments}
+                FROM parts AS old
+                WHERE old.parts_uuid = p.parts_uuid AND p.kicad_part_number = ANY(%s)
+                RETURNING old.component_type, p.component_type, p.kicad_part_number, to_jsonb(old), to_jsonb(p)"""
+        try:
+            self.cursor.execute(sql, list(changes.values()) + [list(kicad_part_numbers)])
+            rows = self.cursor.fetchall()
+            updated = len(rows)
+            self._commit("parts", component_types=[ct for row in rows for ct in row[:2]],
+                         journal=(f"Bulk edit of {updated} parts", update_ops([row[2:] for row in rows], list(changes))))
+        except Exception:
+            self.db_connection.rollback()
+            raise
+        return updated
+
+    def preview_find_replace(self, column: str, find: str, replace: str, use_regex: bool = False,
+                             kicad_part_numbers: Optional[List[str]] = None,
+                             component_type_filter: Optional[str] = None,
+                             search_term: Optional[str] = None,
+                             value_range: Optional[ValueRange] = None,
+                             facet_filters: Optional[Dict[str, List[object]]] = None) -> List[Tuple[str, str, str]]:
+        """Work out what a find/replace over one column would change.
+
+        The scope is either an explicit list of part numbers (the Treeview
+        selection) or everything matching the current filter/search. Returns
+        (kicad_part_number, old_value, new_value) for rows that would change;
+        len() of the result is the affected row count shown before applying.
+        """
+        if column not in self.FIND_REPLACE_COLUMNS:
+            raise ValueError(f"Column not available for find/replace: {column}")
+        if not find:
+            return []
+        pattern = re.compile(find if use_regex else re.escape(find))
+
+        conditions, params = self._build_part_filters(component_type_filter, search_term, value_range, facet_filters)
+        if kicad_part_numbers is not None:
+            conditions.append("kicad_part_number = ANY(%s)")
+            params.append(list(kicad_part_numbers))
+        sql = f"SELECT kicad_part_number, {column} FROM parts"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        self.cursor.execute(sql, params)
+
+        changes = []
+        for kicad_part_number, old_value in self.cursor.fetchall():
+            old_value = old_value or ""
+            new_value = pattern.sub(replace, old_value)
+            if new_value != old_value:
+                changes.append((kicad_part_number, old_value, new_value))
+        return changes
+
+    def update_parts_column(self, column: str, changes: List[Tuple[str, str, str]]) -> Tuple[int, List[str]]:
+        """Apply a previewed find/replace with a single set-based
+        UPDATE ... FROM (VALUES ...) in one transaction.
+
+        changes is preview_find_replace's (kicad_part_number, old_value,
+        new_value) list. A row is only rewritten if the column still holds
+        old_value, so anything edited since the preview is left alone rather
+        than overwritten. Returns (rows updated, part numbers skipped).
+        """
+        if column not in self.FIND_REPLACE_COLUMNS:
+            raise ValueError(f"Column not available for find/replace: {column}")
+        if not changes:
+            return 0, []
+
+        sql = f"""UPDATE parts AS p SET {column} = v.new_value
+                FROM (VALUES %s) AS v(kicad_part_number, old_value, new_value), parts AS old
+                WHERE p.kicad_part_number = v.kicad_part_number AND old.parts_uuid = p.parts_uuid
+                  AND coalesce(old.{column}, '') = v.old_value
+                RETURNING old.component_type, p.component_type, p.kicad_part_number, to_jsonb(old), to_jsonb(p)"""
+        try:
+            rows = execute_values(self.cursor, sql, changes, page_size=len(changes), fetch=True)
+            updated = len(rows)
+            written = {row[2] for row in rows}
+            self._commit("parts", component_types=[ct for row in rows for ct in row[:2]],
+                         journal=(f"Replace in {column} on {updated} parts",
+                                  update_ops([row[2:] for row in rows], [column])))
+        except Exception:
+            self.db_connection.rollback()
+            raise
+        return updated, [kicad_part_number for kicad_part_number, _old, _new in changes
+                         if kicad_part_number not in written]
+
+    def find_duplicate_groups(self) -> List[DuplicateGroup]:
+        """Find merge candidates in two passes, neither of which compares
+        parts pairwise:
+
+        * MPN duplicates are grouped server-side on a normalised MPN key, so
+          only the groups themselves come back over the wire.
+        * Value near-duplicates ("10k" vs "10 kΩ") are hash-blocked client-side
+          (see value_duplicate_groups) in a single pass over one narrow
+          query. Same-MPN parts are already grouped by the first pass.
+        """
+        groups: List[DuplicateGroup] = []
+
+        self.cursor.execute(f"""SELECT {MPN_KEY_SQL} AS mpn_key,
+                array_agg(kicad_part_number ORDER BY kicad_part_number)
+                FROM parts
+                WHERE coalesce(manufacturer_part_number, '') <> ''
+                GROUP BY mpn_key HAVING count(*) > 1""")
+        for mpn_key, part_numbers in self.cursor.fetchall():
+            groups.append(DuplicateGroup("Same MPN", mpn_key, list(part_numbers)))
+
+        self.cursor.execute("""SELECT kicad_part_number, component_type, footprint_ref, value, manufacturer_part_number
+                FROM parts WHERE coalesce(value, '') <> ''""")
+        groups.extend(value_duplicate_groups(self.cursor.fetchall()))
+        return groups
+
+    def merge_parts(self, keep_kicad_part_number: str, merge_kicad_part_numbers: List[str]) -> int:
+        """Fold duplicates into one surviving part: module references are
+        repointed at the survivor, then the duplicates are deleted, all in one
+        transaction. Returns the number of parts removed.
+
+        Raises ValueError, changing nothing, if the parts carry different
+        (non-empty) MPNs: those are alternates, not duplicates."""
+        merge_kicad_part_numbers = [pn for pn in merge_kicad_part_numbers if pn != keep_kicad_part_number]
+        if not merge_kicad_part_numbers:
+            return 0
+
+        try:
+            self.cursor.execute(f"""SELECT DISTINCT {MPN_KEY_SQL} FROM parts
+                    WHERE kicad_part_number = ANY(%s) AND coalesce(manufacturer_part_number, '') <> ''""",
+                                ([keep_kicad_part_number] + merge_kicad_part_numbers,))
+            mpn_keys = [row[0] for row in self.cursor.fetchall() if row[0]]
+            if len(mpn_keys) > 1:
+                raise ValueError(f"Parts with different MPNs are alternates, not duplicates: {', '.join(sorted(mpn_keys))}")
+            # Which modules used each duplicate, so an undo can point them back.
+            self.cursor.execute("""SELECT p.kicad_part_number, array_agg(mp.module_uuid::text)
+                    FROM module_parts AS mp JOIN parts AS p ON p.parts_uuid = mp.part_uuid
+                    WHERE p.kicad_part_number = ANY(%s) GROUP BY p.kicad_part_number""",
+                                (merge_kicad_part_numbers,))
+            links = dict(self.cursor.fetchall())
+            self.cursor.execute("""UPDATE module_parts SET part_uuid =
+                        (SELECT parts_uuid FROM parts WHERE kicad_part_number = %s)
+                    WHERE part_uuid IN
+                        (SELECT parts_uuid FROM parts WHERE kicad_part_number = ANY(%s))""",
+                                (keep_kicad_part_number, merge_kicad_part_numbers))
+            self.cursor.execute("""DELETE FROM parts WHERE kicad_part_number = ANY(%s)
+                    RETURNING component_type, kicad_part_number, to_jsonb(parts)""", (merge_kicad_part_numbers,))
+            rows = self.cursor.fetchall()
+            touched = [row[0] for row in rows]
+            removed = len(touched)
+            ops = [{"op": "d", "t": "parts", "r": row, "links": links.get(kicad_part_number, []),
+                    "to": keep_kicad_part_number} for _ct, kicad_part_number, row in rows]
+            self._commit("parts", "module_parts", component_types=touched,
+                         journal=(f"Merge {removed} parts into {keep_kicad_part_number}", ops))
+        except Exception:
+            self.db_connection.rollback()
+            raise
+        return removed
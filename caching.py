@@ -0,0 +1,229 @@
+"""
+Small caches for data the GUI reads often but that changes rarely, plus the
+LISTEN/NOTIFY listener that tells them when to let go.
+"""
+import json
+import logging
+import select
+import threading
+import time
+from typing import Callable, Dict, Generic, Hashable, List, NamedTuple, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+# NOTIFY channel DatabaseManager announces committed writes on. The payload is
+# a ChangeEvent serialised with to_payload().
+CHANGE_CHANNEL = "kicad_db_changes"
+
+V = TypeVar("V")
+
+
+class ChangeEvent(NamedTuple):
+    """A committed write: which table, and (for parts) which component types
+    it touched. An empty component_types means "not known - assume any"."""
+    table: str
+    component_types: Tuple[str, ...] = ()
+
+    def to_payload(self) -> str:
+        """The event as the JSON NOTIFY payload (see from_payload)."""
+        return json.dumps({"table": self.table, "component_types": list(self.component_types)})
+
+    @classmethod
+    def from_payload(cls, payload: str) -> "ChangeEvent":
+        """Parse a NOTIFY payload; a bare table name is accepted too."""
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            return cls(payload)
+        if not isinstance(data, dict):
+            return cls(str(data))
+        return cls(data.get("table", ""), tuple(data.get("component_types") or ()))
+
+
+class TTLCache(Generic[V]):
+    """Thread-safe key/value cache whose entries expire after ttl seconds."""
+
+    def __init__(self, ttl: float = 300.0):
+        self.ttl = ttl
+        self._entries: Dict[Hashable, Tuple[float, V]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[V]:
+        """Return the cached value, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            return value
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], V]) -> V:
+        """Return the cached value, calling loader() and caching its result
+        on a miss. The loader runs outside the lock."""
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def set(self, key: Hashable, value: V) -> None:
+        """Cache value under key, fresh from now."""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """Drop one entry, or everything when key is None."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+class LookupCache:
+    """Holds the lookup lists (component types, manufacturers, library
+    prefixes) behind comboboxes and menus.
+
+    Reads never block: get() returns whatever was last loaded, and kicks off
+    a refresh on a background thread once the lists are older than ttl or
+    have been invalidated. The loader must be safe to call from that thread
+    (i.e. use its own database connection). With background=False the
+    loader runs inline instead, for callers that only have the GUI's
+    connection.
+    """
+
+    def __init__(self, loader: Callable[[], Dict[str, List[str]]], ttl: float = 300.0,
+                 background: bool = True):
+        self.loader = loader
+        self.ttl = ttl
+        self.background = background
+        # Bumped after every successful load, so the GUI can cheaply tell
+        # whether menus built from the lists need rebuilding.
+        self.version = 0
+        self._lists: Dict[str, List[str]] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._refresh_thread: Optional[threading.Thread] = None
+        self._stopped = False
+
+    def get(self, name: str, default: Optional[List[str]] = None) -> List[str]:
+        """Return a cached list immediately, scheduling a refresh if stale."""
+        if self._is_stale():
+            self.refresh()
+        with self._lock:
+            return list(self._lists.get(name, default or []))
+
+    def invalidate(self) -> None:
+        """Mark the lists stale and reload them."""
+        with self._lock:
+            self._loaded_at = None
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Reload the lists, on the background thread unless one is already running."""
+        if not self.background:
+            self._load()
+            return
+        with self._lock:
+            if self._stopped:
+                return
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return
+            self._refresh_thread = threading.Thread(target=self._load, name="lookup-cache-refresh", daemon=True)
+            self._refresh_thread.start()
+
+    def stop(self, interrupt: Optional[Callable[[], None]] = None, timeout: float = 5.0) -> bool:
+        """Stop scheduling refreshes and wait for a running one to finish,
+        calling interrupt() first if there is one (e.g. to cancel its query).
+        Returns False if it is still running after timeout, in which case its
+        connection must be left alone. resume() allows refreshes again."""
+        with self._lock:
+            self._stopped = True
+            thread = self._refresh_thread
+        if thread is None or not thread.is_alive():
+            return True
+        if interrupt is not None:
+            interrupt()
+        thread.join(timeout)
+        return not thread.is_alive()
+
+    def resume(self) -> None:
+        """Allow refreshes again after stop()."""
+        with self._lock:
+            self._stopped = False
+
+    def _is_stale(self) -> bool:
+        with self._lock:
+            return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl
+
+    def _load(self) -> None:
+        try:
+            lists = self.loader()
+        except Exception:  # pylint: disable=broad-except
+            if not self._stopped:
+                logger.warning("Failed to refresh lookup lists", exc_info=True)
+            return
+        with self._lock:
+            self._lists = lists
+            self._loaded_at = time.monotonic()
+            self.version += 1
+        logger.debug("Lookup lists refreshed: %s", {name: len(values) for name, values in lists.items()})
+
+
+class ChangeListener:
+    """Background thread that LISTENs for DatabaseManager change notifications
+    (including ones from other users' sessions) and calls on_change(event)
+    with a ChangeEvent for each. Reconnects with a back-off if the connection
+    drops.
+
+    on_change runs on the listener thread, so it must not touch Tk directly.
+    """
+
+    def __init__(self, connect: Callable[[], object], on_change: Callable[[ChangeEvent], None],
+                 channel: str = CHANGE_CHANNEL, poll_interval: float = 5.0):
+        self.connect = connect
+        self.on_change = on_change
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="db-change-listener", daemon=True)
+
+    def start(self) -> None:
+        """Start listening on a background thread."""
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Ask the listener to exit; it checks every poll_interval. Doesn't wait."""
+        self._stop.set()
+
+    def _run(self) -> None:
+        backoff = 1.0
+        while not self._stop.is_set():
+            connection = None
+            try:
+                connection = self.connect()
+                connection.autocommit = True
+                with connection.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.channel}")
+                backoff = 1.0
+                while not self._stop.is_set():
+                    readable, _, _ = select.select([connection], [], [], self.poll_interval)
+                    if not readable:
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notify = connection.notifies.pop(0)
+                        self.on_change(ChangeEvent.from_payload(notify.payload))
+            except Exception:  # pylint: disable=broad-except
+                logger.warning("Change listener lost its connection; retrying in %.0fs", backoff, exc_info=True)
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 60.0)
+            finally:
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:  # pylint: disable=broad-except
+                        pass
@@ -0,0 +1,702 @@
+"""
+Data layer of the KiCad database library manager: the part records and
+DatabaseManager, which owns every query. Kept free of Tk so scripts and the
+headless CLI (main.py) can use it without a display.
+
+DatabaseManager keeps the parts queries itself and takes the rest from
+mixins next to the code they serve: audit/history (audit.py), bulk edits and
+duplicates (bulk_edit.py), undo/redo (journal.py), the KiCad library views
+(library_views.py), modules (module_tree.py) and supplier pricing
+(pricing.py).
+"""
+import hashlib
+import logging
+import sys
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from dataclasses import dataclass, fields
+from psycopg2.extras import execute_values
+from caching import CHANGE_CHANNEL, ChangeEvent
+from prepared import PreparedStatements
+from diagnostics import QueryDiagnostics
+from audit import AuditMixin
+from bulk_edit import BulkEditMixin
+from journal import EditJournal, JournalOpsMixin, update_ops
+from library_views import LibraryViewsMixin
+from module_tree import ModuleTreeMixin
+from part_values import MPN_KEY_SQL, NATURAL_SORT_KEY_FUNCTION, PARSE_VALUE_FUNCTIONS, ValueRange
+from pricing import PricingMixin
+
+logger = logging.getLogger(__name__)
+
+@dataclass(slots=True)
+class Part:
+    """Data class representing a part in the database."""
+    description: str = ""
+    datasheet: str = ""
+    footprint_ref: str = ""
+    symbol_ref: str = ""
+    model_ref: str = ""
+    kicad_part_number: str = ""
+    manufacturer_part_number: str = ""
+    manufacturer: str = ""
+    manufacturer_part_url: str = ""
+    note: str = ""
+    value: str = ""
+    component_type: str = ""
+    exclude_from_bom: bool = False
+    exclude_from_board: bool = False
+    exclude_from_sim: bool = False
+
+
+# Part fields whose values repeat across many parts: a few dozen component
+# types and manufacturers, and refs into a handful of libraries.
+PART_INTERNED_FIELDS = ("component_type", "manufacturer", "symbol_ref", "footprint_ref", "model_ref")
+
+
+def interned_part(**values: object) -> Part:
+    """A Part whose PART_INTERNED_FIELDS are interned, so records built in
+    bulk (an import holds every row until its INSERT) share one string per
+    distinct value instead of one per row."""
+    for name in PART_INTERNED_FIELDS:
+        if isinstance(values.get(name), str):
+            values[name] = sys.intern(values[name])
+    return Part(**values)
+
+
+class PartConflictError(Exception):
+    """Raised by DatabaseManager.update_part when the part changed (or was
+    deleted) since the version the edit started from. current/version are
+    the row as it is now (None if deleted), for the conflict dialog."""
+
+    def __init__(self, kicad_part_number: str, current: Optional[Part], version: Optional[str]):
+        super().__init__(f"{kicad_part_number} was changed by someone else")
+        self.kicad_part_number = kicad_part_number
+        self.current = current
+        self.version = version
+
+
+class DatabaseManager(AuditMixin, BulkEditMixin, JournalOpsMixin, LibraryViewsMixin, ModuleTreeMixin, PricingMixin):
+    """Handles all database operations."""
+
+    # Idempotent DDL for the columns/indexes this tool adds on top of the
+    # kicad_db_lib schema. Applied in order by ensure_schema().
+    SCHEMA_STATEMENTS = [
+        # Parsed engineering values (see part_values.parse_value), so value
+        # range searches are index range scans.
+        "ALTER TABLE parts ADD COLUMN IF NOT EXISTS value_magnitude double precision",
+        "ALTER TABLE parts ADD COLUMN IF NOT EXISTS value_unit text",
+        "CREATE INDEX IF NOT EXISTS parts_value_range_idx ON parts (component_type, value_unit, value_magnitude)",
+        "CREATE INDEX IF NOT EXISTS parts_value_unit_range_idx ON parts (value_unit, value_magnitude)",
+        # Natural-order sort keys (see part_values.natural_sort_key), compared
+        # bytewise, so sorting the list by part number or value is an index
+        # scan in the right order: "R2" before "R10", "4k7" before "10k".
+        'ALTER TABLE parts ADD COLUMN IF NOT EXISTS part_number_sort_key text COLLATE "C"',
+        'ALTER TABLE parts ADD COLUMN IF NOT EXISTS value_sort_key text COLLATE "C"',
+        "CREATE INDEX IF NOT EXISTS parts_part_number_sort_idx ON parts (part_number_sort_key, kicad_part_number)",
+        "CREATE INDEX IF NOT EXISTS parts_value_sort_idx ON parts (value_unit, value_magnitude, value_sort_key)",
+        # The database derives all four columns itself, on every insert and on
+        # any update of what they derive from, so rows written by other tools
+        # (ODBC, psql, KiCad) search and sort in place too. Writes from here
+        # leave them to it. Anything written before is put right by
+        # backfill_value_index().
+        NATURAL_SORT_KEY_FUNCTION,
+        *PARSE_VALUE_FUNCTIONS,
+        """CREATE OR REPLACE FUNCTION parts_set_derived_columns() RETURNS trigger LANGUAGE plpgsql AS $derived$
+            DECLARE
+                parsed record := kicad_parse_value(NEW.value, NEW.component_type);
+            BEGIN
+                NEW.value_magnitude := parsed.magnitude;
+                NEW.value_unit := coalesce(parsed.unit, '');
+                NEW.value_sort_key := kicad_natural_sort_key(NEW.value);
+                NEW.part_number_sort_key := kicad_natural_sort_key(NEW.kicad_part_number);
+                RETURN NEW;
+            END
+            $derived$""",
+        "DROP TRIGGER IF EXISTS parts_sort_keys ON parts",
+        "DROP FUNCTION IF EXISTS parts_set_sort_keys()",
+        "DROP TRIGGER IF EXISTS parts_derived_columns ON parts",
+        """CREATE TRIGGER parts_derived_columns
+                BEFORE INSERT OR UPDATE OF kicad_part_number, value, component_type,
+                    value_magnitude, value_unit, value_sort_key, part_number_sort_key ON parts
+                FOR EACH ROW EXECUTE FUNCTION parts_set_derived_columns()""",
+        # Nested modules: a module can contain other modules, quantity times.
+        # The part_uuid/child indexes make where-used lookups index scans.
+        """CREATE TABLE IF NOT EXISTS module_submodules (
+                parent_module_uuid uuid NOT NULL REFERENCES module (module_uuid) ON DELETE CASCADE,
+                child_module_uuid uuid NOT NULL REFERENCES module (module_uuid) ON DELETE CASCADE,
+                quantity integer NOT NULL DEFAULT 1 CHECK (quantity > 0),
+                PRIMARY KEY (parent_module_uuid, child_module_uuid))""",
+        "CREATE INDEX IF NOT EXISTS module_submodules_child_idx ON module_submodules (child_module_uuid)",
+        "CREATE INDEX IF NOT EXISTS module_parts_part_uuid_idx ON module_parts (part_uuid)",
+        "CREATE INDEX IF NOT EXISTS module_parts_module_uuid_idx ON module_parts (module_uuid)",
+        # The KiCad library views (see kicad_dbl.py) and the category each
+        # shows, so any session writing parts knows which materialized views
+        # its commit has made stale.
+        """CREATE TABLE IF NOT EXISTS kicad_library_views (
+                view_name text PRIMARY KEY,
+                component_type text NOT NULL,
+                materialized boolean NOT NULL)""",
+        # Supplier offers (one per supplier and MPN) and their quantity price
+        # breaks. Offers are matched to parts on the normalised MPN, and the
+        # (offer_id, min_quantity) key lets the best-price lookup pick the
+        # applicable break with one backward index probe per offer.
+        f"""CREATE TABLE IF NOT EXISTS supplier_offers (
+                offer_id bigserial PRIMARY KEY,
+                supplier_name text NOT NULL REFERENCES supplier (supplier_name) ON UPDATE CASCADE,
+                manufacturer_part_number text NOT NULL,
+                mpn_key text GENERATED ALWAYS AS ({MPN_KEY_SQL}) STORED,
+                supplier_part_number text,
+                stock integer,
+                currency text NOT NULL DEFAULT 'USD',
+                updated_at timestamptz NOT NULL DEFAULT now(),
+                UNIQUE (supplier_name, manufacturer_part_number))""",
+        # Offers tables created before the supplier foreign key get it NOT
+        # VALID: new offers must name a known supplier, existing ones stay.
+        """DO $$
+            BEGIN
+                IF NOT EXISTS (SELECT FROM pg_constraint WHERE conrelid = 'supplier_offers'::regclass
+                               AND conname = 'supplier_offers_supplier_name_fkey') THEN
+                    ALTER TABLE supplier_offers ADD CONSTRAINT supplier_offers_supplier_name_fkey
+                        FOREIGN KEY (supplier_name) REFERENCES supplier (supplier_name) ON UPDATE CASCADE NOT VALID;
+                END IF;
+            END $$""",
+        "CREATE INDEX IF NOT EXISTS supplier_offers_mpn_key_idx ON supplier_offers (mpn_key)",
+        """CREATE TABLE IF NOT EXISTS supplier_price_breaks (
+                offer_id bigint NOT NULL REFERENCES supplier_offers (offer_id) ON DELETE CASCADE,
+                min_quantity integer NOT NULL CHECK (min_quantity > 0),
+                unit_price numeric(14, 6) NOT NULL,
+                PRIMARY KEY (offer_id, min_quantity))""",
+    ]
+
+    def __init__(self, db_connection):
+        self.db_connection = db_connection
+        self.cursor = db_connection.cursor()
+        # Hot read queries (parts list, details, combobox) run as prepared
+        # statements, prepared once per connection.
+        self.statements = PreparedStatements(db_connection)
+        self._change_listeners: List[Callable[[ChangeEvent], None]] = []
+        # Undo/redo journal; committed writes are recorded in it when set.
+        self.journal: Optional[EditJournal] = None
+        # Row of the module added but not yet committed (add_module is
+        # committed by add_module_parts), so the commit can journal the
+        # insert. Holds at most one module; cleared when that transaction ends.
+        self._new_modules: Dict[str, dict] = {}
+        # Called with the name of each materialized library view a commit has
+        # made stale; without one, they are refreshed inline after the commit.
+        self.view_refresher: Optional[Callable[[str], None]] = None
+
+    def set_diagnostics(self, diagnostics: Optional[QueryDiagnostics]) -> None:
+        """Capture plans of slow queries made through this manager's cursor
+        (see diagnostics.py), or stop capturing with None."""
+        self.cursor.close()
+        if diagnostics is None:
+            self.cursor = self.db_connection.cursor()
+        else:
+            diagnostics.statements = self.statements
+            self.cursor = diagnostics.cursor(self.db_connection)
+
+    def add_change_listener(self, callback: Callable[[ChangeEvent], None]) -> None:
+        """Register callback(event) to run after each committed write made
+        through this manager."""
+        self._change_listeners.append(callback)
+
+    def _commit(self, *tables: str, component_types: Iterable[Optional[str]] = (),
+                journal: Optional[Tuple[str, List[dict]]] = None) -> None:
+        """Commit a write and announce which tables it touched.
+
+        component_types are the old and new component types of any parts
+        written, so per-category consumers (the .kicad_dbl generator) only
+        redo the categories that changed. The NOTIFYs go out in the same
+        transaction, so other sessions (see caching.ChangeListener) only hear
+        about changes that actually committed. Local listeners run after the
+        commit.
+
+        journal is (label, ops) describing the write for undo (see
+        journal.py); it is recorded only once the commit has succeeded.
+
+        Parts writes then bring the materialized KiCad library views of the
+        categories touched up to date, whoever generated them.
+        """
+        touched = tuple(sorted({ct or "" for ct in component_types}))
+        events = [ChangeEvent(table, touched if table == "parts" else ()) for table in tables]
+        for event in events:
+            self.cursor.execute("SELECT pg_notify(%s, %s)", (CHANGE_CHANNEL, event.to_payload()))
+        self.db_connection.commit()
+        if journal is not None and self.journal is not None:
+            try:
+                self.journal.record(*journal)
+            except Exception:  # pylint: disable=broad-except
+                logger.warning("Could not record %r in the edit journal", journal[0], exc_info=True)
+        if "parts" in tables:
+            self._refresh_library_views(touched)
+        for event in events:
+            for callback in self._change_listeners:
+                try:
+                    callback(event)
+                except Exception:  # pylint: disable=broad-except
+                    logger.warning("Change listener failed for %s", event.table, exc_info=True)
+
+    # Which version of each set of DDL (SCHEMA_STATEMENTS, the audit log) a
+    # database has had applied, as a fingerprint of the statements' text, so
+    # starting up doesn't re-run them: an ALTER TABLE takes an ACCESS
+    # EXCLUSIVE lock on parts even when it changes nothing.
+    SCHEMA_VERSION_TABLE = """CREATE TABLE IF NOT EXISTS kicad_db_gui_schema (
+            component text PRIMARY KEY,
+            fingerprint text NOT NULL,
+            applied_at timestamptz NOT NULL DEFAULT now())"""
+
+    @staticmethod
+    def _fingerprint(statements: Iterable[str]) -> str:
+        return hashlib.sha256("\n".join(statements).encode("utf-8")).hexdigest()[:16]
+
+    def _schema_applied(self, component: str, fingerprint: str) -> bool:
+        """Whether DDL with this fingerprint has been applied for component.
+        Reads the catalog and one row; takes no lock on the tables."""
+        self.cursor.execute("SELECT to_regclass('kicad_db_gui_schema') IS NOT NULL")
+        if not self.cursor.fetchone()[0]:
+            return False
+        self.cursor.execute("SELECT fingerprint FROM kicad_db_gui_schema WHERE component = %s", (component,))
+        row = self.cursor.fetchone()
+        return row is not None and row[0] == fingerprint
+
+    def _record_schema(self, component: str, fingerprint: str) -> None:
+        """Note that component's DDL is applied. Runs in the caller's
+        transaction, so it only counts once the DDL has committed."""
+        self.cursor.execute(self.SCHEMA_VERSION_TABLE)
+        self.cursor.execute("""INSERT INTO kicad_db_gui_schema (component, fingerprint) VALUES (%s, %s)
+                ON CONFLICT (component) DO UPDATE SET fingerprint = excluded.fingerprint, applied_at = now()""",
+                            (component, fingerprint))
+
+    def ensure_schema(self, backfill: bool = True) -> None:
+        """Create any missing columns/indexes this tool relies on, unless this
+        version of them is already applied, then (with backfill) fill in
+        derived columns for rows written by other tools. The GUI passes
+        backfill=False and runs backfill_value_index() off the Tk thread."""
+        fingerprint = self._fingerprint(self.SCHEMA_STATEMENTS)
+        try:
+            if not self._schema_applied("schema", fingerprint):
+                for statement in self.SCHEMA_STATEMENTS:
+                    self.cursor.execute(statement)
+                self._record_schema("schema", fingerprint)
+            self.db_connection.commit()
+        except Exception:
+            self.db_connection.rollback()
+            raise
+        if backfill:
+            self.backfill_value_index()
+        self.ensure_audit()
+
+    def backfill_value_index(self) -> int:
+        """Re-derive value_magnitude/value_unit and the sort keys of any part
+        whose stored ones don't match what the parts_derived_columns trigger
+        makes of it now: rows from before the trigger existed, or from an
+        older version of the parser. Once that is done for this version of
+        SCHEMA_STATEMENTS the trigger keeps every row right, so later calls
+        return straight away. Returns the number of parts updated."""
+        fingerprint = self._fingerprint(self.SCHEMA_STATEMENTS)
+        try:
+            updated = 0
+            if not self._schema_applied("value_index", fingerprint):
+                # Writing any derived column fires the trigger, which overwrites it.
+                self.cursor.execute("""UPDATE parts SET value_unit = NULL
+                        WHERE parts_uuid IN (
+                            SELECT p.parts_uuid FROM parts AS p, kicad_parse_value(p.value, p.component_type) AS v
+                            WHERE (p.value_magnitude, p.value_unit, p.value_sort_key, p.part_number_sort_key)
+                                IS DISTINCT FROM (v.magnitude, coalesce(v.unit, ''), kicad_natural_sort_key(p.value),
+                                                  kicad_natural_sort_key(p.kicad_part_number)))""")
+                updated = self.cursor.rowcount
+                self._record_schema("value_index", fingerprint)
+            self.db_connection.commit()
+        except Exception:
+            self.db_connection.rollback()
+            raise
+        return updated
+
+    def add_part(self, part: Part) -> None:
+        """Add a new part to the database."""
+        sql = """INSERT INTO parts (description, datasheet, footprint_ref,
+                symbol_ref, model_ref, kicad_part_number, manufacturer_part_number,
+                manufacturer, manufacturer_part_url, note, value, component_type,
+                exclude_from_bom, exclude_from_board, exclude_from_sim)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                RETURNING to_jsonb(parts)"""
+        values = [
+            part.description, part.datasheet, part.footprint_ref,
+            part.symbol_ref, part.model_ref, part.kicad_part_number,
+            part.manufacturer_part_number, part.manufacturer,
+            part.manufacturer_part_url, part.note, part.value, part.component_type,
+            part.exclude_from_bom, part.exclude_from_board, part.exclude_from_sim
+        ]
+        self.cursor.execute(sql, values)
+        row = self.cursor.fetchone()[0]
+        self._commit("parts", component_types=[part.component_type],
+                     journal=(f"Add part {part.kicad_part_number}", [{"op": "i", "t": "parts", "r": row}]))
+
+    # Part fields update_part may write; they double as the column names.
+    PART_EDIT_COLUMNS = [f.name for f in fields(Part) if f.name != "kicad_part_number"]
+
+    def add_parts(self, parts: List[Part]) -> int:
+        """Add many parts with one multi-row INSERT in one transaction,
+        journaled as a single group. Returns the number added."""
+        if not parts:
+            return 0
+        columns = ["kicad_part_number"] + self.PART_EDIT_COLUMNS
+        rows = [[getattr(part, column) for column in columns] for part in parts]
+        try:
+            inserted = execute_values(self.cursor, f"""INSERT INTO parts ({', '.join(columns)}) VALUES %s
+                    RETURNING component_type, to_jsonb(parts)""", rows, page_size=len(rows), fetch=True)
+            self._commit("parts", component_types=[row[0] for row in inserted],
+                         journal=(f"Import {len(inserted)} parts",
+                                  [{"op": "i", "t": "parts", "r": row[1]} for row in inserted]))
+        except Exception:
+            self.db_connection.rollback()
+            raise
+        return len(inserted)
+
+    def iter_parts(self, component_type_filter: Optional[str] = None, search_term: Optional[str] = None,
+                   batch_size: int = 2000, as_of: Optional[object] = None) -> Iterator[Tuple]:
+        """Stream whole parts (kicad_part_number then PART_EDIT_COLUMNS)
+        through a server-side cursor, batch_size rows per round trip, so an
+        export never holds the table in memory.
+
+        With as_of (a timestamp, or text Postgres reads as one) the parts are
+        as they were then, from the audit log; ValueError if that is before
+        history began."""
+        source, source_params = "parts", []
+        if as_of is not None:
+            self.cursor.execute("SELECT %s::timestamptz", (as_of,))
+            as_of = self.cursor.fetchone()[0]
+            started = self.audit_started_at("parts")
+            if started is None or as_of < started:
+                raise ValueError(f"Part history only goes back to {started or 'now'}")
+            source, source_params = self._as_of_query("parts", as_of)
+            source = f"({source}) AS parts"
+        conditions, params = self._build_part_filters(component_type_filter, search_term)
+        params = source_params + params
+        sql = f"SELECT kicad_part_number, {', '.join(self.PART_EDIT_COLUMNS)} FROM {source}"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        with self.db_connection.cursor(name="iter_parts") as cursor:
+            cursor.itersize = batch_size
+            cursor.execute(sql + " ORDER BY kicad_part_number", params)
+            yield from cursor
+
+    def get_part(self, kicad_part_number: str) -> Optional[Tuple[Part, str]]:
+        """A part plus its row version (xmin), for editing with update_part's
+        compare-and-swap. NULL text columns come back as ""."""
+        columns = ", ".join(self.PART_EDIT_COLUMNS)
+        self.cursor.execute(f"SELECT {columns}, xmin::text FROM parts WHERE kicad_part_number = %s",
+                            (kicad_part_number,))
+        row = self.cursor.fetchone()
+        if row is None:
+            return None
+        values = {column: (bool(value) if column.startswith("exclude_") else (value or ""))
+                  for column, value in zip(self.PART_EDIT_COLUMNS, row)}
+        return Part(kicad_part_number=kicad_part_number, **values), row[-1]
+
+    @classmethod
+    def changed_columns(cls, original: Part, edited: Part) -> List[str]:
+        """The PART_EDIT_COLUMNS whose values differ between two versions of a part."""
+        return [column for column in cls.PART_EDIT_COLUMNS if getattr(original, column) != getattr(edited, column)]
+
+    def update_part(self, part: Part, original: Optional[Part] = None, version: Optional[str] = None) -> None:
+        """Update an existing part in the database.
+
+        With original (the part as the edit started), only the columns that
+        differ from it are written. With version (from get_part), the write
+        is a compare-and-swap on the row's xmin: if anyone else has written
+        the row since, nothing is written and PartConflictError is raised.
+        """
+        columns = self.changed_columns(original, part) if original is not None else list(self.PART_EDIT_COLUMNS)
+        if not columns:
+            return
+        assignments = [f"{column} = %s" for column in columns]
+        values: List[object] = [getattr(part, column) for column in columns]
+
+        # Joining parts to itself as "old" lets RETURNING report the
+        # pre-update component type as well as the new one.
+        sql = f"""UPDATE parts AS p SET {', '.join(assignments)}
+                FROM parts AS old
+                WHERE old.parts_uuid = p.parts_uuid AND p.kicad_part_number = %s"""
+        values.append(part.kicad_part_number)
+        if version is not None:
+            sql += " AND p.xmin = %s::xid"
+            values.append(version)
+        sql += " RETURNING old.component_type, p.component_type, p.kicad_part_number, to_jsonb(old), to_jsonb(p)"
+        try:
+            self.cursor.execute(sql, values)
+            rows = self.cursor.fetchall()
+        except Exception:
+            self.db_connection.rollback()
+            raise
+        if not rows and version is not None:
+            self.db_connection.rollback()
+            current = self.get_part(part.kicad_part_number)
+            raise PartConflictError(part.kicad_part_number, *(current or (None, None)))
+        touched = [ct for row in rows for ct in row[:2]]
+        self._commit("parts", component_types=touched,
+                     journal=(f"Edit {part.kicad_part_number}", update_ops([row[2:] for row in rows], columns)))
+
+    # Whitelist mapping of sortable treeview columns to the DB columns they
+    # sort by, in order. Used to build ORDER BY safely (never interpolate raw
+    # column names from callers). Part numbers and values sort naturally, on
+    # the precomputed keys, in the order of their indexes.
+    SORTABLE_COLUMNS = {
+        "kicad_part_number": ("part_number_sort_key", "kicad_part_number"),
+        "description": ("description",),
+        "component_type": ("component_type",),
+        "value": ("value_unit", "value_magnitude", "value_sort_key"),
+        "symbol_ref": ("symbol_ref",),
+        "footprint_ref": ("footprint_ref",),
+        "manufacturer": ("manufacturer",),
+        "manufacturer_part_number": ("manufacturer_part_number",),
+    }
+
+    # Facets the filter panel can narrow by: facet name -> SQL expression.
+    # Whitelisted like SORTABLE_COLUMNS; facet names never reach SQL directly.
+    FACET_EXPRESSIONS = {
+        "component_type": "component_type",
+        "manufacturer": "manufacturer",
+        "footprint_library": "split_part(footprint_ref, ':', 1)",
+        "exclude_from_bom": "exclude_from_bom",
+        "exclude_from_board": "exclude_from_board",
+        "exclude_from_sim": "exclude_from_sim",
+    }
+
+    # Boolean facets; NULL counts as False for these, and as "" for the rest.
+    BOOLEAN_FACETS = {"exclude_from_bom", "exclude_from_board", "exclude_from_sim"}
+
+    def _facet_condition(self, facet: str, values: List[object]) -> Tuple[str, List[object]]:
+        """SQL condition matching any of the selected values of one facet.
+
+        The raw expression is compared (not a coalesce()) so a plain index on
+        e.g. component_type still applies; the NULL bucket is OR'd in
+        separately when it's selected."""
+        if facet not in self.FACET_EXPRESSIONS:
+            raise ValueError(f"Unknown facet: {facet}")
+        expression = self.FACET_EXPRESSIONS[facet]
+        null_value = False if facet in self.BOOLEAN_FACETS else ""
+        condition = f"{expression} = ANY(%s)"
+        if null_value in values:
+            condition = f"({condition} OR {expression} IS NULL)"
+        return condition, [list(values)]
+
+    def _build_part_filters(self, component_type_filter: Optional[str] = None,
+                            search_term: Optional[str] = None,
+                            value_range: Optional[ValueRange] = None,
+                            facet_filters: Optional[Dict[str, List[object]]] = None,
+                            skip_facets: bool = False) -> Tuple[List[str], List[object]]:
+        """Build the WHERE conditions and params shared by get_parts, the facet
+        counts and the bulk-edit scope queries, so all see exactly the same
+        rows. skip_facets leaves facet_filters out (get_facet_counts applies
+        them itself, per facet)."""
+        conditions: List[str] = []
+        params: List[object] = []
+
+        if component_type_filter:
+            conditions.append("component_type = %s")
+            params.append(component_type_filter)
+
+        if facet_filters and not skip_facets:
+            for facet, values in facet_filters.items():
+                if values:
+                    condition, condition_params = self._facet_condition(facet, values)
+                    conditions.append(condition)
+                    params.extend(condition_params)
+
+        if search_term:
+            conditions.append("""(description ILIKE %s OR kicad_part_number ILIKE %s
+                    OR manufacturer_part_number ILIKE %s OR manufacturer ILIKE %s
+                    OR value ILIKE %s)""")
+            like_term = f"%{search_term}%"
+            params.extend([like_term] * 5)
+
+        # Value ranges compare the parsed columns, which parts_value_range_idx
+        # serves as an index range scan.
+        if value_range:
+            if value_range.component_type and value_range.component_type != component_type_filter:
+                conditions.append("component_type = %s")
+                params.append(value_range.component_type)
+            if value_range.unit:
+                conditions.append("value_unit = %s")
+                params.append(value_range.unit)
+            if value_range.low is not None:
+                conditions.append("value_magnitude >= %s")
+                params.append(value_range.low)
+            if value_range.high is not None:
+                conditions.append("value_magnitude <= %s")
+                params.append(value_range.high)
+            if value_range.low is None and value_range.high is None:
+                conditions.append("value_magnitude IS NOT NULL")
+
+        return conditions, params
+
+    # Columns of the parts list, in Treeview order.
+    PART_LIST_COLUMNS = ("kicad_part_number", "description", "component_type", "value",
+                         "symbol_ref", "footprint_ref", "manufacturer", "manufacturer_part_number")
+
+    def parts_query(self, component_type_filter: Optional[str] = None,
+                    search_term: Optional[str] = None,
+                    sort_column: Optional[str] = None,
+                    sort_descending: bool = False,
+                    value_range: Optional[ValueRange] = None,
+                    facet_filters: Optional[Dict[str, List[object]]] = None) -> Tuple[str, List[object]]:
+        """SQL and params for get_parts. The text depends only on which
+        filters are present and the sort, never on their values, so each
+        shape is prepared once."""
+        base_sql = f"SELECT {', '.join(self.PART_LIST_COLUMNS)} FROM parts"
+
+        conditions, params = self._build_part_filters(component_type_filter, search_term, value_range, facet_filters)
+
+        sql = base_sql
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+
+        # Validate sort_column against the whitelist to avoid SQL injection via ORDER BY.
+        if sort_column and sort_column in self.SORTABLE_COLUMNS:
+            direction = "DESC" if sort_descending else "ASC"
+            sql += " ORDER BY " + ", ".join(f"{column} {direction}" for column in self.SORTABLE_COLUMNS[sort_column])
+        return sql, params
+
+    def get_parts(self, component_type_filter: Optional[str] = None,
+                  search_term: Optional[str] = None,
+                  sort_column: Optional[str] = None,
+                  sort_descending: bool = False,
+                  value_range: Optional[ValueRange] = None,
+                  facet_filters: Optional[Dict[str, List[object]]] = None) -> List[Tuple]:
+        """Retrieve parts from the database, optionally filtered by component type,
+        a search term, a value range and/or facet selections, and optionally
+        sorted by a whitelisted column."""
+        sql, params = self.parts_query(component_type_filter, search_term, sort_column, sort_descending,
+                                       value_range, facet_filters)
+        self.statements.execute(self.cursor, sql, params)
+        return self.cursor.fetchall()
+
+    def get_facet_counts(self, search_term: Optional[str] = None,
+                         value_range: Optional[ValueRange] = None,
+                         facet_filters: Optional[Dict[str, List[object]]] = None) -> Dict[str, List[Tuple[object, int]]]:
+        """Count parts per value of every facet in one GROUPING SETS query.
+
+        Counts are disjunctive: each facet's counts honour the selections on
+        every *other* facet but not its own, so picking "Resistor" still shows
+        how many capacitors there are to add to the selection. That is done
+        with one 0/1 "matches the other facets" column per facet, summed
+        within that facet's grouping set.
+
+        Returns {facet: [(value, count), ...]} sorted by descending count,
+        with NULLs reported as "" (or False for the boolean facets).
+        """
+        facet_filters = facet_filters or {}
+        facets = list(self.FACET_EXPRESSIONS)
+
+        base_conditions, base_params = self._build_part_filters(
+            search_term=search_term, value_range=value_range, facet_filters=facet_filters, skip_facets=True)
+
+        facet_conditions: Dict[str, Tuple[str, List[object]]] = {
+            facet: self._facet_condition(facet, values)
+            for facet, values in facet_filters.items() if values
+        }
+
+        select_items = []
+        params: List[object] = []
+        for facet in facets:
+            null_value = "false" if facet in self.BOOLEAN_FACETS else "''"
+            select_items.append(f"coalesce({self.FACET_EXPRESSIONS[facet]}, {null_value}) AS {facet}")
+        for facet in facets:
+            others = [facet_conditions[other] for other in facets if other != facet and other in facet_conditions]
+            if others:
+                select_items.append("(" + " AND ".join(condition for condition, _ in others) + f")::int AS m_{facet}")
+                for _, condition_params in others:
+                    params.extend(condition_params)
+            else:
+                select_items.append(f"1 AS m_{facet}")
+
+        inner_sql = "SELECT " + ", ".join(select_items) + " FROM parts"
+        if base_conditions:
+            inner_sql += " WHERE " + " AND ".join(base_conditions)
+        params.extend(base_params)
+
+        grouping_flags = ", ".join(f"GROUPING({facet})" for facet in facets)
+        sums = ", ".join(f"sum(m_{facet})" for facet in facets)
+        grouping_sets = ", ".join(f"({facet})" for facet in facets)
+        sql = f"""SELECT {", ".join(facets)}, {grouping_flags}, {sums}
+                FROM ({inner_sql}) AS f
+                GROUP BY GROUPING SETS ({grouping_sets})"""
+        self.cursor.execute(sql, params)
+
+        counts: Dict[str, List[Tuple[object, int]]] = {facet: [] for facet in facets}
+        n = len(facets)
+        for row in self.cursor.fetchall():
+            values, flags, totals = row[:n], row[n:2 * n], row[2 * n:]
+            for i, facet in enumerate(facets):
+                if flags[i] == 0:
+                    if totals[i]:
+                        counts[facet].append((values[i], int(totals[i])))
+                    break
+        for facet_counts in counts.values():
+            facet_counts.sort(key=lambda item: (-item[1], str(item[0])))
+        return counts
+
+    def get_part_details(self, kicad_part_number: str) -> Optional[Tuple]:
+        """Get detailed information for a specific part."""
+        sql = """SELECT description, datasheet, footprint_ref, symbol_ref, model_ref,
+                manufacturer_part_number, manufacturer, manufacturer_part_url, note,
+                value, component_type, exclude_from_bom, exclude_from_board,
+                exclude_from_sim FROM parts WHERE kicad_part_number = %s"""
+        self.statements.execute(self.cursor, sql, (kicad_part_number,))
+        return self.cursor.fetchone()
+
+    def get_table_columns(self, table: str) -> List[str]:
+        """Column names of a table in the current schema, in table order."""
+        self.cursor.execute("""SELECT column_name FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = %s
+                ORDER BY ordinal_position""", (table,))
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def get_index_definitions(self) -> Dict[str, List[str]]:
+        """CREATE INDEX statements of the current schema, by table, for the
+        index advisor to check its suggestions against."""
+        self.cursor.execute("SELECT tablename, indexdef FROM pg_indexes WHERE schemaname = current_schema()")
+        definitions: Dict[str, List[str]] = {}
+        for table, definition in self.cursor.fetchall():
+            definitions.setdefault(table, []).append(definition)
+        return definitions
+
+    def get_part_links(self) -> Dict[str, Tuple[str, str]]:
+        """kicad_part_number -> (datasheet, manufacturer_part_url) for every
+        part with either set."""
+        self.cursor.execute("""SELECT kicad_part_number, coalesce(datasheet, ''), coalesce(manufacturer_part_url, '')
+                FROM parts WHERE coalesce(datasheet, '') <> '' OR coalesce(manufacturer_part_url, '') <> ''""")
+        return {row[0]: (row[1], row[2]) for row in self.cursor.fetchall()}
+
+    def get_lookup_lists(self) -> Dict[str, List[str]]:
+        """Distinct component types, manufacturers and footprint/symbol library
+        prefixes currently in use, in one round trip. Library prefixes keep
+        their trailing ':' so they can seed a ref entry directly."""
+        self.cursor.execute("""
+                SELECT 'component_types', component_type FROM parts GROUP BY component_type
+                UNION ALL
+                SELECT 'manufacturers', manufacturer FROM parts GROUP BY manufacturer
+                UNION ALL
+                SELECT 'footprint_libraries', split_part(footprint_ref, ':', 1) || ':' FROM parts
+                    WHERE footprint_ref LIKE '%:%' GROUP BY 2
+                UNION ALL
+                SELECT 'symbol_libraries', split_part(symbol_ref, ':', 1) || ':' FROM parts
+                    WHERE symbol_ref LIKE '%:%' GROUP BY 2""")
+        lists: Dict[str, List[str]] = {
+            "component_types": [], "manufacturers": [], "footprint_libraries": [], "symbol_libraries": [],
+        }
+        for name, value in self.cursor.fetchall():
+            if value:
+                lists[name].append(value)
+        for values in lists.values():
+            values.sort(key=str.lower)
+        return lists
+
+    def get_parts_for_combobox(self) -> Tuple[List[str], Dict[str, str]]:
+        """Get parts data formatted for combobox usage."""
+        self.statements.execute(self.cursor, "SELECT parts_uuid, kicad_part_number FROM parts")
+        parts = self.cursor.fetchall()
+        part_names = [part[1] for part in parts]
+        parts_uuid_map = {part[1]: part[0] for part in parts}
+        return part_names, parts_uuid_map
@@ -0,0 +1,271 @@
+"""
+Local mirror of part datasheets.
+
+Files are stored content-addressed: each download is hashed with SHA-256 as
+it streams to disk and lands at objects/<first two hex digits>/<hash>, so the
+same PDF linked from many parts (or from several URLs) is kept once. A
+small SQLite index maps URLs to hashes and tracks the last access of each
+object; when the store grows past its size cap the least recently used
+objects are evicted. Downloads run on a bounded thread pool, and a URL
+already in the store resolves immediately without touching the network.
+"""
+import hashlib
+import logging
+import mmap
+import os
+import pathlib
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_PATH = pathlib.Path.home() / ".cache" / "kicad_db_gui" / "datasheets"
+DEFAULT_SIZE_CAP = 2 * 1024 ** 3
+CHUNK_SIZE = 1024 * 1024
+USER_AGENT = "kicad-db-gui-datasheet-mirror/1.0"
+
+# Servers answer a datasheet link with a login or error page as often as with
+# a 404; those pages are never stored. Anything not textual (PDFs, but also
+# the application/octet-stream many vendors send them as) is accepted.
+_TEXT_CONTENT_TYPES = ("text/", "application/xhtml", "application/xml", "application/json")
+_HTML_START_RE = re.compile(rb"\s*<(?:!doctype\s+html|html|head|body)\b", re.IGNORECASE)
+
+_PDF_VERSION_RE = re.compile(rb"%PDF-(\d\.\d)")
+_PDF_PAGE_RE = re.compile(rb"/Type\s*/Page(?![a-zA-Z])")
+_PDF_TITLE_RE = re.compile(rb"/Title\s*\(((?:[^()\\]|\\.){0,200})\)")
+
+
+class PdfSummary(NamedTuple):
+    """What a quick scan of a stored PDF found, for the preview pane."""
+    size: int
+    version: str
+    pages: int
+    title: str
+
+
+class DatasheetStore:
+    """Content-addressed datasheet cache with an LRU size cap.
+
+    fetch() may be called from any thread; the index is guarded by a lock.
+    """
+
+    def __init__(self, root: pathlib.Path = DEFAULT_STORE_PATH, size_cap: int = DEFAULT_SIZE_CAP,
+                 max_workers: int = 4, timeout: float = 30.0):
+        self.root = pathlib.Path(root)
+        self.size_cap = size_cap
+        self.timeout = timeout
+        (self.root / "objects").mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._index = sqlite3.connect(str(self.root / "index.sqlite3"), check_same_thread=False)
+        self._index.executescript("""
+            CREATE TABLE IF NOT EXISTS objects (sha256 TEXT PRIMARY KEY, size INTEGER NOT NULL,
+                                                last_access REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS objects_last_access_idx ON objects (last_access);
+            CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, sha256 TEXT NOT NULL, fetched_at REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS urls_sha256_idx ON urls (sha256);
+        """)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="datasheet")
+        # One download per URL at a time, however many parts ask for it.
+        self._in_flight: Dict[str, Future] = {}
+
+    def object_path(self, sha256: str) -> pathlib.Path:
+        """Where the object with this hash is (or would be) stored."""
+        return self.root / "objects" / sha256[:2] / sha256
+
+    def lookup(self, url: str) -> Optional[pathlib.Path]:
+        """Path of the stored copy of url, or None. Counts as an access for LRU."""
+        with self._lock:
+            row = self._index.execute("SELECT sha256 FROM urls WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            path = self.object_path(row[0])
+            if not path.exists():
+                self._forget(row[0])
+                self._index.commit()
+                return None
+            self._index.execute("UPDATE objects SET last_access = ? WHERE sha256 = ?", (time.time(), row[0]))
+            self._index.commit()
+            return path
+
+    def fetch(self, url: str) -> "Future[pathlib.Path]":
+        """Future resolving to a local path for url: already done if the URL
+        is stored (or is a local file), otherwise downloaded on the pool."""
+        url = url.strip()
+        local = self._local_path(url)
+        if local is not None:
+            return self._resolved(local)
+        stored = self.lookup(url)
+        if stored is not None:
+            return self._resolved(stored)
+        with self._lock:
+            future = self._in_flight.get(url)
+            if future is None:
+                future = self._pool.submit(self._download, url)
+                self._in_flight[url] = future
+                future.add_done_callback(lambda _: self._done(url))
+            return future
+
+    def fetch_summary(self, url: str) -> "Future[Tuple[pathlib.Path, PdfSummary]]":
+        """Future resolving to (local path, pdf_summary() of it) for url. The
+        scan runs on the pool once the file is there, never on the caller's
+        thread, even when the URL is already stored."""
+        fetched = self.fetch(url)
+        summarized: Future = Future()
+
+        def summarize() -> None:
+            if not summarized.set_running_or_notify_cancel():
+                return
+            try:
+                path = fetched.result().resolve()
+                summarized.set_result((path, pdf_summary(path)))
+            except Exception as e:  # pylint: disable=broad-except
+                summarized.set_exception(e)
+
+        def schedule(_: Future) -> None:
+            try:
+                self._pool.submit(summarize)
+            except RuntimeError:  # the store has been closed
+                summarized.cancel()
+
+        fetched.add_done_callback(schedule)
+        return summarized
+
+    def _done(self, url: str) -> None:
+        with self._lock:
+            self._in_flight.pop(url, None)
+
+    @staticmethod
+    def _resolved(path: pathlib.Path) -> "Future[pathlib.Path]":
+        future: Future = Future()
+        future.set_result(path)
+        return future
+
+    @staticmethod
+    def _local_path(url: str) -> Optional[pathlib.Path]:
+        """Datasheet fields sometimes hold a file path or file:// URL; those
+        are served as they are rather than copied into the store."""
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme == "file":
+            return pathlib.Path(urllib.request.url2pathname(parts.path))
+        if parts.scheme in ("http", "https"):
+            return None
+        if os.path.isfile(url):
+            return pathlib.Path(url)
+        raise ValueError(f"Not a datasheet URL or file: {url}")
+
+    def _download(self, url: str) -> pathlib.Path:
+        """Stream url to a temp file, hashing as it goes, then move it into
+        place under its hash (or drop it if that content is already stored)."""
+        started = time.perf_counter()
+        digest = hashlib.sha256()
+        size = 0
+        request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+        with tempfile.NamedTemporaryFile(dir=self.root, prefix="download-", delete=False) as f_out:
+            temp_path = pathlib.Path(f_out.name)
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    content_type = (response.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+                    if content_type.startswith(_TEXT_CONTENT_TYPES):
+                        raise ValueError(f"{url} returned {content_type}, not a datasheet")
+                    for chunk in iter(lambda: response.read(CHUNK_SIZE), b""):
+                        if size == 0 and _HTML_START_RE.match(chunk):
+                            raise ValueError(f"{url} returned a web page, not a datasheet")
+                        digest.update(chunk)
+                        f_out.write(chunk)
+                        size += len(chunk)
+            except BaseException:
+                f_out.close()
+                temp_path.unlink(missing_ok=True)
+                raise
+
+        sha256 = digest.hexdigest()
+        path = self.object_path(sha256)
+        now = time.time()
+        with self._lock:
+            if path.exists():
+                temp_path.unlink()
+            else:
+                path.parent.mkdir(exist_ok=True)
+                temp_path.replace(path)
+            self._index.execute("INSERT OR REPLACE INTO objects VALUES (?, ?, ?)", (sha256, size, now))
+            self._index.execute("INSERT OR REPLACE INTO urls VALUES (?, ?, ?)", (url, sha256, now))
+            self._evict(keep=sha256)
+            self._index.commit()
+        logger.info("Mirrored %s (%d bytes, %s) in %.1f s", url, size, sha256[:12], time.perf_counter() - started)
+        return path
+
+    def _evict(self, keep: str) -> None:
+        """Drop least recently used objects until the store fits its cap.
+        Never evicts keep (the object just added). Caller holds the lock."""
+        total = self._index.execute("SELECT coalesce(sum(size), 0) FROM objects").fetchone()[0]
+        if total <= self.size_cap:
+            return
+        for sha256, size in self._index.execute(
+                "SELECT sha256, size FROM objects WHERE sha256 <> ? ORDER BY last_access", (keep,)).fetchall():
+            if total <= self.size_cap:
+                break
+            self.object_path(sha256).unlink(missing_ok=True)
+            self._forget(sha256)
+            total -= size
+            logger.debug("Evicted datasheet %s (%d bytes)", sha256[:12], size)
+
+    def _forget(self, sha256: str) -> None:
+        self._index.execute("DELETE FROM urls WHERE sha256 = ?", (sha256,))
+        self._index.execute("DELETE FROM objects WHERE sha256 = ?", (sha256,))
+
+    def usage(self) -> Dict[str, int]:
+        """Object count, URL count and bytes stored."""
+        with self._lock:
+            objects, size = self._index.execute("SELECT count(*), coalesce(sum(size), 0) FROM objects").fetchone()
+            urls = self._index.execute("SELECT count(*) FROM urls").fetchone()[0]
+        return {"objects": objects, "urls": urls, "bytes": size, "size_cap": self.size_cap}
+
+    def clear(self) -> None:
+        """Remove every stored datasheet."""
+        with self._lock:
+            shutil.rmtree(self.root / "objects", ignore_errors=True)
+            (self.root / "objects").mkdir()
+            self._index.execute("DELETE FROM urls")
+            self._index.execute("DELETE FROM objects")
+            self._index.commit()
+
+    def close(self) -> None:
+        """Cancel queued downloads and close the index. Running downloads
+        aren't waited for, so closing never blocks on a slow server."""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            self._index.close()
+
+
+@contextmanager
+def mapped(path: pathlib.Path) -> Iterator[Union[mmap.mmap, bytes]]:
+    """Read-only memory map of a stored file, so previews only page in what
+    they touch. (Empty files can't be mapped; they come back as b"".)"""
+    with open(path, "rb") as f_in:
+        if os.fstat(f_in.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+
+def pdf_summary(path: pathlib.Path) -> PdfSummary:
+    """Version, approximate page count and title of a PDF, scanned through a
+    memory map without parsing it. Compressed object streams can hide page
+    objects, so pages is a lower bound."""
+    with mapped(path) as data:
+        size = os.path.getsize(path)
+        version = _PDF_VERSION_RE.search(data[:1024])
+        title = _PDF_TITLE_RE.search(data)
+        pages = sum(1 for _ in _PDF_PAGE_RE.finditer(data))
+        return PdfSummary(size, version.group(1).decode("ascii") if version else "",
+                          pages, title.group(1).decode("latin-1") if title else "")
@@ -0,0 +1,370 @@
+"""
+Slow query diagnostics: plan capture and an index advisor.
+
+With diagnostics on, DatabaseManager's cursor is a DiagnosticCursor. Any
+read query slower than the threshold is run again under
+EXPLAIN (ANALYZE, BUFFERS) on a separate cursor, inside a savepoint so a
+failing EXPLAIN can't spoil the caller's transaction, and the plan is stored
+against the query's shape: the SQL text with its %s placeholders, so every
+search of one filter/sort combination shares a shape. Prepared statements
+(see prepared.py) are explained through EXECUTE and filed under their SQL.
+Writes are never re-run.
+
+summarize_plan() reduces a plan to its timings, buffer counts, sequential
+scans and sorts. suggest_indexes() proposes indexes for the sequential
+scans: a trigram GIN index per ILIKE-searched column, and a btree over the
+equality columns, then a range column, or else the column sorted on. The
+advisor leaves out anything an existing index already covers.
+
+The EXPLAIN runs the query a second time, so a captured query costs about
+double while diagnostics are on.
+"""
+import json
+import logging
+import pathlib
+import re
+import sqlite3
+import threading
+import time
+from hashlib import sha1
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from psycopg2 import extensions
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PLAN_STORE_PATH = pathlib.Path.home() / ".cache" / "kicad_db_gui" / "query_plans.sqlite3"
+
+_READ_RE = re.compile(r"^\s*(SELECT|WITH|EXECUTE|VALUES|TABLE)\b", re.IGNORECASE)
+_WRITE_RE = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|pg_notify|nextval|setval|FOR\s+UPDATE)\b", re.IGNORECASE)
+_EXECUTE_RE = re.compile(r"^\s*EXECUTE\s+(\w+)", re.IGNORECASE)
+# One comparison in an EXPLAIN filter, e.g. "((component_type)::text = $1)"
+# or "(value_magnitude >= '1e-07'::double precision)".
+_CONDITION_RE = re.compile(r"\(?\(?([a-z_][a-z0-9_]*)\)?(?:::[a-z ]+)?\s+(~~\*|~~|=|>=|<=|>|<)\s*(ANY)?",
+                           re.IGNORECASE)
+_SORT_KEY_RE = re.compile(r"^(?:\w+\.)?\(?([a-z_][a-z0-9_]*)\)?(?:::[a-z ]+)?(\s+DESC)?$", re.IGNORECASE)
+_INDEX_DEF_RE = re.compile(r"USING (\w+) \((.*)\)", re.IGNORECASE)
+
+
+def query_shape(sql: str) -> str:
+    """The query text with whitespace collapsed."""
+    return " ".join(sql.split())
+
+
+def shape_id(shape: str) -> str:
+    """Short stable id of a query shape, for grouping its captures."""
+    return sha1(shape.encode("utf-8")).hexdigest()[:16]
+
+
+def is_read_query(sql: str) -> bool:
+    """True for statements that are safe to run twice."""
+    return bool(_READ_RE.match(sql)) and not _WRITE_RE.search(sql)
+
+
+def _walk(node: dict, parent: Optional[dict] = None) -> Iterator[Tuple[dict, Optional[dict]]]:
+    yield node, parent
+    for child in node.get("Plans", []):
+        yield from _walk(child, node)
+
+
+def summarize_plan(explain: List[dict]) -> Dict[str, object]:
+    """Timings, buffers, sequential scans and sorts of an EXPLAIN (ANALYZE,
+    BUFFERS, FORMAT JSON) result."""
+    root = explain[0]
+    plan = root["Plan"]
+    seq_scans = []
+    sorts = []
+    for node, _parent in _walk(plan):
+        if node.get("Node Type") == "Seq Scan":
+            seq_scans.append({
+                "relation": node.get("Relation Name", ""),
+                "filter": node.get("Filter", ""),
+                "rows": node.get("Actual Rows", 0) * node.get("Actual Loops", 1),
+                "rows_removed": node.get("Rows Removed by Filter", 0) * node.get("Actual Loops", 1),
+                "ms": node.get("Actual Total Time", 0.0) * node.get("Actual Loops", 1),
+            })
+        elif node.get("Node Type") in ("Sort", "Incremental Sort"):
+            sorts.append({"keys": node.get("Sort Key", []), "method": node.get("Sort Method", ""),
+                          "space": node.get("Sort Space Type", "")})
+    return {
+        "execution_ms": root.get("Execution Time", 0.0),
+        "planning_ms": root.get("Planning Time", 0.0),
+        "shared_hit_blocks": plan.get("Shared Hit Blocks", 0),
+        "shared_read_blocks": plan.get("Shared Read Blocks", 0),
+        "seq_scans": seq_scans,
+        "sorts": sorts,
+    }
+
+
+def filter_columns(filter_text: str) -> Dict[str, List[str]]:
+    """Columns compared in a scan filter, by kind: "eq" (= and = ANY),
+    "range" (< <= > >=) and "like" (LIKE/ILIKE)."""
+    kinds: Dict[str, List[str]] = {"eq": [], "range": [], "like": []}
+    for column, operator, _any in _CONDITION_RE.findall(filter_text or ""):
+        kind = "like" if operator.startswith("~~") else "eq" if operator == "=" else "range"
+        if column not in kinds[kind]:
+            kinds[kind].append(column)
+    return kinds
+
+
+def _sort_column(sort_node: Optional[dict]) -> Optional[str]:
+    """The single plain column a Sort orders by, if that's what it is."""
+    if sort_node is None or len(sort_node.get("Sort Key", [])) != 1:
+        return None
+    match = _SORT_KEY_RE.match(sort_node["Sort Key"][0].strip())
+    return match.group(1) if match else None
+
+
+def suggest_indexes(explain: List[dict]) -> List[Tuple[str, str, Tuple[str, ...]]]:
+    """(table, method, columns) of indexes that would replace the plan's
+    sequential scans. method is "btree" or "trgm" (GIN with gin_trgm_ops,
+    one per column, since ILIKE '%term%' can't use a btree)."""
+    suggestions: List[Tuple[str, str, Tuple[str, ...]]] = []
+    sorts_above: Dict[int, dict] = {}
+    for node, parent in _walk(explain[0]["Plan"]):
+        if parent is not None and parent.get("Node Type") in ("Sort", "Incremental Sort"):
+            sorts_above[id(node)] = parent
+        elif parent is not None and id(parent) in sorts_above and parent.get("Node Type") in ("Gather", "Gather Merge"):
+            sorts_above[id(node)] = sorts_above[id(parent)]
+        if node.get("Node Type") != "Seq Scan":
+            continue
+        table = node.get("Relation Name", "")
+        columns = filter_columns(node.get("Filter", ""))
+        for column in columns["like"]:
+            suggestions.append((table, "trgm", (column,)))
+        btree = list(columns["eq"])
+        if columns["range"]:
+            btree.append(columns["range"][0])
+        else:
+            sort_column = _sort_column(sorts_above.get(id(node)))
+            if sort_column and sort_column not in btree:
+                btree.append(sort_column)
+        if btree:
+            suggestions.append((table, "btree", tuple(btree)))
+    return list(dict.fromkeys(suggestions))
+
+
+def index_statement(table: str, method: str, columns: Sequence[str]) -> str:
+    """CREATE INDEX for a suggestion."""
+    if method == "trgm":
+        return (f"CREATE INDEX IF NOT EXISTS {table}_{columns[0]}_trgm_idx ON {table} "
+                f"USING gin ({columns[0]} gin_trgm_ops)")
+    return f"CREATE INDEX IF NOT EXISTS {table}_{'_'.join(columns)}_idx ON {table} ({', '.join(columns)})"
+
+
+def is_covered(table: str, method: str, columns: Sequence[str], index_definitions: Dict[str, List[str]]) -> bool:
+    """Whether an existing index (pg_indexes.indexdef) already serves the
+    suggestion: a btree starting with the same columns, or a trigram index
+    on the column."""
+    for definition in index_definitions.get(table, []):
+        match = _INDEX_DEF_RE.search(definition)
+        if match is None:
+            continue
+        index_method = match.group(1).lower()
+        index_columns = [column.strip() for column in match.group(2).split(",")]
+        if method == "trgm":
+            if any(column.split()[0] == columns[0] and column.endswith("_trgm_ops") for column in index_columns):
+                return True
+        elif index_method == "btree" and index_columns[:len(columns)] == list(columns):
+            return True
+    return False
+
+
+class PlanStore:
+    """SQLite store of captured plans, the newest max_per_shape per shape."""
+
+    def __init__(self, path: pathlib.Path = DEFAULT_PLAN_STORE_PATH, max_per_shape: int = 20):
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_per_shape = max_per_shape
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(str(path), check_same_thread=False)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS plans (
+                plan_id INTEGER PRIMARY KEY, captured_at REAL NOT NULL, shape_id TEXT NOT NULL,
+                shape TEXT NOT NULL, params TEXT, duration_ms REAL NOT NULL, plan TEXT NOT NULL)""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS plans_shape_idx ON plans (shape_id, captured_at)")
+        self.connection.commit()
+
+    def add(self, shape: str, params: object, duration_ms: float, explain: List[dict]) -> None:
+        """Store one capture, keeping only the newest max_per_shape of its shape."""
+        key = shape_id(shape)
+        with self._lock:
+            self.connection.execute("""INSERT INTO plans (captured_at, shape_id, shape, params, duration_ms, plan)
+                    VALUES (?, ?, ?, ?, ?, ?)""", (time.time(), key, shape, json.dumps(params, default=str),
+                                                    duration_ms, json.dumps(explain)))
+            self.connection.execute("""DELETE FROM plans WHERE shape_id = ? AND plan_id NOT IN (
+                    SELECT plan_id FROM plans WHERE shape_id = ? ORDER BY captured_at DESC LIMIT ?)""",
+                                    (key, key, self.max_per_shape))
+            self.connection.commit()
+
+    def shapes(self) -> List[Tuple[str, str, int, float, float]]:
+        """(shape_id, shape, captures, max_ms, mean_ms), slowest first."""
+        with self._lock:
+            return self.connection.execute("""SELECT shape_id, shape, count(*), max(duration_ms), avg(duration_ms)
+                    FROM plans GROUP BY shape_id, shape ORDER BY max(duration_ms) DESC""").fetchall()
+
+    def captures(self, key: Optional[str] = None) -> List[Tuple[float, str, str, float, List[dict]]]:
+        """(captured_at, shape, params, duration_ms, plan), newest first, of
+        one shape or of all."""
+        sql = "SELECT captured_at, shape, params, duration_ms, plan FROM plans"
+        args: Tuple = ()
+        if key is not None:
+            sql += " WHERE shape_id = ?"
+            args = (key,)
+        with self._lock:
+            rows = self.connection.execute(sql + " ORDER BY captured_at DESC", args).fetchall()
+        return [(captured_at, shape, params, duration_ms, json.loads(plan))
+                for captured_at, shape, params, duration_ms, plan in rows]
+
+    def clear(self) -> None:
+        """Delete every captured plan."""
+        with self._lock:
+            self.connection.execute("DELETE FROM plans")
+            self.connection.commit()
+
+    def close(self) -> None:
+        """Close the SQLite file."""
+        with self._lock:
+            self.connection.close()
+
+
+class DiagnosticCursor(extensions.cursor):
+    """Cursor that hands queries slower than the diagnostics threshold to
+    QueryDiagnostics.capture()."""
+    diagnostics: Optional["QueryDiagnostics"] = None
+
+    def execute(self, query, vars=None):  # pylint: disable=redefined-builtin
+        """cursor.execute(), timed; slow queries are captured after it returns."""
+        started = time.perf_counter()
+        result = super().execute(query, vars)
+        duration_ms = (time.perf_counter() - started) * 1000
+        diagnostics = self.diagnostics
+        if diagnostics is not None and duration_ms >= diagnostics.threshold_ms:
+            diagnostics.capture(self.connection, query, vars, duration_ms)
+        return result
+
+
+class QueryDiagnostics:
+    """Captures plans of slow queries into a PlanStore and advises on them.
+
+    statements, if given, is the PreparedStatements registry used to file
+    EXECUTEs under the prepared SQL.
+    """
+
+    def __init__(self, store: PlanStore, threshold_ms: float = 100.0, statements=None):
+        self.store = store
+        self.threshold_ms = threshold_ms
+        self.statements = statements
+        self.captured = 0
+
+    def cursor(self, connection) -> DiagnosticCursor:
+        """A new capturing cursor on connection."""
+        cursor = connection.cursor(cursor_factory=DiagnosticCursor)
+        cursor.diagnostics = self
+        return cursor
+
+    def _shape(self, sql: str) -> str:
+        match = _EXECUTE_RE.match(sql)
+        if match and self.statements is not None:
+            prepared = self.statements.sql_for(match.group(1))
+            if prepared is not None:
+                return query_shape(prepared)
+        return query_shape(sql)
+
+    def capture(self, connection, query: object, params: object, duration_ms: float) -> None:
+        """EXPLAIN (ANALYZE, BUFFERS) query again and store the plan. Never
+        raises; a failed EXPLAIN is rolled back to a savepoint and logged."""
+        if isinstance(query, bytes):
+            query = query.decode("utf-8", "replace")
+        if not isinstance(query, str) or not is_read_query(query):
+            return
+        in_transaction = not connection.autocommit
+        cursor = connection.cursor()
+        try:
+            if in_transaction:
+                cursor.execute("SAVEPOINT kdb_diagnostics")
+            try:
+                cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query, params)
+                explain = cursor.fetchone()[0]
+            except Exception:  # pylint: disable=broad-except
+                if in_transaction:
+                    cursor.execute("ROLLBACK TO SAVEPOINT kdb_diagnostics")
+                logger.warning("Could not explain slow query (%.0f ms)", duration_ms, exc_info=True)
+                return
+            finally:
+                if in_transaction:
+                    cursor.execute("RELEASE SAVEPOINT kdb_diagnostics")
+            self.store.add(self._shape(query), params, duration_ms, explain)
+            self.captured += 1
+            logger.info("Captured plan of a %.0f ms query", duration_ms)
+        except Exception:  # pylint: disable=broad-except
+            logger.warning("Query diagnostics failed", exc_info=True)
+        finally:
+            cursor.close()
+
+    def advise(self, index_definitions: Dict[str, List[str]]) -> List[Dict[str, object]]:
+        """Index suggestions across every stored plan, minus those existing
+        indexes already cover: {"statement", "shapes", "captures",
+        "seq_scan_ms", "requires"}, most scan time first. requires names an
+        extension the index needs ("pg_trgm"), or is ""."""
+        advice: Dict[str, Dict[str, object]] = {}
+        for _captured_at, shape, _params, _duration_ms, explain in self.store.captures():
+            scan_ms = sum(scan["ms"] for scan in summarize_plan(explain)["seq_scans"])
+            for table, method, columns in suggest_indexes(explain):
+                if is_covered(table, method, columns, index_definitions):
+                    continue
+                statement = index_statement(table, method, columns)
+                entry = advice.setdefault(statement, {"statement": statement, "shapes": set(), "captures": 0,
+                                                      "seq_scan_ms": 0.0,
+                                                      "requires": "pg_trgm" if method == "trgm" else ""})
+                entry["shapes"].add(shape_id(shape))
+                entry["captures"] += 1
+                entry["seq_scan_ms"] += scan_ms
+        for entry in advice.values():
+            entry["shapes"] = len(entry["shapes"])
+        return sorted(advice.values(), key=lambda entry: entry["seq_scan_ms"], reverse=True)
+
+    def export(self, path: pathlib.Path, index_definitions: Dict[str, List[str]]) -> int:
+        """Write every capture (with its summary and suggestions) and the
+        overall advice as JSON lines. Returns the number of captures."""
+        captures = self.store.captures()
+        with open(path, "w", encoding="utf-8") as f_out:
+            for captured_at, shape, params, duration_ms, explain in captures:
+                f_out.write(json.dumps({
+                    "captured_at": captured_at,
+                    "shape_id": shape_id(shape),
+                    "shape": shape,
+                    "params": json.loads(params) if params else None,
+                    "duration_ms": duration_ms,
+                    "summary": summarize_plan(explain),
+                    "suggestions": [index_statement(*suggestion) for suggestion in suggest_indexes(explain)],
+                    "plan": explain,
+                }) + "\n")
+            f_out.write(json.dumps({"advice": self.advise(index_definitions)}) + "\n")
+        return len(captures)
+
+
+def plan_text(explain: List[dict]) -> str:
+    """An indented, EXPLAIN-like text rendering of a JSON plan."""
+    lines = []
+
+    def render(node: dict, depth: int) -> None:
+        label = node.get("Node Type", "?")
+        if node.get("Relation Name"):
+            label += f" on {node['Relation Name']}"
+        if node.get("Index Name"):
+            label += f" using {node['Index Name']}"
+        lines.append(f"{'  ' * depth}-> {label}  (actual {node.get('Actual Total Time', 0.0):.2f} ms, "
+                     f"rows={node.get('Actual Rows', 0)} loops={node.get('Actual Loops', 1)}, "
+                     f"buffers hit={node.get('Shared Hit Blocks', 0)} read={node.get('Shared Read Blocks', 0)})")
+        for key in ("Index Cond", "Recheck Cond", "Filter", "Rows Removed by Filter", "Sort Key", "Sort Method"):
+            if key in node:
+                value = ", ".join(node[key]) if isinstance(node[key], list) else node[key]
+                lines.append(f"{'  ' * depth}     {key}: {value}")
+        for child in node.get("Plans", []):
+            render(child, depth + 1)
+
+    render(explain[0]["Plan"], 0)
+    lines.append(f"Planning {explain[0].get('Planning Time', 0.0):.2f} ms, "
+                 f"execution {explain[0].get('Execution Time', 0.0):.2f} ms")
+    return "\n".join(lines)
@@ -0,0 +1,407 @@
+"""
+Local KiCad HTTP library server backed by the parts database.
+
+KiCad (8+) can read a library over HTTP: a .kicad_httplib file points it at
+a root URL, and it fetches categories, the parts in a category and single
+parts as JSON under <root>/v1/. LibraryServer serves those from
+DatabaseManager, so any number of KiCad clients can share one set of
+database connections instead of each opening its own ODBC connection.
+
+Responses are cached as encoded bytes with a strong ETag, so repeat
+requests cost no query at all, and a client that sends If-None-Match gets
+304 Not Modified. The cache is cleared by invalidate(ChangeEvent), which
+the GUI calls for every committed write (its own, and other sessions' via
+NOTIFY); a standalone server runs its own ChangeListener. Connections are
+HTTP/1.1 keep-alive.
+"""
+import hashlib
+import http.client
+import json
+import logging
+import pathlib
+import queue
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from caching import ChangeEvent
+from kicad_dbl import FIELD_NAMES, VISIBLE_ON_ADD
+
+logger = logging.getLogger(__name__)
+
+ROOT_PATH = "/kicad-api"
+API_VERSION = "v1"
+UNCATEGORISED_ID = "_"
+
+# Part columns KiCad knows as built-in fields, under its own (lower-case) names.
+BUILTIN_FIELDS = {"footprint_ref": "footprint", "datasheet": "datasheet", "value": "value",
+                  "description": "description"}
+EXTRA_FIELDS = ("manufacturer", "manufacturer_part_number", "manufacturer_part_url", "model_ref", "note")
+
+
+def category_id(component_type: Optional[str]) -> str:
+    """URL-safe category id for a component type (see category_name)."""
+    return urllib.parse.quote(component_type, safe="") if component_type else UNCATEGORISED_ID
+
+
+def category_name(category: str) -> str:
+    """Component type for a category id ("" for uncategorised parts)."""
+    return "" if category == UNCATEGORISED_ID else urllib.parse.unquote(category)
+
+
+def write_httplib_file(path: pathlib.Path, root_url: str, name: str = "Parts Database",
+                       token: str = "") -> None:
+    """Write the .kicad_httplib file that points KiCad at a server."""
+    definition = {
+        "meta": {"version": 1.0},
+        "name": name,
+        "description": "Parts database served by kicad_db_gui",
+        "source": {
+            "type": "REST_API",
+            "api_version": API_VERSION,
+            "root_url": root_url.rstrip("/"),
+            "token": token,
+            "timeout_parts_seconds": 60,
+            "timeout_categories_seconds": 600,
+        },
+    }
+    pathlib.Path(path).write_text(json.dumps(definition, indent=2) + "\n", encoding="utf-8")
+
+
+class ResponseCache:
+    """Encoded response bodies and their ETags, keyed by request path.
+
+    invalidate() bumps a generation; a load that started before the bump
+    doesn't store its (possibly stale) result.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[bytes, str]] = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path: str) -> Tuple[Optional[Tuple[bytes, str]], int]:
+        """((body, etag) or None, current generation) for path."""
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry, self._generation
+
+    def put(self, path: str, body: bytes, generation: int) -> Tuple[bytes, str]:
+        """Store body for path unless invalidated since generation; returns (body, etag)."""
+        entry = (body, '"' + hashlib.sha1(body).hexdigest()[:20] + '"')
+        with self._lock:
+            if generation == self._generation:
+                self._entries[path] = entry
+        return entry
+
+    def invalidate(self) -> None:
+        """Drop every entry and bump the generation."""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Many KiCad clients may connect at once; the default backlog of 5 makes
+    # the rest retry their SYN after a second or more.
+    request_queue_size = 128
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "kicad-db-gui-httplib/1.0"
+    # Headers and body go out as separate writes; with Nagle on, each
+    # keep-alive response waits out the client's delayed ACK (~40 ms).
+    disable_nagle_algorithm = True
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        """Answer a request from KiCad, checking its API token if one is set."""
+        library: "LibraryServer" = self.server.library  # type: ignore[attr-defined]
+        if library.token and self.headers.get("Authorization", "") != f"Token {library.token}":
+            self._send(401, b'{"error": "unauthorized"}', "")
+            return
+        path = urllib.parse.urlsplit(self.path).path
+        try:
+            status, body, etag = library.respond(path)
+        except Exception:  # pylint: disable=broad-except
+            logger.warning("HTTP library request for %s failed", path, exc_info=True)
+            self._send(500, b'{"error": "internal error"}', "")
+            return
+        if status == 200 and etag and etag in self.headers.get("If-None-Match", ""):
+            self._send(304, b"", etag)
+        else:
+            self._send(status, body, etag)
+
+    def _send(self, status: int, body: bytes, etag: str) -> None:
+        self.send_response(status)
+        if status != 304:
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:  # pylint: disable=redefined-builtin
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class LibraryServer:
+    """KiCad HTTP library server on its own threads.
+
+    make_db_manager returns a DatabaseManager on a new (autocommit)
+    connection; up to pool_size are opened, on demand, and shared by the
+    request threads. With a token, requests must send "Authorization: Token
+    <token>" as KiCad does when the .kicad_httplib has one.
+    """
+
+    def __init__(self, make_db_manager: Callable[[], object], host: str = "127.0.0.1", port: int = 8765,
+                 token: str = "", pool_size: int = 4):
+        self.make_db_manager = make_db_manager
+        self.token = token
+        self.pool_size = pool_size
+        self.cache = ResponseCache()
+        self._pool: "queue.LifoQueue[object]" = queue.LifoQueue()
+        self._opened = 0
+        # Every manager opened and not yet closed, idle or lent out, so stop()
+        # can close them all.
+        self._db_managers: List[object] = []
+        self._stopped = False
+        self._pool_lock = threading.Lock()
+        self._httpd = _Server((host, port), _Handler)
+        self._httpd.library = self  # type: ignore[attr-defined]
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def root_url(self) -> str:
+        """Base URL to give KiCad, as in the .kicad_httplib file."""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}{ROOT_PATH}"
+
+    def start(self) -> None:
+        """Serve on a daemon thread until stop()."""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="httplib-server", daemon=True)
+        self._thread.start()
+        logger.info("KiCad HTTP library serving at %s", self.root_url)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop serving and close every pooled connection, waiting up to
+        timeout for ones still lent to a request; any not back by then are
+        closed anyway."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        with self._pool_lock:
+            # Keep-alive connections outlive shutdown(); their requests fail.
+            self._stopped = True
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._pool_lock:
+                if not self._db_managers:
+                    break
+            try:
+                db_manager = self._pool.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            self._discard(db_manager)
+        with self._pool_lock:
+            leftover, self._db_managers = self._db_managers, []
+        if leftover:
+            logger.warning("Closing %d library connections still in use", len(leftover))
+        for db_manager in leftover:
+            _close_quietly(db_manager)
+
+    def _discard(self, db_manager) -> None:
+        with self._pool_lock:
+            if db_manager in self._db_managers:
+                self._db_managers.remove(db_manager)
+                self._opened -= 1
+        _close_quietly(db_manager)
+
+    def invalidate(self, event: Optional[ChangeEvent] = None) -> None:
+        """Drop cached responses after a committed write. Writes to tables
+        the library doesn't serve are ignored."""
+        if event is None or event.table == "parts":
+            self.cache.invalidate()
+
+    @contextmanager
+    def _db_manager(self) -> Iterator[object]:
+        """Borrow a pooled DatabaseManager, opening one if the pool is empty
+        and below pool_size, otherwise waiting for one to come back."""
+        with self._pool_lock:
+            if self._stopped:
+                raise RuntimeError("The library server has stopped")
+        try:
+            db_manager = self._pool.get_nowait()
+        except queue.Empty:
+            with self._pool_lock:
+                can_open = self._opened < self.pool_size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                try:
+                    db_manager = self.make_db_manager()
+                except Exception:
+                    with self._pool_lock:
+                        self._opened -= 1
+                    raise
+                with self._pool_lock:
+                    stopped = self._stopped
+                    if not stopped:
+                        self._db_managers.append(db_manager)
+                if stopped:
+                    _close_quietly(db_manager)
+                    raise RuntimeError("The library server has stopped") from None
+            else:
+                db_manager = self._pool.get(timeout=30)
+        try:
+            yield db_manager
+        except Exception:
+            # The connection may be broken; don't hand it out again.
+            self._discard(db_manager)
+            raise
+        self._pool.put(db_manager)
+
+    def respond(self, path: str) -> Tuple[int, bytes, str]:
+        """(status, body, etag) for a request path, from the cache when it
+        can be."""
+        prefix = f"{ROOT_PATH}/{API_VERSION}"
+        if not path.startswith(prefix):
+            return 404, b'{"error": "not found"}', ""
+        route = path[len(prefix):]
+        entry, generation = self.cache.get(route)
+        if entry is not None:
+            return 200, entry[0], entry[1]
+        payload = self._load(route)
+        if payload is None:
+            return 404, b'{"error": "not found"}', ""
+        body, etag = self.cache.put(route, json.dumps(payload, separators=(",", ":")).encode("utf-8"), generation)
+        return 200, body, etag
+
+    def _load(self, route: str) -> Optional[object]:
+        if route in ("", "/"):
+            return {"categories": "", "parts": ""}
+        if route == "/categories.json":
+            with self._db_manager() as db_manager:
+                counts = db_manager.get_component_type_counts()
+            return [{"id": category_id(component_type), "name": component_type or "Uncategorised",
+                     "description": f"{count} parts"}
+                    for component_type, count in sorted(counts.items(), key=lambda item: item[0].lower())]
+        if route.startswith("/parts/category/") and route.endswith(".json"):
+            component_type = category_name(route[len("/parts/category/"):-len(".json")])
+            with self._db_manager() as db_manager:
+                rows = db_manager.get_category_parts(component_type)
+            return [{"id": urllib.parse.quote(kicad_part_number, safe=""), "name": kicad_part_number,
+                     "description": description or ""} for kicad_part_number, description in rows] or None
+        if route.startswith("/parts/") and route.endswith(".json"):
+            kicad_part_number = urllib.parse.unquote(route[len("/parts/"):-len(".json")])
+            with self._db_manager() as db_manager:
+                result = db_manager.get_part(kicad_part_number)
+            return part_detail(result[0]) if result is not None else None
+        return None
+
+
+def _close_quietly(db_manager) -> None:
+    try:
+        db_manager.db_connection.close()
+    except Exception:  # pylint: disable=broad-except
+        pass
+
+
+def part_detail(part) -> Dict[str, object]:
+    """A Part in the shape KiCad expects from /parts/<id>.json."""
+    fields: Dict[str, Dict[str, str]] = {}
+    for column, name in BUILTIN_FIELDS.items():
+        fields[name] = {"value": getattr(part, column) or "", "visible": str(column in VISIBLE_ON_ADD)}
+    for column in EXTRA_FIELDS:
+        value = getattr(part, column)
+        if value:
+            fields[FIELD_NAMES.get(column, column)] = {"value": value, "visible": "False"}
+    return {
+        "id": urllib.parse.quote(part.kicad_part_number, safe=""),
+        "name": part.kicad_part_number,
+        "symbolIdStr": part.symbol_ref,
+        "exclude_from_bom": str(bool(part.exclude_from_bom)),
+        "exclude_from_board": str(bool(part.exclude_from_board)),
+        "exclude_from_sim": str(bool(part.exclude_from_sim)),
+        "fields": fields,
+    }
+
+
+def benchmark_server(root_url: str, paths: List[str], clients: int = 50, requests_per_client: int = 200,
+                     conditional: bool = False) -> Dict[str, float]:
+    """Hammer a server with clients concurrent keep-alive connections, each
+    cycling through paths (relative to root_url/v1). With conditional, a
+    client revalidates with If-None-Match once it has an ETag, as a caching
+    client would. Returns requests/s, p50/p95/max latency in milliseconds,
+    and the error and 304 counts."""
+    parts = urllib.parse.urlsplit(root_url)
+    base = f"{parts.path}/{API_VERSION}"
+    timings: List[float] = []
+    counts = {"errors": 0, "not_modified": 0}
+    lock = threading.Lock()
+    start_gate = threading.Event()
+
+    def client(index: int) -> None:
+        connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=30)
+        etags: Dict[str, str] = {}
+        local: List[float] = []
+        errors = not_modified = 0
+        start_gate.wait()
+        for request in range(requests_per_client):
+            path = base + paths[(index + request) % len(paths)]
+            headers = {"If-None-Match": etags[path]} if conditional and path in etags else {}
+            started = time.perf_counter()
+            try:
+                connection.request("GET", path, headers=headers)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                errors += 1
+                connection.close()
+                continue
+            local.append((time.perf_counter() - started) * 1000)
+            if response.status == 304:
+                not_modified += 1
+            elif response.status != 200:
+                errors += 1
+            elif response.getheader("ETag"):
+                etags[path] = response.getheader("ETag")
+        connection.close()
+        with lock:
+            timings.extend(local)
+            counts["errors"] += errors
+            counts["not_modified"] += not_modified
+
+    threads = [threading.Thread(target=client, args=(index,), daemon=True) for index in range(clients)]
+    for thread in threads:
+        thread.start()
+    started = time.perf_counter()
+    start_gate.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    timings.sort()
+    results = {
+        "clients": clients,
+        "requests": len(timings),
+        "requests_per_second": len(timings) / elapsed if elapsed else 0.0,
+        "p50_ms": timings[len(timings) // 2] if timings else 0.0,
+        "p95_ms": timings[min(len(timings) - 1, int(0.95 * len(timings)))] if timings else 0.0,
+        "max_ms": timings[-1] if timings else 0.0,
+        "errors": counts["errors"],
+        "not_modified": counts["not_modified"],
+    }
+    logger.info("HTTP library benchmark: %s", results)
+    return results
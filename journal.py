@@ -0,0 +1,332 @@
+"""
+Undo/redo journal for edits made through DatabaseManager.
+
+Each user action (one part edit, a bulk edit of hundreds of parts, a merge)
+is recorded as one group of operations. Each op holds enough to be inverted:
+
+    {"op": "u", "t": "parts", "k": <kicad_part_number>, "b": {<col>: <before>}, "a": {<col>: <after>}}
+    {"op": "i", "t": "parts"|"module", "r": {<full row>}, ...}
+    {"op": "d", "t": "parts"|"module", "r": {<full row>}, ...}
+
+Updates keep only the columns that changed. Inserts and deletes keep the whole
+row, as produced by to_jsonb(), so an undone delete comes back with its
+original UUID. Undo applies the group's inverse ops in reverse order, and
+redo applies the ops again. Either way DatabaseManager.apply_journal_ops()
+runs the whole group in a single transaction.
+
+On disk the journal is an append-only JSON-lines file: one line per recorded
+group, plus a short {"u": id} / {"r": id} line per undo/redo. Replaying it on
+start-up rebuilds the stacks, so history survives restarts. The file is
+rewritten to just the live history when it grows well past it.
+"""
+import json
+import logging
+import pathlib
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from psycopg2.extras import Json, execute_values
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOURNAL_DIR = pathlib.Path.home() / ".local" / "share" / "kicad_db_gui"
+
+# Tables the journal may write to; names from the file never reach SQL otherwise.
+JOURNAL_TABLES = {"parts", "module"}
+
+
+def journal_path_for(connection_settings: Dict[str, object], directory: pathlib.Path = DEFAULT_JOURNAL_DIR) -> pathlib.Path:
+    """One journal per database, so history never replays against the wrong one."""
+    name = f"{connection_settings.get('db_host', 'localhost')}_{connection_settings.get('db_port', 5432)}_" \
+           f"{connection_settings.get('db_database', '')}"
+    return directory / ("journal_" + re.sub(r"[^A-Za-z0-9_.-]+", "_", name) + ".jsonl")
+
+
+def invert(op: dict) -> dict:
+    """The operation that undoes op."""
+    if op["op"] == "u":
+        return dict(op, b=op["a"], a=op["b"])
+    return dict(op, op="d" if op["op"] == "i" else "i")
+
+
+class JournalConflictError(Exception):
+    """Raised when rows an undo/redo would touch have changed since."""
+
+
+class EditJournal:
+    """Undo/redo stacks of operation groups, persisted as an append-only log.
+
+    record() is called by DatabaseManager after each committed write; undo()
+    and redo() take the DatabaseManager to replay through. The log file stays
+    open until close(); use the journal as a context manager to close it.
+    """
+
+    def __init__(self, path: pathlib.Path, max_depth: int = 200):
+        self.path = pathlib.Path(path)
+        self.max_depth = max_depth
+        self._groups: Dict[int, Tuple[str, List[dict]]] = {}
+        self._undo: List[int] = []
+        self._redo: List[int] = []
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        lines = self._load()
+        if lines > 4 * max(len(self._groups), 1) + 1000:
+            self._compact()
+        # Held open for appends until close() (or the end of a with block).
+        self._file = open(self.path, "a", encoding="utf-8")  # pylint: disable=consider-using-with
+
+    def _load(self) -> int:
+        """Rebuild the stacks by replaying the log. Returns its line count."""
+        if not self.path.exists():
+            return 0
+        count = 0
+        with open(self.path, encoding="utf-8") as f_in:
+            for line in f_in:
+                count += 1
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    logger.warning("Skipping damaged journal line %d in %s", count, self.path)
+                    continue
+                if "g" in entry:
+                    self._push(entry["g"], entry.get("l", ""), entry.get("o", []))
+                elif entry.get("u") in self._groups and self._undo and self._undo[-1] == entry["u"]:
+                    self._redo.append(self._undo.pop())
+                elif entry.get("r") in self._groups and self._redo and self._redo[-1] == entry["r"]:
+                    self._undo.append(self._redo.pop())
+        return count
+
+    def _push(self, group_id: int, label: str, ops: List[dict]) -> None:
+        self._groups[group_id] = (label, ops)
+        self._undo.append(group_id)
+        for dropped in self._redo:
+            self._groups.pop(dropped, None)
+        self._redo = []
+        while len(self._undo) > self.max_depth:
+            self._groups.pop(self._undo.pop(0), None)
+        self._next_id = max(self._next_id, group_id + 1)
+
+    def _compact(self) -> None:
+        """Rewrite the log as just the live history (temp file + rename)."""
+        temp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(temp_path, "w", encoding="utf-8") as f_out:
+            for group_id in self._undo + self._redo[::-1]:
+                label, ops = self._groups[group_id]
+                f_out.write(self._dumps({"g": group_id, "l": label, "o": ops}))
+            # Redo stack is bottom-first; the group undone first sits at the bottom.
+            for group_id in self._redo:
+                f_out.write(self._dumps({"u": group_id}))
+        temp_path.replace(self.path)
+        logger.info("Compacted edit journal %s to %d groups", self.path, len(self._groups))
+
+    @staticmethod
+    def _dumps(entry: dict) -> str:
+        return json.dumps(entry, separators=(",", ":"), default=str) + "\n"
+
+    def _append(self, entry: dict) -> None:
+        self._file.write(self._dumps(entry))
+        self._file.flush()
+
+    def record(self, label: str, ops: List[dict]) -> None:
+        """Add a committed group. Clears the redo stack, as editors do."""
+        if not ops:
+            return
+        with self._lock:
+            group_id = self._next_id
+            self._push(group_id, label, ops)
+            self._append({"g": group_id, "l": label, "o": ops})
+
+    @property
+    def undo_label(self) -> Optional[str]:
+        """Label of the group undo() would revert, or None."""
+        with self._lock:
+            return self._groups[self._undo[-1]][0] if self._undo else None
+
+    @property
+    def redo_label(self) -> Optional[str]:
+        """Label of the group redo() would re-apply, or None."""
+        with self._lock:
+            return self._groups[self._redo[-1]][0] if self._redo else None
+
+    def undo(self, db_manager) -> Optional[str]:
+        """Revert the latest group in one transaction. Returns its label, or
+        None if there is nothing to undo. On JournalConflictError nothing is
+        changed and the group stays on the undo stack."""
+        with self._lock:
+            if not self._undo:
+                return None
+            group_id = self._undo[-1]
+            label, ops = self._groups[group_id]
+        db_manager.apply_journal_ops([invert(op) for op in reversed(ops)])
+        with self._lock:
+            self._redo.append(self._undo.pop())
+            self._append({"u": group_id})
+        return label
+
+    def redo(self, db_manager) -> Optional[str]:
+        """Re-apply the most recently undone group in one transaction."""
+        with self._lock:
+            if not self._redo:
+                return None
+            group_id = self._redo[-1]
+            label, ops = self._groups[group_id]
+        db_manager.apply_journal_ops(ops)
+        with self._lock:
+            self._undo.append(self._redo.pop())
+            self._append({"r": group_id})
+        return label
+
+    def close(self) -> None:
+        """Close the log file. Every entry is already flushed as it is
+        appended; the journal can't record after this."""
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self) -> "EditJournal":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def journal_columns(row_before: dict, row_after: dict, columns: List[str]) -> Tuple[Dict[str, object], Dict[str, object]]:
+    """Before/after values of the given columns, keeping only those that
+    actually changed."""
+    changed = [column for column in columns if row_before.get(column) != row_after.get(column)]
+    return {column: row_before.get(column) for column in changed}, {column: row_after.get(column) for column in changed}
+
+
+def update_ops(rows: List[Tuple], columns: List[str]) -> List[dict]:
+    """Update ops from (kicad_part_number, to_jsonb(old), to_jsonb(new))
+    RETURNING rows, skipping rows where nothing changed."""
+    ops = []
+    for kicad_part_number, before, after in rows:
+        old_values, new_values = journal_columns(before, after, columns)
+        if new_values:
+            ops.append({"op": "u", "t": "parts", "k": kicad_part_number, "b": old_values, "a": new_values})
+    return ops
+
+
+class JournalOpsMixin:
+    """Applies journal ops for DatabaseManager (undo/redo), through its
+    cursor and _commit."""
+
+    def apply_journal_ops(self, ops: List[dict]) -> None:
+        """Apply journal ops (see journal.py) for undo/redo, all in one
+        transaction. Consecutive updates of the same columns go out as one
+        UPDATE however many parts they cover. If any row no longer holds the
+        values an op expects (someone has edited it since), nothing is
+        applied and JournalConflictError is raised."""
+        tables = set()
+        touched: List[Optional[str]] = []
+        try:
+            index = 0
+            while index < len(ops):
+                op = ops[index]
+                if op.get("t") not in JOURNAL_TABLES:
+                    raise ValueError(f"Journal op on unknown table: {op.get('t')}")
+                tables.add(op["t"])
+                if op["op"] == "u":
+                    run = [op]
+                    while index + len(run) < len(ops) and ops[index + len(run)]["op"] == "u" \
+                            and set(ops[index + len(run)]["a"]) == set(op["a"]):
+                        run.append(ops[index + len(run)])
+                    touched += self._apply_journal_updates(run, sorted(op["a"]))
+                    index += len(run)
+                    continue
+                if op["t"] == "parts":
+                    touched += self._apply_journal_part_row(op)
+                    tables.add("module_parts")
+                else:
+                    self._apply_journal_module_row(op)
+                    tables.add("module_parts")
+                index += 1
+            self._commit(*sorted(tables), component_types=touched)
+        except Exception:
+            self.db_connection.rollback()
+            raise
+
+    def _apply_journal_updates(self, run: List[dict], columns: List[str]) -> List[Optional[str]]:
+        """One UPDATE for a run of update ops on the same columns, guarded on
+        each row still holding the op's "b" values."""
+        unknown = set(columns) - set(self.PART_EDIT_COLUMNS)
+        if unknown:
+            raise ValueError(f"Journal op on unknown columns: {', '.join(sorted(unknown))}")
+        assignments = ", ".join(f"{column} = n.{column}" for column in columns)
+        current = ", ".join(f"p.{column}" for column in columns)
+        expected = ", ".join(f"e.{column}" for column in columns)
+        self.cursor.execute(f"""UPDATE parts AS p SET {assignments}
+                FROM jsonb_populate_recordset(NULL::parts, %s::jsonb) AS n
+                JOIN jsonb_populate_recordset(NULL::parts, %s::jsonb) AS e USING (kicad_part_number), parts AS old
+                WHERE p.kicad_part_number = n.kicad_part_number AND old.parts_uuid = p.parts_uuid
+                  AND ROW({current}) IS NOT DISTINCT FROM ROW({expected})
+                RETURNING old.component_type, p.component_type""",
+                            (Json([dict(op["a"], kicad_part_number=op["k"]) for op in run]),
+                             Json([dict(op["b"], kicad_part_number=op["k"]) for op in run])))
+        rows = self.cursor.fetchall()
+        if len(rows) != len(run):
+            raise JournalConflictError(f"{len(run) - len(rows)} of {len(run)} parts have been changed since")
+        return [ct for row in rows for ct in row]
+
+    def _apply_journal_part_row(self, op: dict) -> List[Optional[str]]:
+        """Re-insert or delete a whole part. "links" are the modules that used
+        it before it was merged into "to": re-inserting points them back at
+        it, deleting points them at "to" first."""
+        row = op["r"]
+        if op["op"] == "i":
+            self.cursor.execute("""INSERT INTO parts SELECT * FROM jsonb_populate_record(NULL::parts, %s::jsonb)
+                    ON CONFLICT DO NOTHING RETURNING component_type""", (Json(row),))
+            if self.cursor.fetchone() is None:
+                raise JournalConflictError(f"Part {row.get('kicad_part_number')} already exists")
+            for module_uuid in op.get("links", []):
+                self.cursor.execute("""UPDATE module_parts SET part_uuid = %s
+                        WHERE ctid = (SELECT ctid FROM module_parts WHERE module_uuid = %s AND part_uuid =
+                            (SELECT parts_uuid FROM parts WHERE kicad_part_number = %s) LIMIT 1)""",
+                                    (row["parts_uuid"], module_uuid, op["to"]))
+            return [row.get("component_type")]
+
+        if op.get("links"):
+            self.cursor.execute("""UPDATE module_parts SET part_uuid =
+                        (SELECT parts_uuid FROM parts WHERE kicad_part_number = %s)
+                    WHERE part_uuid = %s""", (op["to"], row["parts_uuid"]))
+        current = ", ".join(f"p.{column}" for column in self.PART_EDIT_COLUMNS)
+        expected = ", ".join(f"e.{column}" for column in self.PART_EDIT_COLUMNS)
+        self.cursor.execute(f"""DELETE FROM parts AS p USING jsonb_populate_record(NULL::parts, %s::jsonb) AS e
+                WHERE p.kicad_part_number = e.kicad_part_number
+                  AND ROW({current}) IS NOT DISTINCT FROM ROW({expected})
+                RETURNING p.component_type""", (Json(row),))
+        if self.cursor.fetchone() is None:
+            raise JournalConflictError(f"Part {row.get('kicad_part_number')} has been changed or removed since")
+        return [row.get("component_type")]
+
+    def _apply_journal_module_row(self, op: dict) -> None:
+        """Re-insert or delete a module together with its part list."""
+        row = op["r"]
+        if op["op"] == "i":
+            self.cursor.execute("""INSERT INTO module SELECT * FROM jsonb_populate_record(NULL::module, %s::jsonb)
+                    ON CONFLICT DO NOTHING RETURNING module_uuid""", (Json(row),))
+            if self.cursor.fetchone() is None:
+                raise JournalConflictError(f"Module {row.get('kicad_part_number')} already exists")
+            if op.get("parts"):
+                execute_values(self.cursor, "INSERT INTO module_parts (module_uuid, part_uuid) VALUES %s",
+                               [(row["module_uuid"], part_uuid) for part_uuid in op["parts"]],
+                               template="(%s::uuid, %s::uuid)", page_size=len(op["parts"]))
+            return
+        # Only delete the module as recorded: same columns, same part list and
+        # not nested in (or holding) other modules, which would cascade.
+        self.cursor.execute("""SELECT to_jsonb(m) @> %s::jsonb,
+                    (SELECT coalesce(array_agg(mp.part_uuid::text ORDER BY mp.part_uuid::text), '{}')
+                     FROM module_parts AS mp WHERE mp.module_uuid = m.module_uuid),
+                    EXISTS (SELECT 1 FROM module_submodules AS s
+                            WHERE m.module_uuid IN (s.parent_module_uuid, s.child_module_uuid))
+                FROM module AS m WHERE m.module_uuid = %s FOR UPDATE""", (Json(row), row["module_uuid"]))
+        current = self.cursor.fetchone()
+        if current is None:
+            raise JournalConflictError(f"Module {row.get('kicad_part_number')} has been removed since")
+        unchanged, part_uuids, nested = current
+        if not unchanged or part_uuids != sorted(str(part_uuid) for part_uuid in op.get("parts", [])) or nested:
+            raise JournalConflictError(f"Module {row.get('kicad_part_number')} has been changed since")
+        self.cursor.execute("DELETE FROM module_parts WHERE module_uuid = %s", (row["module_uuid"],))
+        self.cursor.execute("DELETE FROM module WHERE module_uuid = %s", (row["module_uuid"],))
@@ -1,6 +1,23 @@
+import atexit
+import collections
 import datetime as dt
+import gzip
 import json
 import logging
+import logging.handlers
+import os
+import queue
+import random
+import shutil
+import sys
+import threading
+import time
+import traceback
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 LOG_RECORD_BUILTIN_ATTRS = {
     "args",
@@ -74,3 +91,238 @@ class NonErrorFilter(logging.Filter):
 
     def filter(self, record: logging.LogRecord):
         return record.levelno <= logging.INFO
+
+
+def _level_number(level) -> int:
+    return level if isinstance(level, int) else logging.getLevelName(str(level).upper())
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per call site: records below `level` pass at up to `rate`
+    per second, with bursts of up to `burst`. The next record let through
+    from a throttled call site carries `suppressed`, the number dropped in
+    between. Configure on a logger (not a handler), so dropped records are
+    never formatted."""
+
+    def __init__(self, name: str = "", *, rate: float = 10.0, burst=None, level="WARNING"):
+        super().__init__(name)
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1.0))
+        self.levelno = _level_number(level)
+        self._buckets = {}  # (pathname, lineno) -> [tokens, last refill, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord):
+        if record.levelno >= self.levelno or not super().filter(record):
+            return True
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, record.created, 0]
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (record.created - bucket[1]) * self.rate)
+                bucket[1] = record.created
+            if bucket[0] < 1.0:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1.0
+            suppressed, bucket[2] = bucket[2], 0
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class SampleFilter(logging.Filter):
+    """Let through a random `rate` fraction of records below `level`. Kept
+    records carry `sample_rate`, so counts can be scaled back up."""
+
+    def __init__(self, name: str = "", *, rate: float = 0.1, level="INFO"):
+        super().__init__(name)
+        self.rate = float(rate)
+        self.levelno = _level_number(level)
+
+    def filter(self, record: logging.LogRecord):
+        if record.levelno >= self.levelno or not super().filter(record):
+            return True
+        if random.random() >= self.rate:
+            return False
+        record.sample_rate = self.rate
+        return True
+
+
+class DeduplicateFilter(logging.Filter):
+    """Drop repeats of a message (same logger, level and text) seen within
+    the last `window` seconds. Dropped repeats are reported, never lost: the
+    next time the message is logged it carries `repeated`, the number dropped
+    since it was last logged; if it isn't, a copy of the last repeat is
+    emitted with `repeated` and " (repeated N more times)" once the window
+    ends, just before a different message is logged, or on flush() (run at
+    exit). Only the `max_messages` most recent distinct messages are
+    remembered. Configure on a logger (not a handler), since the reports are
+    emitted through the record's logger."""
+
+    def __init__(self, name: str = "", *, window: float = 10.0, level="ERROR", max_messages: int = 1000):
+        super().__init__(name)
+        self.window = float(window)
+        self.levelno = _level_number(level)
+        self.max_messages = max_messages
+        self._seen = collections.OrderedDict()  # key -> [last logged, repeated, last repeat]
+        self._lock = threading.Lock()
+        self._timer = None
+        atexit.register(self.flush)
+
+    def filter(self, record: logging.LogRecord):
+        if record.levelno >= self.levelno or hasattr(record, "repeated") or not super().filter(record):
+            return True
+        key = (record.name, record.levelno, record.getMessage())
+        with self._lock:
+            seen = self._seen.get(key)
+            if seen is not None and record.created - seen[0] < self.window:
+                seen[1] += 1
+                seen[2] = record
+                self._schedule(seen[0] + self.window)
+                return False
+            repeated = seen[1] if seen is not None else 0
+            reports = self._take(lambda other: other != key)
+            self._seen[key] = [record.created, 0, None]
+            self._seen.move_to_end(key)
+            if len(self._seen) > self.max_messages:
+                _, (_, evicted_count, evicted_record) = self._seen.popitem(last=False)
+                if evicted_count:
+                    reports.append((evicted_record, evicted_count))
+        self._emit(reports)
+        if repeated:
+            record.repeated = repeated
+        return True
+
+    def flush(self):
+        """Report every message with repeats still pending."""
+        with self._lock:
+            reports = self._take(lambda key: True)
+        self._emit(reports)
+
+    def _flush_expired(self):
+        now = time.time()
+        with self._lock:
+            self._timer = None
+            reports = self._take(lambda key: now - self._seen[key][0] >= self.window)
+            pending = [seen[0] + self.window for seen in self._seen.values() if seen[1]]
+            if pending:
+                self._schedule(min(pending))
+        self._emit(reports)
+
+    def _take(self, predicate):
+        """(last repeat, count) for each pending message matching predicate,
+        resetting their counts. Caller holds the lock."""
+        reports = []
+        for key, seen in self._seen.items():
+            if seen[1] and predicate(key):
+                reports.append((seen[2], seen[1]))
+                seen[1], seen[2] = 0, None
+        return reports
+
+    def _schedule(self, due: float):
+        """Make sure _flush_expired runs by `due`. Caller holds the lock."""
+        if self._timer is None:
+            self._timer = threading.Timer(max(0.0, due - time.time()), self._flush_expired)
+            self._timer.daemon = True
+            self._timer.start()
+
+    @staticmethod
+    def _emit(reports):
+        for last, count in reports:
+            report = logging.makeLogRecord(last.__dict__)
+            report.msg, report.args = "%s (repeated %d more times)", (last.getMessage(), count)
+            report.repeated = count
+            logging.getLogger(last.name).handle(report)
+
+
+class CompressingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """RotatingFileHandler whose backups are compressed, as app.log.jsonl.1.gz
+    (or .zst with compression "zstd", if zstandard is installed; gzip
+    otherwise).
+
+    Rollover only renames the full file to app.log.jsonl.pending-<ns> and
+    reopens; a background thread then shifts the older backups along and
+    compresses it into .1, so the logging caller never waits on either.
+    Backups left uncompressed by an earlier run, or by the plain
+    RotatingFileHandler, are shifted along with the rest."""
+
+    SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+
+    def __init__(self, filename, mode="a", maxBytes=0, backupCount=0, encoding=None, delay=False,
+                 errors=None, compression="gzip", compresslevel=None):
+        super().__init__(filename, mode, maxBytes, backupCount, encoding, delay, errors)
+        if compression not in self.SUFFIXES:
+            raise ValueError(f"Unknown log compression: {compression}")
+        if compression == "zstd" and zstandard is None:
+            compression = "gzip"
+        self.compression = compression
+        self.compresslevel = compresslevel
+        self.suffix = self.SUFFIXES[compression]
+        self._pending = queue.Queue()
+        self._worker = None
+        directory, name = os.path.split(self.baseFilename)
+        for leftover in sorted(entry for entry in os.listdir(directory or ".")
+                               if entry.startswith(name + ".pending-")):
+            self._enqueue(os.path.join(directory, leftover))
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        if self.backupCount > 0 and os.path.exists(self.baseFilename):
+            pending = f"{self.baseFilename}.pending-{time.time_ns()}"
+            os.rename(self.baseFilename, pending)
+            self._enqueue(pending)
+        if not self.delay:
+            self.stream = self._open()
+
+    def close(self):
+        super().close()
+        worker = self._worker
+        if worker is not None:
+            self._pending.put(None)
+            worker.join()
+            self._worker = None
+
+    def _enqueue(self, pending):
+        self._pending.put(pending)
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._compress_pending, name="log-compressor", daemon=True)
+            self._worker.start()
+
+    def _compress_pending(self):
+        while (pending := self._pending.get()) is not None:
+            try:
+                self._shift_backups()
+                self._compress(pending, f"{self.baseFilename}.1{self.suffix}")
+                os.remove(pending)
+            except OSError:
+                if logging.raiseExceptions:
+                    traceback.print_exc(file=sys.stderr)
+
+    def _shift_backups(self):
+        """Move backup i to i + 1, dropping the ones past backupCount."""
+        for number in range(self.backupCount, 0, -1):
+            for suffix in ("", ".gz", ".zst"):
+                source = f"{self.baseFilename}.{number}{suffix}"
+                if not os.path.exists(source):
+                    continue
+                if number == self.backupCount:
+                    os.remove(source)
+                else:
+                    os.replace(source, f"{self.baseFilename}.{number + 1}{suffix}")
+
+    def _compress(self, source, destination):
+        temporary = destination + ".tmp"
+        with open(source, "rb") as f_in, open(temporary, "wb") as f_out:
+            if self.compression == "zstd":
+                compressor = zstandard.ZstdCompressor(level=self.compresslevel or 3)
+                compressor.copy_stream(f_in, f_out)
+            else:
+                with gzip.GzipFile(fileobj=f_out, mode="wb", compresslevel=self.compresslevel or 6,
+                                   filename="", mtime=0) as f_gzip:
+                    shutil.copyfileobj(f_in, f_gzip, 1 << 20)
+        os.replace(temporary, destination)
@@ -0,0 +1,404 @@
+"""
+Generates the KiCad database library definition (.kicad_dbl) and the
+per-component-type SQL views it points KiCad at.
+
+Each component type becomes one KiCad library backed by a view
+kicad_lib_<type>. After the first full build, regenerate() only redoes the
+categories named in the change events it has been fed (see mark_dirty), so
+keeping the library in sync after an edit costs a couple of small queries
+and a rewrite of a small JSON file.
+
+With materialized=True the views are materialized views with a unique index
+on the part number, so KiCad's per-part lookups become a single index probe
+on a category-sized table instead of a filtered scan of parts. They are
+recorded in kicad_library_views, and every DatabaseManager commit that
+writes parts brings the ones it touched up to date with REFRESH ...
+CONCURRENTLY, which KiCad can keep reading through, whether or not a
+generator is running in that session. In the GUI a MaterializedViewRefresher
+does that on its own connection so the GUI doesn't wait for it.
+"""
+import hashlib
+import json
+import logging
+import pathlib
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from caching import ChangeEvent
+
+logger = logging.getLogger(__name__)
+
+LIBRARY_VIEW_PREFIX = "kicad_lib_"
+
+# Columns that only exist for this tool's own bookkeeping; never exposed to KiCad.
+HIDDEN_COLUMNS = {"parts_uuid", "value_magnitude", "value_unit", "value_sort_key", "part_number_sort_key"}
+
+# Columns KiCad gets through the library definition itself rather than as fields.
+KEY_COLUMN = "kicad_part_number"
+SYMBOL_COLUMN = "symbol_ref"
+FOOTPRINT_COLUMN = "footprint_ref"
+PROPERTY_COLUMNS = {
+    "description": "description",
+    "exclude_from_bom": "exclude_from_bom",
+    "exclude_from_board": "exclude_from_board",
+    "exclude_from_sim": "exclude_from_sim",
+}
+
+# Display names for known field columns; any other column in the live schema
+# is exposed under its own name.
+FIELD_NAMES = {
+    "value": "Value",
+    "datasheet": "Datasheet",
+    "manufacturer": "Manufacturer",
+    "manufacturer_part_number": "MPN",
+    "manufacturer_part_url": "Manufacturer URL",
+    "model_ref": "Model",
+    "note": "Note",
+    "component_type": "Component Type",
+}
+
+# Fields shown when placing a part; the rest only appear in the chooser.
+VISIBLE_ON_ADD = {"value"}
+
+
+# Longest view name used, leaving room for the "_key_idx" of its index within
+# Postgres' 63-byte identifiers (longer ones are silently truncated).
+MAX_VIEW_NAME = 55
+
+
+def _name_hash(component_type: str) -> str:
+    return hashlib.sha1((component_type or "").encode("utf-8")).hexdigest()[:6]
+
+
+def view_name_for(component_type: str, disambiguate: bool = False) -> str:
+    """SQL view name for a component type: kicad_lib_ plus a lower-case slug,
+    with a short hash of the exact type name appended when disambiguate is
+    set or the name would be too long."""
+    slug = re.sub(r"[^a-z0-9]+", "_", (component_type or "").lower()).strip("_")
+    name = LIBRARY_VIEW_PREFIX + (slug or "uncategorised")
+    if disambiguate or len(name) > MAX_VIEW_NAME:
+        name = name[:MAX_VIEW_NAME - 7] + "_" + _name_hash(component_type)
+    return name
+
+
+def view_names_for(component_types: Iterable[str]) -> Dict[str, str]:
+    """View names for a set of component types, no two the same: types whose
+    slugs collide ("OpAmp" and "Opamp", "Power Supply IC" and
+    "power-supply-ic") are all disambiguated."""
+    component_types = set(component_types)
+    by_name: Dict[str, List[str]] = {}
+    for component_type in component_types:
+        by_name.setdefault(view_name_for(component_type), []).append(component_type)
+    colliding = {component_type for shared in by_name.values() if len(shared) > 1 for component_type in shared}
+    names = {component_type: view_name_for(component_type, component_type in colliding)
+             for component_type in component_types}
+    if len(set(names.values())) < len(names):
+        # A disambiguated name can only meet another type's plain slug by
+        # coincidence; hash everything rather than guess.
+        names = {component_type: view_name_for(component_type, True) for component_type in component_types}
+    return names
+
+
+@dataclass
+class LibraryState:
+    """What the generator last built for one component type."""
+    component_type: str
+    view_name: str
+    part_count: int = 0
+    materialized: bool = False
+    # (kicad_part_number, problem) for parts whose refs can't resolve in KiCad
+    ref_problems: List[Tuple[str, str]] = field(default_factory=list)
+
+
+@dataclass
+class GenerationReport:
+    """Outcome of a generate_all()/regenerate() run."""
+    regenerated: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    ref_problems: Dict[str, List[Tuple[str, str]]] = field(default_factory=dict)
+    elapsed_ms: float = 0.0
+
+
+class KicadDblGenerator:
+    """Builds and incrementally maintains a .kicad_dbl file and its views.
+
+    db_manager is used from whichever thread calls generate_all()/regenerate();
+    mark_dirty() may be called from any thread (e.g. a ChangeListener).
+    Keeping materialized views' contents current is left to the writers (see
+    DatabaseManager._refresh_library_views); the generator only creates,
+    drops and lists them.
+    """
+
+    def __init__(self, db_manager, output_path: pathlib.Path,
+                 connection_settings: Optional[Dict[str, object]] = None,
+                 name: str = "KiCad Database Library",
+                 description: str = "Parts database managed by KiCad DB Library Manager",
+                 odbc_driver: str = "PostgreSQL Unicode",
+                 materialized: bool = False):
+        self.db_manager = db_manager
+        self.output_path = pathlib.Path(output_path)
+        self.connection_settings = connection_settings or {}
+        self.name = name
+        self.description = description
+        self.odbc_driver = odbc_driver
+        self.materialized = materialized
+        self.libraries: Dict[str, LibraryState] = {}
+        self._columns: List[str] = []
+        self._dirty: Set[str] = set()
+        self._dirty_all = True
+        self._lock = threading.Lock()
+
+    def mark_dirty(self, event: ChangeEvent) -> None:
+        """Note which categories a committed write touched. Parts writes with
+        unknown categories, and schema-level changes, dirty everything."""
+        if event.table != "parts":
+            return
+        with self._lock:
+            if event.component_types:
+                self._dirty.update(event.component_types)
+            else:
+                self._dirty_all = True
+
+    @property
+    def is_dirty(self) -> bool:
+        """Whether a change event has arrived since the last generation."""
+        with self._lock:
+            return self._dirty_all or bool(self._dirty)
+
+    def generate_all(self) -> GenerationReport:
+        """Rebuild every view and the whole library file from the live schema."""
+        with self._lock:
+            self._dirty.clear()
+            self._dirty_all = False
+        self._columns = [column for column in self.db_manager.get_table_columns("parts")
+                         if column not in HIDDEN_COLUMNS]
+        counts = self.db_manager.get_component_type_counts()
+        names = view_names_for(counts)
+        for component_type, state in self.libraries.items():
+            if names.get(component_type) != state.view_name:
+                self.db_manager.drop_library_view(state.view_name)
+        self.libraries = {}
+        return self._rebuild(counts, force_views=True)
+
+    def regenerate(self) -> GenerationReport:
+        """Redo only the categories marked dirty since the last run."""
+        with self._lock:
+            dirty_all, dirty = self._dirty_all, set(self._dirty)
+            self._dirty.clear()
+            self._dirty_all = False
+        if dirty_all or not self._columns:
+            return self.generate_all()
+        if not dirty:
+            return GenerationReport()
+        counts = self.db_manager.get_component_type_counts(sorted(dirty))
+        names = view_names_for(set(self.libraries) | set(counts))
+        if any(names[component_type] != state.view_name for component_type, state in self.libraries.items()):
+            # A new category collides with an existing one's view name, which
+            # is about to change.
+            return self.generate_all()
+        report = self._rebuild(counts, touched=dirty)
+        for component_type in dirty - set(counts):
+            state = self.libraries.pop(component_type, None)
+            if state is not None:
+                self.db_manager.drop_library_view(state.view_name)
+                report.removed.append(component_type)
+        if report.removed:
+            self._write_library_file()
+        return report
+
+    def _rebuild(self, counts: Dict[str, int], touched: Optional[Iterable[str]] = None,
+                 force_views: bool = False) -> GenerationReport:
+        """(Re)create views for new categories, re-check refs for the given
+        ones, and rewrite the library file."""
+        started = time.perf_counter()
+        report = GenerationReport()
+        component_types = sorted(counts if touched is None else set(touched) & set(counts))
+        names = view_names_for(set(self.libraries) | set(counts))
+
+        for component_type in component_types:
+            state = self.libraries.get(component_type)
+            if state is None or force_views or state.materialized != self.materialized:
+                state = LibraryState(component_type, names[component_type], materialized=self.materialized)
+                self.db_manager.create_library_view(state.view_name, component_type, self._columns,
+                                                    materialized=self.materialized)
+                self.libraries[component_type] = state
+            state.part_count = counts[component_type]
+            state.ref_problems = []
+            report.regenerated.append(component_type)
+
+        for component_type, kicad_part_number, problem in self.db_manager.find_malformed_refs(component_types):
+            self.libraries[component_type].ref_problems.append((kicad_part_number, problem))
+        for component_type in component_types:
+            if self.libraries[component_type].ref_problems:
+                report.ref_problems[component_type] = self.libraries[component_type].ref_problems
+
+        if component_types:
+            self._write_library_file()
+        report.elapsed_ms = (time.perf_counter() - started) * 1000
+        logger.info("Regenerated %d KiCad libraries in %.1f ms", len(report.regenerated), report.elapsed_ms)
+        return report
+
+    def _library_definition(self, state: LibraryState) -> Dict[str, object]:
+        fields = []
+        for column in self._columns:
+            if column in (KEY_COLUMN, SYMBOL_COLUMN, FOOTPRINT_COLUMN) or column in PROPERTY_COLUMNS:
+                continue
+            fields.append({
+                "column": column,
+                "name": FIELD_NAMES.get(column, column),
+                "visible_on_add": column in VISIBLE_ON_ADD,
+                "visible_in_chooser": True,
+                "show_name": column not in VISIBLE_ON_ADD,
+                "inherit_properties": True,
+            })
+        return {
+            "name": state.component_type or "Uncategorised",
+            "table": state.view_name,
+            "key": KEY_COLUMN,
+            "symbols": SYMBOL_COLUMN,
+            "footprints": FOOTPRINT_COLUMN,
+            "fields": fields,
+            "properties": {key: column for key, column in PROPERTY_COLUMNS.items() if column in self._columns},
+        }
+
+    def _source_definition(self) -> Dict[str, object]:
+        """ODBC source block. The password is never written out; KiCad users
+        supply it through their DSN or edit the file locally."""
+        settings = self.connection_settings
+        connection_string = (
+            f"Driver={{{self.odbc_driver}}};Server={settings.get('db_host', 'localhost')};"
+            f"Port={settings.get('db_port', 5432)};Database={settings.get('db_database', '')};"
+        )
+        return {
+            "type": "odbc",
+            "dsn": "",
+            "username": str(settings.get("db_user", "")),
+            "password": "",
+            "timeout_seconds": 2,
+            "connection_string": connection_string,
+        }
+
+    def _write_library_file(self) -> None:
+        """Write the .kicad_dbl atomically (temp file + rename) so KiCad never
+        reads a half-written file."""
+        definition = {
+            "meta": {"version": 0},
+            "name": self.name,
+            "description": self.description,
+            "source": self._source_definition(),
+            "libraries": [self._library_definition(state)
+                          for _, state in sorted(self.libraries.items())
+                          if state.part_count > 0],
+        }
+        temp_path = self.output_path.with_suffix(self.output_path.suffix + ".tmp")
+        with open(temp_path, "w", encoding="utf-8") as f_out:
+            json.dump(definition, f_out, indent=2)
+        temp_path.replace(self.output_path)
+
+
+class MaterializedViewRefresher:
+    """Background thread that runs REFRESH MATERIALIZED VIEW CONCURRENTLY for
+    library views handed to request() (a DatabaseManager's view_refresher).
+
+    Requests are coalesced: a burst of edits to one category within debounce
+    seconds costs one refresh. make_db_manager must return a DatabaseManager
+    on a connection of its own; it is called on the refresher thread and
+    again after a failure.
+    """
+
+    def __init__(self, make_db_manager: Callable[[], object], debounce: float = 1.0):
+        self.make_db_manager = make_db_manager
+        self.debounce = debounce
+        self._pending: Set[str] = set()
+        self._wake = threading.Condition()
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="matview-refresher", daemon=True)
+
+    def start(self) -> None:
+        """Start the refresher thread."""
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Ask the thread to exit after the batch it is refreshing, if any;
+        doesn't wait for it."""
+        with self._wake:
+            self._stop = True
+            self._wake.notify()
+
+    def request(self, view_name: str) -> None:
+        """Queue a refresh of view_name; safe from any thread."""
+        with self._wake:
+            self._pending.add(view_name)
+            self._wake.notify()
+
+    def _take_pending(self) -> Optional[Set[str]]:
+        with self._wake:
+            while not self._pending and not self._stop:
+                self._wake.wait()
+            if self._stop:
+                return None
+        time.sleep(self.debounce)
+        with self._wake:
+            pending, self._pending = self._pending, set()
+            return pending
+
+    def _run(self) -> None:
+        db_manager = None
+        while True:
+            pending = self._take_pending()
+            if pending is None:
+                break
+            for view_name in sorted(pending):
+                try:
+                    if db_manager is None:
+                        db_manager = self.make_db_manager()
+                    started = time.perf_counter()
+                    db_manager.refresh_library_view(view_name)
+                    logger.info("Refreshed %s in %.1f ms", view_name, (time.perf_counter() - started) * 1000)
+                except Exception:  # pylint: disable=broad-except
+                    logger.warning("Failed to refresh %s; will retry on the next change", view_name, exc_info=True)
+                    self._discard(db_manager)
+                    db_manager = None
+        self._discard(db_manager)
+
+    @staticmethod
+    def _discard(db_manager) -> None:
+        if db_manager is not None:
+            try:
+                db_manager.db_connection.close()
+            except Exception:  # pylint: disable=broad-except
+                pass
+
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def benchmark_lookups(db_manager, state: LibraryState, samples: int = 200) -> Dict[str, Dict[str, float]]:
+    """Time KiCad-style per-part lookups (SELECT * by part number) against
+    the raw parts table and against a category's library view, over the same
+    random sample of part numbers. Returns {"parts": stats, view_name: stats}
+    with count/mean/p50/p95/max in milliseconds. Run it on a connection of
+    its own, not one with a transaction in progress."""
+    part_numbers = db_manager.sample_part_numbers(state.component_type, samples)
+    results: Dict[str, Dict[str, float]] = {}
+    for relation, component_type in (("parts", state.component_type), (state.view_name, None)):
+        timings = []
+        for kicad_part_number in part_numbers:
+            started = time.perf_counter()
+            db_manager.lookup_library_part(relation, kicad_part_number, component_type)
+            timings.append((time.perf_counter() - started) * 1000)
+        if timings:
+            results[relation] = {
+                "count": len(timings),
+                "mean_ms": sum(timings) / len(timings),
+                "p50_ms": _percentile(timings, 0.50),
+                "p95_ms": _percentile(timings, 0.95),
+                "max_ms": max(timings),
+            }
+    logger.info("Library lookup benchmark for %s: %s", state.component_type, results)
+    return results
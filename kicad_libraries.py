@@ -0,0 +1,280 @@
+"""
+Index of the symbols and footprints in local KiCad libraries, for checking
+that parts' symbol_ref/footprint_ref actually resolve.
+
+Symbol libraries are .kicad_sym files and footprint libraries are .pretty
+directories of .kicad_mod files; in both cases the library nickname is taken
+to be the file/directory name without its extension, which is what KiCad's
+default library tables use. Parsing the stock libraries takes a while, so
+the index is kept in a JSON cache keyed by path and mtime: only libraries
+that changed since the last run are re-read, and those in parallel.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import pathlib
+import re
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+SYMBOL_LIBRARY_SUFFIX = ".kicad_sym"
+FOOTPRINT_LIBRARY_SUFFIX = ".pretty"
+FOOTPRINT_SUFFIX = ".kicad_mod"
+
+DEFAULT_CACHE_PATH = pathlib.Path.home() / ".cache" / "kicad_db_gui" / "library_index.json"
+
+# Bump when the cache layout or parsing changes, so old caches are ignored.
+CACHE_VERSION = 1
+
+# Environment variables KiCad sets for its stock libraries, newest first.
+SYMBOL_DIR_VARIABLES = ("KICAD9_SYMBOL_DIR", "KICAD8_SYMBOL_DIR", "KICAD7_SYMBOL_DIR", "KICAD6_SYMBOL_DIR")
+FOOTPRINT_DIR_VARIABLES = ("KICAD9_FOOTPRINT_DIR", "KICAD8_FOOTPRINT_DIR", "KICAD7_FOOTPRINT_DIR", "KICAD6_FOOTPRINT_DIR")
+
+# Tokens of a .kicad_sym s-expression that matter for finding symbol names:
+# "(symbol <name>" openers, other quoted strings (which may contain parens),
+# and bare parens.
+_SYMBOL_TOKEN_RE = re.compile(r'\(symbol\s+("(?:[^"\\]|\\.)*"|[^\s()"]+)|"(?:[^"\\]|\\.)*"|[()]')
+
+
+def default_library_dirs() -> Tuple[List[str], List[str]]:
+    """Symbol and footprint directories from KiCad's environment variables, if set."""
+    def first_set(variables: Tuple[str, ...]) -> List[str]:
+        for variable in variables:
+            if os.environ.get(variable):
+                return [os.environ[variable]]
+        return []
+    return first_set(SYMBOL_DIR_VARIABLES), first_set(FOOTPRINT_DIR_VARIABLES)
+
+
+def read_symbol_names(path: str) -> List[str]:
+    """Names of the top-level symbols in a .kicad_sym file.
+
+    Only symbols directly inside (kicad_symbol_lib ...) count; the nested
+    "(symbol "Name_1_1" ...)" unit blocks are skipped by tracking paren depth.
+    Module-level so it can run in a worker process.
+    """
+    with open(path, encoding="utf-8", errors="replace") as f_in:
+        text = f_in.read()
+    names = []
+    depth = 0
+    for match in _SYMBOL_TOKEN_RE.finditer(text):
+        token = match.group(0)
+        if match.group(1) is not None:
+            depth += 1
+            if depth == 2:
+                name = match.group(1)
+                if name.startswith('"'):
+                    name = name[1:-1].replace('\\"', '"').replace("\\\\", "\\")
+                names.append(name)
+        elif token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+    return names
+
+
+def read_footprint_names(path: str) -> List[str]:
+    """Names of the footprints in a .pretty directory."""
+    return sorted(entry.name[:-len(FOOTPRINT_SUFFIX)] for entry in os.scandir(path)
+                  if entry.is_file() and entry.name.endswith(FOOTPRINT_SUFFIX))
+
+
+@dataclass
+class RefProblem:
+    """A part whose symbol or footprint ref doesn't resolve."""
+    component_type: str
+    kicad_part_number: str
+    column: str
+    ref: str
+    problem: str
+
+
+@dataclass
+class ValidationReport:
+    """Outcome of LibraryIndex.validate()."""
+    problems: List[RefProblem] = field(default_factory=list)
+    parts_checked: int = 0
+    libraries_indexed: int = 0
+    libraries_reparsed: int = 0
+    index_ms: float = 0.0
+    check_ms: float = 0.0
+
+
+class LibraryIndex:
+    """Symbol and footprint names per library nickname, for a set of
+    directories, backed by an mtime-invalidated JSON cache.
+
+    load() is safe to run on a background thread; lookups afterwards are
+    plain dict/set reads. When two directories provide the same nickname the
+    one listed first wins, as in KiCad's library tables.
+    """
+
+    def __init__(self, symbol_dirs: Iterable[str], footprint_dirs: Iterable[str],
+                 cache_path: Optional[pathlib.Path] = DEFAULT_CACHE_PATH, max_workers: Optional[int] = None):
+        self.symbol_dirs = [str(path) for path in symbol_dirs]
+        self.footprint_dirs = [str(path) for path in footprint_dirs]
+        self.cache_path = pathlib.Path(cache_path) if cache_path is not None else None
+        self.max_workers = max_workers
+        self.symbols: Dict[str, Set[str]] = {}
+        self.footprints: Dict[str, Set[str]] = {}
+        self.loaded = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _find_libraries(dirs: List[str], suffix: str) -> List[Tuple[str, str]]:
+        """(nickname, path) for every library directly inside the given dirs."""
+        found = []
+        for directory in dirs:
+            try:
+                entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+            except OSError:
+                logger.warning("Library directory %s is not readable", directory)
+                continue
+            for entry in entries:
+                if entry.name.endswith(suffix):
+                    found.append((entry.name[:-len(suffix)], entry.path))
+        return found
+
+    def _read_cache(self) -> Dict[str, dict]:
+        if self.cache_path is None or not self.cache_path.exists():
+            return {}
+        try:
+            with open(self.cache_path, encoding="utf-8") as f_in:
+                data = json.load(f_in)
+        except (OSError, ValueError):
+            logger.warning("Ignoring unreadable library index cache %s", self.cache_path, exc_info=True)
+            return {}
+        if data.get("version") != CACHE_VERSION:
+            return {}
+        return data.get("libraries", {})
+
+    def _write_cache(self, libraries: Dict[str, dict]) -> None:
+        """Write the cache atomically, so a crash mid-write leaves the old one."""
+        if self.cache_path is None:
+            return
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.cache_path.with_suffix(self.cache_path.suffix + ".tmp")
+        with open(temp_path, "w", encoding="utf-8") as f_out:
+            json.dump({"version": CACHE_VERSION, "libraries": libraries}, f_out)
+        temp_path.replace(self.cache_path)
+
+    def _read_symbol_libraries(self, paths: List[str]) -> Dict[str, "Future[List[str]]"]:
+        """Parse .kicad_sym files (CPU-bound) on a pool of spawned processes;
+        forking the multithreaded GUI process isn't safe. Anything the pool
+        couldn't read - it couldn't start, or a worker died - is read on
+        threads instead. Returns a finished future per path."""
+        futures: Dict[str, Future] = {}
+        try:
+            with ProcessPoolExecutor(max_workers=self.max_workers,
+                                     mp_context=multiprocessing.get_context("spawn")) as pool:
+                for path in paths:
+                    futures[path] = pool.submit(read_symbol_names, path)
+        except (OSError, NotImplementedError, RuntimeError):  # BrokenProcessPool is a RuntimeError
+            logger.warning("Symbol library process pool failed; reading on threads", exc_info=True)
+        retry = [path for path in paths
+                 if path not in futures or isinstance(futures[path].exception(), BrokenProcessPool)]
+        if retry:
+            logger.warning("Reading %d symbol libraries on threads instead", len(retry))
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                futures.update({path: pool.submit(read_symbol_names, path) for path in retry})
+        return futures
+
+    def _read_libraries(self, stale: Dict[str, List[Tuple[str, int]]]) -> Dict[str, dict]:
+        """Cache entries for the given libraries, footprints on threads while
+        the symbols parse. Libraries that fail to read are left out."""
+        with ThreadPoolExecutor(max_workers=self.max_workers) as footprint_pool:
+            futures = {path: footprint_pool.submit(read_footprint_names, path) for path, _ in stale["footprint"]}
+            futures.update(self._read_symbol_libraries([path for path, _ in stale["symbol"]]))
+        entries: Dict[str, dict] = {}
+        for kind in ("symbol", "footprint"):
+            for path, mtime_ns in stale[kind]:
+                try:
+                    entries[path] = {"kind": kind, "mtime_ns": mtime_ns, "names": futures[path].result()}
+                except Exception:  # pylint: disable=broad-except
+                    logger.warning("Failed to read %s library %s", kind, path, exc_info=True)
+        return entries
+
+    def load(self) -> Tuple[int, int]:
+        """Index every library, reusing cached entries whose mtime hasn't
+        changed. Returns (libraries indexed, libraries re-read)."""
+        cached = self._read_cache()
+        libraries = {"symbol": self._find_libraries(self.symbol_dirs, SYMBOL_LIBRARY_SUFFIX),
+                     "footprint": self._find_libraries(self.footprint_dirs, FOOTPRINT_LIBRARY_SUFFIX)}
+
+        entries: Dict[str, dict] = {}
+        stale: Dict[str, List[Tuple[str, int]]] = {"symbol": [], "footprint": []}
+        for kind, found in libraries.items():
+            for _, path in found:
+                try:
+                    mtime_ns = os.stat(path).st_mtime_ns
+                except OSError:
+                    continue
+                entry = cached.get(path)
+                if entry is not None and entry.get("kind") == kind and entry.get("mtime_ns") == mtime_ns:
+                    entries[path] = entry
+                else:
+                    stale[kind].append((path, mtime_ns))
+
+        if stale["symbol"] or stale["footprint"]:
+            entries.update(self._read_libraries(stale))
+            try:
+                self._write_cache(entries)
+            except OSError:
+                logger.warning("Could not write library index cache %s", self.cache_path, exc_info=True)
+
+        symbols: Dict[str, Set[str]] = {}
+        footprints: Dict[str, Set[str]] = {}
+        for kind, target in (("symbol", symbols), ("footprint", footprints)):
+            for nickname, path in libraries[kind]:
+                if nickname not in target and path in entries:
+                    target[nickname] = set(entries[path]["names"])
+        with self._lock:
+            self.symbols, self.footprints = symbols, footprints
+            self.loaded = True
+        reparsed = len(stale["symbol"]) + len(stale["footprint"])
+        logger.info("Indexed %d symbol and %d footprint libraries (%d re-read)", len(symbols), len(footprints), reparsed)
+        return len(symbols) + len(footprints), reparsed
+
+    def check_ref(self, column: str, ref: str) -> Optional[str]:
+        """Why a symbol_ref/footprint_ref doesn't resolve, or None if it does.
+        Refs into libraries that aren't indexed at all are reported too."""
+        kind, libraries = ("symbol", self.symbols) if column == "symbol_ref" else ("footprint", self.footprints)
+        if not ref or not ref.strip():
+            return f"{kind} ref is empty"
+        nickname, sep, name = ref.partition(":")
+        if not sep or not nickname or not name:
+            return f"{kind} ref '{ref}' is not library:name"
+        names = libraries.get(nickname)
+        if names is None:
+            return f"{kind} library '{nickname}' not found"
+        if name not in names:
+            return f"{kind} '{name}' not found in library '{nickname}'"
+        return None
+
+    def validate(self, part_refs: Iterable[Tuple[str, str, str, str]]) -> ValidationReport:
+        """Check (component_type, kicad_part_number, symbol_ref, footprint_ref)
+        rows in one pass, loading the index first if needed."""
+        report = ValidationReport()
+        started = time.perf_counter()
+        if not self.loaded:
+            report.libraries_indexed, report.libraries_reparsed = self.load()
+        else:
+            report.libraries_indexed = len(self.symbols) + len(self.footprints)
+        report.index_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        for component_type, kicad_part_number, symbol_ref, footprint_ref in part_refs:
+            report.parts_checked += 1
+            for column, ref in (("symbol_ref", symbol_ref), ("footprint_ref", footprint_ref)):
+                problem = self.check_ref(column, ref or "")
+                if problem is not None:
+                    report.problems.append(RefProblem(component_type or "", kicad_part_number, column, ref or "", problem))
+        report.check_ms = (time.perf_counter() - started) * 1000
+        return report
@@ -0,0 +1,185 @@
+"""
+Per-component-type queries behind the KiCad database library (see
+kicad_dbl.py): category counts and part lists, the plain or materialized
+views KiCad reads each category from, and checks of symbol/footprint refs.
+
+LibraryViewsMixin is part of database.DatabaseManager and works through its
+cursor and connection; DatabaseManager._commit calls _refresh_library_views
+after every parts write.
+"""
+import logging
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class LibraryViewsMixin:
+    """KiCad library view and category queries of DatabaseManager."""
+
+    # Matches a resolvable KiCad reference: "library:item", both halves non-empty.
+    LIB_REF_PATTERN = "^[^:]+:[^:]+$"
+
+    @staticmethod
+    def _component_type_condition(component_types: List[str]) -> Tuple[str, List[object]]:
+        """component_type = ANY(...) that also matches NULL when '' is asked for,
+        keeping the plain comparison so an index on component_type applies."""
+        condition = "component_type = ANY(%s)"
+        if "" in component_types:
+            condition = f"({condition} OR component_type IS NULL)"
+        return condition, [list(component_types)]
+
+    def get_component_type_counts(self, component_types: Optional[List[str]] = None) -> Dict[str, int]:
+        """Part count per component type ('' for none), optionally only for
+        the given types. Types with no parts are simply absent."""
+        sql = "SELECT coalesce(component_type, ''), count(*) FROM parts"
+        params: List[object] = []
+        if component_types is not None:
+            condition, params = self._component_type_condition(component_types)
+            sql += " WHERE " + condition
+        self.cursor.execute(sql + " GROUP BY 1", params)
+        return dict(self.cursor.fetchall())
+
+    def get_category_parts(self, component_type: str) -> List[Tuple[str, str]]:
+        """(kicad_part_number, description) of every part of one component
+        type ('' for none), by part number."""
+        condition, params = self._component_type_condition([component_type])
+        self.statements.execute(self.cursor, f"""SELECT kicad_part_number, coalesce(description, '')
+                FROM parts WHERE {condition} ORDER BY kicad_part_number""", params)
+        return self.cursor.fetchall()
+
+    def _drop_relation(self, name: str) -> None:
+        """Drop a view or materialized view by name, whichever it is. (DROP VIEW
+        IF EXISTS errors on a materialized view, so look the kind up first.)
+        Runs in the caller's transaction."""
+        self.cursor.execute("""SELECT relkind FROM pg_class
+                WHERE relname = %s AND relnamespace = current_schema()::regnamespace""", (name,))
+        row = self.cursor.fetchone()
+        if row is None:
+            return
+        kind = "MATERIALIZED VIEW" if row[0] == "m" else "VIEW"
+        self.cursor.execute(f"DROP {kind} {name}")
+
+    def _refresh_library_views(self, component_types: Sequence[str]) -> None:
+        """Refresh the materialized library views showing component_types (all
+        of them if none are given) after a committed parts write, or hand
+        them to view_refresher. The write has committed either way, so
+        failures are only logged."""
+        sql = "SELECT view_name FROM kicad_library_views WHERE materialized"
+        params: List[object] = []
+        if component_types:
+            sql += " AND component_type = ANY(%s)"
+            params.append(list(component_types))
+        try:
+            self.cursor.execute(sql + " ORDER BY view_name", params)
+            view_names = [row[0] for row in self.cursor.fetchall()]
+            self.db_connection.commit()
+            for view_name in view_names:
+                if self.view_refresher is not None:
+                    self.view_refresher(view_name)
+                else:
+                    self.refresh_library_view(view_name)
+        except Exception:  # pylint: disable=broad-except
+            self.db_connection.rollback()
+            logger.warning("Could not refresh the KiCad library views", exc_info=True)
+
+    def create_library_view(self, view_name: str, component_type: str, columns: List[str],
+                            materialized: bool = False) -> None:
+        """(Re)create the view KiCad reads one component type's library from.
+
+        A materialized view gets a unique index on kicad_part_number, which
+        serves KiCad's per-part lookups and is what REFRESH ... CONCURRENTLY
+        requires."""
+        if not re.fullmatch(r"[a-z0-9_]+", view_name):
+            raise ValueError(f"Invalid view name: {view_name}")
+        column_list = ", ".join('"' + column.replace('"', '""') + '"' for column in columns)
+        condition, params = self._component_type_condition([component_type])
+        kind = "MATERIALIZED VIEW" if materialized else "VIEW"
+        try:
+            self._drop_relation(view_name)
+            self.cursor.execute(f"CREATE {kind} {view_name} AS SELECT {column_list} FROM parts WHERE {condition}", params)
+            if materialized:
+                self.cursor.execute(f"CREATE UNIQUE INDEX {view_name}_key_idx ON {view_name} (kicad_part_number)")
+            self.cursor.execute("""INSERT INTO kicad_library_views (view_name, component_type, materialized)
+                    VALUES (%s, %s, %s) ON CONFLICT (view_name) DO UPDATE
+                    SET component_type = excluded.component_type, materialized = excluded.materialized""",
+                                (view_name, component_type or "", materialized))
+            self.db_connection.commit()
+        except Exception:
+            self.db_connection.rollback()
+            raise
+
+    def drop_library_view(self, view_name: str) -> None:
+        """Drop a component type view that no longer has any parts."""
+        if not re.fullmatch(r"[a-z0-9_]+", view_name):
+            raise ValueError(f"Invalid view name: {view_name}")
+        try:
+            self._drop_relation(view_name)
+            self.cursor.execute("DELETE FROM kicad_library_views WHERE view_name = %s", (view_name,))
+            self.db_connection.commit()
+        except Exception:
+            self.db_connection.rollback()
+            raise
+
+    def refresh_library_view(self, view_name: str) -> None:
+        """REFRESH a materialized library view CONCURRENTLY, so KiCad can keep
+        reading the old contents while the new ones are built."""
+        if not re.fullmatch(r"[a-z0-9_]+", view_name):
+            raise ValueError(f"Invalid view name: {view_name}")
+        try:
+            self.cursor.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view_name}")
+            self.db_connection.commit()
+        except Exception:
+            self.db_connection.rollback()
+            raise
+
+    def sample_part_numbers(self, component_type: str, limit: int) -> List[str]:
+        """A random sample of part numbers from one category (for benchmarks)."""
+        condition, params = self._component_type_condition([component_type])
+        self.cursor.execute(f"SELECT kicad_part_number FROM parts WHERE {condition} ORDER BY random() LIMIT %s",
+                            params + [limit])
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def lookup_library_part(self, relation: str, kicad_part_number: str,
+                            component_type: Optional[str] = None) -> Optional[Tuple]:
+        """Fetch one part the way KiCad does: SELECT * by key from a library
+        relation. With component_type, reads the raw parts table filtered to
+        that category instead (the pre-view baseline). Meant for a connection
+        of its own (see kicad_dbl.benchmark_lookups)."""
+        if not re.fullmatch(r"[a-z0-9_]+", relation):
+            raise ValueError(f"Invalid relation name: {relation}")
+        sql = f"SELECT * FROM {relation} WHERE kicad_part_number = %s"
+        params: List[object] = [kicad_part_number]
+        if component_type is not None:
+            condition, condition_params = self._component_type_condition([component_type])
+            sql += " AND " + condition
+            params.extend(condition_params)
+        self.cursor.execute(sql, params)
+        return self.cursor.fetchone()
+
+    def find_malformed_refs(self, component_types: List[str]) -> List[Tuple[str, str, str]]:
+        """Check symbol/footprint refs for whole categories in one query.
+        Returns (component_type, kicad_part_number, problem) for refs that
+        aren't of the form library:name."""
+        if not component_types:
+            return []
+        condition, params = self._component_type_condition(component_types)
+        self.cursor.execute(f"""SELECT coalesce(component_type, ''), kicad_part_number, symbol_ref, footprint_ref
+                FROM parts
+                WHERE {condition}
+                  AND (coalesce(symbol_ref, '') !~ %s OR coalesce(footprint_ref, '') !~ %s)""",
+                            params + [self.LIB_REF_PATTERN, self.LIB_REF_PATTERN])
+        problems = []
+        ref_re = re.compile(self.LIB_REF_PATTERN)
+        for component_type, kicad_part_number, symbol_ref, footprint_ref in self.cursor.fetchall():
+            for label, ref in (("symbol_ref", symbol_ref), ("footprint_ref", footprint_ref)):
+                if not ref_re.match(ref or ""):
+                    problems.append((component_type, kicad_part_number, f"{label} '{ref or ''}' is not library:name"))
+        return problems
+
+    def get_part_refs(self) -> List[Tuple[str, str, str, str]]:
+        """(component_type, kicad_part_number, symbol_ref, footprint_ref) for
+        every part, for checking refs against local libraries in one pass."""
+        self.cursor.execute("""SELECT coalesce(component_type, ''), kicad_part_number, symbol_ref, footprint_ref
+                FROM parts ORDER BY component_type, kicad_part_number""")
+        return self.cursor.fetchall()
@@ -0,0 +1,278 @@
+"""
+Checks the datasheet and manufacturer URLs stored on parts.
+
+Checking runs on an asyncio loop on its own thread, so the GUI only ever
+reads finished results. Requests are HEAD (falling back to GET where HEAD
+isn't allowed) over a minimal HTTP/1.1 client built on asyncio streams,
+limited both overall and per host so a page of parts from one vendor doesn't
+hammer that vendor. Results are kept in a small SQLite cache with each URL's
+ETag/Last-Modified, so a re-run skips recently checked URLs and sends
+conditional requests for the rest.
+"""
+import asyncio
+import collections
+import logging
+import pathlib
+import sqlite3
+import ssl
+import threading
+import time
+import urllib.parse
+from typing import Deque, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = pathlib.Path.home() / ".cache" / "kicad_db_gui" / "link_cache.sqlite3"
+
+# Link states, best to worst. "stale" means the URL still works but only via
+# a permanent redirect, so the stored URL should be updated.
+STATE_OK = "ok"
+STATE_STALE = "stale"
+STATE_ERROR = "error"
+STATE_DEAD = "dead"
+STATE_ORDER = {STATE_OK: 0, STATE_STALE: 1, STATE_ERROR: 2, STATE_DEAD: 3}
+
+DEAD_STATUSES = {404, 410}
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+PERMANENT_REDIRECT_STATUSES = {301, 308}
+MAX_REDIRECTS = 5
+MAX_HEADER_LINES = 100
+USER_AGENT = "kicad-db-gui-link-checker/1.0"
+
+
+class LinkResult(NamedTuple):
+    """Outcome of checking one URL."""
+    url: str
+    state: str
+    status: int = 0
+    final_url: str = ""
+    error: str = ""
+    etag: str = ""
+    last_modified: str = ""
+    checked_at: float = 0.0
+
+
+def is_checkable(url: Optional[str]) -> bool:
+    """Only http(s) URLs are checked; blanks and local paths are skipped."""
+    return bool(url) and urllib.parse.urlsplit(url.strip()).scheme in ("http", "https")
+
+
+def worst_state(states: Iterable[Optional[str]]) -> str:
+    """The worst of several link states, or "" if none are known yet."""
+    known = [state for state in states if state]
+    return max(known, key=STATE_ORDER.__getitem__) if known else ""
+
+
+class LinkCache:
+    """SQLite store of the last LinkResult per URL. Used from one thread."""
+
+    def __init__(self, path: pathlib.Path = DEFAULT_CACHE_PATH):
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(path))
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS links (
+                url TEXT PRIMARY KEY, state TEXT NOT NULL, status INTEGER, final_url TEXT,
+                error TEXT, etag TEXT, last_modified TEXT, checked_at REAL)""")
+        self.connection.commit()
+
+    def load(self) -> Dict[str, LinkResult]:
+        """Every cached result, by URL."""
+        cursor = self.connection.execute(
+            "SELECT url, state, status, final_url, error, etag, last_modified, checked_at FROM links")
+        return {row[0]: LinkResult(*row) for row in cursor}
+
+    def store(self, results: List[LinkResult]) -> None:
+        """Save results, replacing any older ones for the same URLs."""
+        self.connection.executemany("INSERT OR REPLACE INTO links VALUES (?, ?, ?, ?, ?, ?, ?, ?)", results)
+        self.connection.commit()
+
+    def close(self) -> None:
+        """Close the SQLite file."""
+        self.connection.close()
+
+
+class LinkChecker:
+    """Checks a batch of URLs on a background thread.
+
+    start() returns immediately; results, done and total can be read from
+    any thread while it runs. URLs checked less than recheck_after seconds
+    ago are taken from the cache without a request.
+    """
+
+    def __init__(self, cache_path: Optional[pathlib.Path] = DEFAULT_CACHE_PATH, max_concurrency: int = 64,
+                 per_host: int = 2, timeout: float = 15.0, recheck_after: float = 24 * 3600.0,
+                 batch_size: int = 500):
+        self.cache_path = cache_path
+        self.max_concurrency = max_concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.recheck_after = recheck_after
+        self.batch_size = batch_size
+        self.results: Dict[str, LinkResult] = {}
+        self.total = 0
+        self.done = 0
+        self._finished: List[str] = []
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._ssl_context = ssl.create_default_context()
+
+    @property
+    def running(self) -> bool:
+        """Whether a check is still in progress."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, urls: Iterable[str]) -> None:
+        """Check the distinct checkable URLs among urls in the background."""
+        unique = sorted({url.strip() for url in urls if is_checkable(url)})
+        with self._lock:
+            self.total, self.done = len(unique), 0
+        self._cancelled.clear()
+        self._thread = threading.Thread(target=self._run, args=(unique,), name="link-checker", daemon=True)
+        self._thread.start()
+
+    def cancel(self) -> None:
+        """Stop the running check; results so far are kept and cached."""
+        self._cancelled.set()
+
+    def result(self, url: Optional[str]) -> Optional[LinkResult]:
+        """The latest result for url, or None if it hasn't been checked."""
+        if not url:
+            return None
+        with self._lock:
+            return self.results.get(url.strip())
+
+    def take_finished(self) -> List[str]:
+        """URLs whose results arrived since the last call, so a UI can update
+        just the rows that changed."""
+        with self._lock:
+            finished, self._finished = self._finished, []
+        return finished
+
+    def progress(self) -> Tuple[int, int]:
+        """(URLs done, URLs in this check)."""
+        with self._lock:
+            return self.done, self.total
+
+    def _run(self, urls: List[str]) -> None:
+        cache = None
+        try:
+            cache = LinkCache(self.cache_path) if self.cache_path is not None else None
+            cached = cache.load() if cache is not None else {}
+            asyncio.run(self._check_all(urls, cached, cache))
+        except Exception:  # pylint: disable=broad-except
+            logger.warning("Link check failed", exc_info=True)
+        finally:
+            if cache is not None:
+                cache.close()
+
+    async def _check_all(self, urls: List[str], cached: Dict[str, LinkResult], cache: Optional[LinkCache]) -> None:
+        started = time.perf_counter()
+        now = time.time()
+        by_host: Dict[str, Deque[str]] = collections.defaultdict(collections.deque)
+        for url in urls:
+            previous = cached.get(url)
+            if previous is not None and now - previous.checked_at < self.recheck_after:
+                self._record(previous)
+            else:
+                by_host[urllib.parse.urlsplit(url).netloc.lower()].append(url)
+
+        to_check = sum(len(queue) for queue in by_host.values())
+        pending: List[LinkResult] = []
+        overall = asyncio.Semaphore(self.max_concurrency)
+
+        async def host_worker(queue: Deque[str]) -> None:
+            while queue and not self._cancelled.is_set():
+                url = queue.popleft()
+                async with overall:
+                    result = await self._check(url, cached.get(url))
+                self._record(result)
+                pending.append(result)
+                if cache is not None and len(pending) >= self.batch_size:
+                    cache.store(pending[:])
+                    del pending[:]
+
+        await asyncio.gather(*(host_worker(queue) for queue in by_host.values()
+                               for _ in range(min(self.per_host, len(queue)))))
+        if cache is not None and pending:
+            cache.store(pending)
+        logger.info("Checked %d URLs (%d from cache) on %d hosts in %.1f s", len(urls),
+                    len(urls) - to_check, len(by_host), time.perf_counter() - started)
+
+    def _record(self, result: LinkResult) -> None:
+        with self._lock:
+            self.results[result.url] = result
+            self._finished.append(result.url)
+            self.done += 1
+
+    async def _check(self, url: str, previous: Optional[LinkResult]) -> LinkResult:
+        """Follow redirects from url and classify where it ends up."""
+        conditional: Dict[str, str] = {}
+        if previous is not None and previous.state in (STATE_OK, STATE_STALE):
+            if previous.etag:
+                conditional["If-None-Match"] = previous.etag
+            if previous.last_modified:
+                conditional["If-Modified-Since"] = previous.last_modified
+
+        current, moved = url, False
+        try:
+            for _ in range(MAX_REDIRECTS + 1):
+                status, headers = await asyncio.wait_for(self._request("HEAD", current, conditional), self.timeout)
+                if status in (405, 501):
+                    status, headers = await asyncio.wait_for(self._request("GET", current, conditional), self.timeout)
+                location = headers.get("location")
+                if status not in REDIRECT_STATUSES or not location:
+                    break
+                moved = moved or status in PERMANENT_REDIRECT_STATUSES
+                current = urllib.parse.urljoin(current, location)
+                conditional = {}
+            else:
+                return LinkResult(url, STATE_ERROR, status, current, "too many redirects", checked_at=time.time())
+        except (OSError, asyncio.TimeoutError, ValueError) as e:
+            return LinkResult(url, STATE_ERROR, 0, current, str(e) or type(e).__name__, checked_at=time.time())
+
+        if status == 304 and previous is not None:
+            return previous._replace(checked_at=time.time())
+        if 200 <= status < 300:
+            state = STATE_STALE if moved else STATE_OK
+        elif status in DEAD_STATUSES:
+            state = STATE_DEAD
+        else:
+            state = STATE_ERROR
+        return LinkResult(url, state, status, current, "" if state != STATE_ERROR else f"HTTP {status}",
+                          headers.get("etag", ""), headers.get("last-modified", ""), time.time())
+
+    async def _request(self, method: str, url: str, extra_headers: Dict[str, str]) -> Tuple[int, Dict[str, str]]:
+        """Send one request and read only the status line and headers."""
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"unsupported URL {url}")
+        host = parts.hostname.encode("idna").decode("ascii")
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        target = urllib.parse.quote(parts.path or "/", safe="/%:@!$&'()*+,;=-._~")
+        if parts.query:
+            target += "?" + urllib.parse.quote(parts.query, safe="=&%:@!$'()*+,;/?-._~")
+
+        reader, writer = await asyncio.open_connection(
+            host, port, ssl=self._ssl_context if parts.scheme == "https" else None,
+            server_hostname=host if parts.scheme == "https" else None)
+        try:
+            lines = [f"{method} {target} HTTP/1.1", f"Host: {parts.netloc.rsplit('@', 1)[-1]}",
+                     f"User-Agent: {USER_AGENT}", "Accept: */*", "Connection: close"]
+            lines.extend(f"{name}: {value}" for name, value in extra_headers.items())
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+            await writer.drain()
+
+            status_line = (await reader.readline()).decode("latin-1").split()
+            if len(status_line) < 2 or not status_line[1].isdigit():
+                raise ValueError("malformed HTTP response")
+            headers: Dict[str, str] = {}
+            for _ in range(MAX_HEADER_LINES):
+                line = (await reader.readline()).decode("latin-1").strip()
+                if not line:
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            return int(status_line[1]), headers
+        finally:
+            writer.close()
@@ -0,0 +1,466 @@
+"""
+Streaming analysis of the JSON log written by json_logger.JSONFormatter:
+app.log.jsonl and its rotations (app.log.jsonl.1 ... .N, each possibly .gz
+or .zst, and any .pending-<ns> not yet compressed), oldest first.
+
+Nothing is decoded with json.loads. The level, logger, module, function and
+timestamp keys are written by fmt_keys (logger_config.json) ahead of any
+extras, and a JSON string can't contain an unescaped '"key": ' sequence, so
+those fields, and timing values, are sliced straight out of the raw bytes. Files are read in blocks of whole
+lines; a block lying inside the requested time range is counted with a
+single regex pass, in C, and only blocks straddling a bound (or a
+logger/module filter) are walked line by line. Whole segments outside the
+time range are skipped after reading their first and last lines (for a
+compressed segment, the first line of the next one stands in for its last).
+
+Memory stays constant however much is read. Counts are kept per level and
+per function. Timings go into LatencyHistograms, whose buckets grow
+geometrically, so percentiles come out within about 1% with a few hundred
+buckets at most.
+
+Timing fields are the numeric extras whose name ends in "_ms" (e.g.
+logger.info("...", extra={"duration_ms": 12.5})), plus any named explicitly.
+"""
+import datetime
+import gzip
+import io
+import json
+import math
+import pathlib
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_LOG_PATH = pathlib.Path("app.log.jsonl")
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40, "CRITICAL": 50}
+
+_LEVEL_KEY = b'"level": "'
+_LOGGER_KEY = b'"logger": "'
+_MODULE_KEY = b'"module": "'
+_FUNCTION_KEY = b'"function": "'
+_TIMESTAMP_KEY = b'"timestamp": "'
+_NUMBER_RE = re.compile(rb'(-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)[,}]')
+_ERROR_LEVELS = {b"ERROR", b"CRITICAL"}
+# Levels, and (module, function)s, of every record in a block.
+_LEVEL_RE = re.compile(rb'"level": "([A-Z]+)"')
+_FUNCTION_RE = re.compile(rb'"module": "([^"]*)", "function": "([^"]*)"')
+_READ_BUFFER = 1 << 20
+_CHUNK_SIZE = 8 << 20
+_COMPRESSED_SUFFIXES = (".gz", ".zst")
+
+
+def log_path_from_config(config_path: pathlib.Path = pathlib.Path("logger_config.json")) -> pathlib.Path:
+    """The file_json handler's filename from the logging config, or the default."""
+    try:
+        with open(config_path, encoding="utf-8") as f_in:
+            return pathlib.Path(json.load(f_in)["handlers"]["file_json"]["filename"])
+    except (OSError, ValueError, KeyError):
+        return DEFAULT_LOG_PATH
+
+
+def log_segments(path: pathlib.Path) -> List[pathlib.Path]:
+    """The log and its rotated backups, oldest first: numbered backups, then
+    rotations still waiting to be compressed, then the live file."""
+    path = pathlib.Path(path)
+    backups = []
+    pending = []
+    for candidate in path.parent.glob(path.name + ".*"):
+        suffix = candidate.name[len(path.name) + 1:]
+        for compressed in _COMPRESSED_SUFFIXES:
+            suffix = suffix[:-len(compressed)] if suffix.endswith(compressed) else suffix
+        if suffix.isdigit():
+            backups.append((int(suffix), candidate.name, candidate))
+        elif suffix.startswith("pending-") and suffix[len("pending-"):].isdigit():
+            pending.append((int(suffix[len("pending-"):]), candidate))
+    segments = [candidate for _number, _name, candidate in sorted(backups, reverse=True)]
+    segments.extend(candidate for _ns, candidate in sorted(pending))
+    if path.exists():
+        segments.append(path)
+    return segments
+
+
+def open_segment(path: pathlib.Path) -> BinaryIO:
+    """Open one log segment for reading bytes, decompressing .gz and .zst."""
+    path = pathlib.Path(path)
+    if path.suffix == ".gz":
+        return gzip.open(path, "rb")
+    if path.suffix == ".zst":
+        if zstandard is None:
+            raise OSError(f"Reading {path.name} needs the zstandard package")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, "rb")), _READ_BUFFER)
+    return open(path, "rb", buffering=_READ_BUFFER)
+
+
+def is_compressed(path: pathlib.Path) -> bool:
+    """Whether a segment is a compressed backup."""
+    return pathlib.Path(path).suffix in _COMPRESSED_SUFFIXES
+
+
+def _raw_field(line: bytes, key: bytes) -> Optional[bytes]:
+    """The raw value of a string field, without decoding the line."""
+    start = line.find(key)
+    if start < 0:
+        return None
+    start += len(key)
+    end = line.find(b'"', start)
+    return line[start:end] if end >= 0 else None
+
+
+def _timestamp(value: Optional[object]) -> Optional[bytes]:
+    """A datetime or ISO string as the UTC ISO bytes JSONFormatter writes,
+    which then compare correctly as bytes. Naive times are local time."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value.strip())
+    if value.tzinfo is None:
+        value = value.astimezone()
+    return value.astimezone(datetime.timezone.utc).isoformat().encode("ascii")
+
+
+class LatencyHistogram:
+    """Log-bucketed histogram of non-negative values. Percentiles are the
+    bucket midpoints, within `precision` of the true value."""
+
+    def __init__(self, precision: float = 0.01):
+        self._scale = 1 / math.log1p(2 * precision)
+        self._buckets: Counter = Counter()
+        self.count = 0
+        self.total = 0.0
+        self.minimum = math.inf
+        self.maximum = 0.0
+
+    def add(self, value: float) -> None:
+        """Count one value; zero and negatives go in a bucket of their own."""
+        self._buckets[math.floor(math.log(value) * self._scale) if value > 0 else None] += 1
+        self.count += 1
+        self.total += value
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+
+    @property
+    def mean(self) -> float:
+        """Exact mean of the values added (0.0 if none)."""
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, fraction: float) -> float:
+        """Approximate value at fraction (0.0-1.0) of the way through the
+        sorted values: the midpoint of the bucket it falls in, clamped to
+        the minimum and maximum seen, so within `precision` of the true
+        value. 0.0 for values in the zero bucket or an empty histogram."""
+        if not self.count:
+            return 0.0
+        rank = fraction * (self.count - 1)
+        seen = self._buckets.get(None, 0)
+        if rank < seen:
+            return 0.0
+        for bucket in sorted(key for key in self._buckets if key is not None):
+            seen += self._buckets[bucket]
+            if rank < seen:
+                midpoint = math.exp((bucket + 0.5) / self._scale)
+                return min(max(midpoint, self.minimum), self.maximum)
+        return self.maximum
+
+
+@dataclass
+class LogFilter:
+    """Which records to analyze. min_level is a level name; loggers match
+    their children too; since/until are datetimes or ISO strings."""
+    min_level: str = "DEBUG"
+    loggers: Sequence[str] = ()
+    modules: Sequence[str] = ()
+    since: Optional[object] = None
+    until: Optional[object] = None
+
+    def __post_init__(self):
+        if self.min_level.upper() not in LEVELS:
+            raise ValueError(f"Unknown log level: {self.min_level}")
+        threshold = LEVELS[self.min_level.upper()]
+        self.levels = {name.encode("ascii") for name, number in LEVELS.items() if number >= threshold}
+        self._loggers = [name.encode("utf-8") for name in self.loggers]
+        self._modules = {name.encode("utf-8") for name in self.modules}
+        # Text every matching line contains, to find candidates without
+        # looking at each line.
+        if self.modules:
+            self.needles = [b'"module": "' + module + b'"' for module in self._modules]
+        else:
+            self.needles = [b'"logger": "' + name for name in self._loggers]
+        self._since = _timestamp(self.since)
+        self._until = _timestamp(self.until)
+
+    def matches(self, line: bytes, level: Optional[bytes], timestamp: Optional[bytes]) -> bool:
+        """Whether a raw log line, with its already extracted level and
+        timestamp, passes every condition of the filter."""
+        if level not in self.levels:
+            return False
+        if self._since is not None and (timestamp is None or timestamp < self._since):
+            return False
+        if self._until is not None and (timestamp is None or timestamp > self._until):
+            return False
+        if self._modules and _raw_field(line, _MODULE_KEY) not in self._modules:
+            return False
+        if self._loggers:
+            name = _raw_field(line, _LOGGER_KEY) or b""
+            if not any(name == prefix or name.startswith(prefix + b".") for prefix in self._loggers):
+                return False
+        return True
+
+    def covers(self, first: Optional[bytes], last: Optional[bytes]) -> bool:
+        """Whether every record between timestamps first and last passes all
+        but the level check."""
+        if self._loggers or self._modules:
+            return False
+        if self._since is not None and (first is None or first < self._since):
+            return False
+        if self._until is not None and (last is None or last > self._until):
+            return False
+        return True
+
+    def segment_in_range(self, first: Optional[bytes], last: Optional[bytes]) -> bool:
+        """Whether a segment spanning first..last timestamps can hold matches."""
+        if self._since is not None and last is not None and last < self._since:
+            return False
+        if self._until is not None and first is not None and first > self._until:
+            return False
+        return True
+
+
+@dataclass
+class LogSummary:
+    """Aggregates of one analysis run."""
+    segments: int = 0
+    bytes_read: int = 0
+    lines: int = 0
+    matched: int = 0
+    unreadable: int = 0
+    first_timestamp: str = ""
+    last_timestamp: str = ""
+    levels: Counter = field(default_factory=Counter)
+    # "module.function" -> (records, errors, warnings)
+    functions: Dict[str, List[int]] = field(default_factory=dict)
+    # (timing field, "module.function") -> histogram
+    timings: Dict[Tuple[str, str], LatencyHistogram] = field(default_factory=dict)
+
+
+def _segment_bounds(path: pathlib.Path) -> Tuple[Optional[bytes], Optional[bytes]]:
+    """Timestamps of a segment's first and last lines. The last is None for
+    compressed segments, which can't be read from the end cheaply."""
+    with open_segment(path) as f_in:
+        first = _raw_field(f_in.readline(), _TIMESTAMP_KEY)
+        if is_compressed(path):
+            return first, None
+        last_line = b""
+        for last_line in _tail_lines(f_in):
+            pass
+    return first, _raw_field(last_line, _TIMESTAMP_KEY)
+
+
+def _tail_lines(f_in: BinaryIO, size: int = 8192) -> Iterator[bytes]:
+    """The complete lines in the last size bytes of a seekable file."""
+    try:
+        f_in.seek(0, 2)
+        end = f_in.tell()
+        f_in.seek(max(0, end - size))
+    except (OSError, ValueError):
+        return
+    yield from (line for line in f_in.read().splitlines() if line.strip())
+
+
+class _Aggregator:
+    """Counts and timings of the records accepted so far, keyed by raw bytes."""
+
+    def __init__(self, log_filter: LogFilter, timing_fields: Sequence[str]):
+        self.filter = log_filter
+        self.summary = LogSummary()
+        self.functions: Dict[Tuple[bytes, bytes], List[int]] = {}
+        self.timings: Dict[Tuple[bytes, Tuple[bytes, bytes]], LatencyHistogram] = {}
+        self.levels: Counter = Counter()
+        self.first: Optional[bytes] = None
+        self.last: Optional[bytes] = None
+        # Byte sequences ending each timing key: any '_ms' key, plus the
+        # named ones.
+        self.markers = [b'_ms": '] + [f'"{name}": '.encode("utf-8") for name in timing_fields
+                                      if not name.endswith("_ms")]
+
+    def _count(self, level: bytes, function: Tuple[bytes, bytes], count: int = 1) -> None:
+        self.levels[level] += count
+        counts = self.functions.get(function)
+        if counts is None:
+            counts = self.functions[function] = [0, 0, 0]
+        counts[0] += count
+        if level in _ERROR_LEVELS:
+            counts[1] += count
+        elif level == b"WARNING":
+            counts[2] += count
+
+    def _add_timings(self, line: bytes, function: Tuple[bytes, bytes]) -> None:
+        """Timing values of one line, found from their keys' markers."""
+        for marker in self.markers:
+            position = line.find(marker)
+            while position >= 0:
+                value_start = position + len(marker)
+                name = line[line.rfind(b'"', 0, value_start - 3) + 1:value_start - 3]
+                value = _NUMBER_RE.match(line, value_start)
+                if value is not None:
+                    histogram = self.timings.get((name, function))
+                    if histogram is None:
+                        histogram = self.timings[(name, function)] = LatencyHistogram()
+                    histogram.add(max(float(value.group(1)), 0.0))
+                position = line.find(marker, value_start)
+
+    def add_line(self, line: bytes) -> None:
+        """One record, checked against every part of the filter."""
+        level = _raw_field(line, _LEVEL_KEY)
+        timestamp = _raw_field(line, _TIMESTAMP_KEY)
+        if level is None:
+            self.summary.unreadable += 1
+            return
+        if not self.filter.matches(line, level, timestamp):
+            return
+        self.summary.matched += 1
+        if timestamp is not None:
+            self.first = self.first or timestamp
+            self.last = timestamp
+        function = (_raw_field(line, _MODULE_KEY) or b"?", _raw_field(line, _FUNCTION_KEY) or b"?")
+        self._count(level, function)
+        if any(marker in line for marker in self.markers):
+            self._add_timings(line, function)
+
+    def add_chunk(self, chunk: bytes) -> None:
+        """A block of whole lines. Blocks entirely inside the time range,
+        with no logger/module filter, are counted by one regex pass over the
+        block; the rest go line by line."""
+        lines = chunk.count(b"\n") + (not chunk.endswith(b"\n"))
+        self.summary.lines += lines
+        self.summary.bytes_read += len(chunk)
+        head = _raw_field(chunk[:chunk.find(b"\n")], _TIMESTAMP_KEY)
+        tail = _raw_field(chunk[chunk.rfind(b"\n", 0, len(chunk) - 1) + 1:], _TIMESTAMP_KEY)
+        levels = _LEVEL_RE.findall(chunk) if self.filter.covers(head, tail) else []
+        functions = _FUNCTION_RE.findall(chunk) if len(levels) == lines else []
+        if len(functions) != lines:
+            # Filtered by logger/module, straddling a time bound, or holding
+            # lines without the usual fields: check each line that could
+            # match.
+            for line in _candidate_lines(chunk, self.filter.needles):
+                self.add_line(line)
+            return
+        accepted = self.filter.levels
+        for (level, function), count in Counter(zip(levels, functions)).items():
+            if level in accepted:
+                self.summary.matched += count
+                self._count(level, function, count)
+        if head is not None:
+            self.first = self.first or head
+            self.last = tail or self.last
+        # Timing lines are few; find them by their markers.
+        for line in _candidate_lines(chunk, self.markers):
+            if _raw_field(line, _LEVEL_KEY) in accepted:
+                self._add_timings(line, (_raw_field(line, _MODULE_KEY) or b"?", _raw_field(line, _FUNCTION_KEY) or b"?"))
+
+    def result(self) -> LogSummary:
+        """The LogSummary of everything fed so far, with raw bytes decoded."""
+        summary = self.summary
+        summary.levels = Counter({level.decode("ascii", "replace"): count for level, count in self.levels.items()})
+        summary.first_timestamp = self.first.decode("ascii", "replace") if self.first else ""
+        summary.last_timestamp = self.last.decode("ascii", "replace") if self.last else ""
+        summary.functions = {_function_name(function): counts for function, counts in self.functions.items()}
+        summary.timings = {(name.decode("utf-8", "replace"), _function_name(function)): histogram
+                           for (name, function), histogram in self.timings.items()}
+        return summary
+
+
+def _line_at(chunk: bytes, position: int) -> Tuple[int, int]:
+    """Start and end offsets of the line containing position."""
+    end = chunk.find(b"\n", position)
+    return chunk.rfind(b"\n", 0, position) + 1, len(chunk) if end < 0 else end
+
+
+def _candidate_lines(chunk: bytes, needles: Sequence[bytes]) -> Iterator[bytes]:
+    """The lines of chunk containing any of needles (all lines if none),
+    in order."""
+    if not needles:
+        yield from chunk.splitlines()
+        return
+    starts = {}
+    for needle in needles:
+        position = chunk.find(needle)
+        while position >= 0:
+            start, end = _line_at(chunk, position)
+            starts[start] = end
+            position = chunk.find(needle, end)
+    for start in sorted(starts):
+        yield chunk[start:starts[start]]
+
+
+def _chunks(f_in: BinaryIO) -> Iterator[bytes]:
+    """The file in blocks of whole lines, about _CHUNK_SIZE bytes each."""
+    rest = b""
+    while True:
+        block = f_in.read(_CHUNK_SIZE)
+        if not block:
+            if rest:
+                yield rest
+            return
+        block = rest + block
+        cut = block.rfind(b"\n") + 1
+        rest = block[cut:]
+        if cut:
+            yield block[:cut]
+
+
+def analyze(paths: Iterable[pathlib.Path], log_filter: Optional[LogFilter] = None,
+            timing_fields: Sequence[str] = ()) -> LogSummary:
+    """Scan log segments in order and aggregate the records log_filter
+    accepts."""
+    aggregator = _Aggregator(log_filter or LogFilter(), timing_fields)
+    paths = list(paths)
+    bounds = []
+    for path in paths:
+        try:
+            bounds.append(_segment_bounds(path))
+        except (OSError, EOFError):
+            bounds.append((None, None))
+    for index, path in enumerate(paths):
+        first, last = bounds[index]
+        if last is None and index + 1 < len(bounds):
+            # Everything in a segment precedes the next one's first record.
+            last = bounds[index + 1][0]
+        if not aggregator.filter.segment_in_range(first, last):
+            continue
+        aggregator.summary.segments += 1
+        with open_segment(path) as f_in:
+            for chunk in _chunks(f_in):
+                aggregator.add_chunk(chunk)
+    return aggregator.result()
+
+
+def _function_name(function: Tuple[bytes, bytes]) -> str:
+    return b".".join(function).decode("utf-8", "replace")
+
+
+SUMMARY_COLUMNS = ["kind", "name", "count", "errors", "warnings", "mean", "p50", "p90", "p99", "max"]
+
+
+def summary_rows(summary: LogSummary) -> Iterator[List[object]]:
+    """The summary as rows of SUMMARY_COLUMNS: one "scan" row, then rows per
+    "level", per "function" (most errors first) and per "timing" field and
+    function (slowest p99 first)."""
+    yield ["scan", f"{summary.segments} segment(s), {summary.bytes_read} bytes, "
+                   f"{summary.first_timestamp} .. {summary.last_timestamp}",
+           summary.matched, sum(counts[1] for counts in summary.functions.values()),
+           sum(counts[2] for counts in summary.functions.values()), None, None, None, None, None]
+    for level in sorted(summary.levels, key=lambda name: LEVELS.get(name, 0)):
+        yield ["level", level, summary.levels[level], None, None, None, None, None, None, None]
+    for name, (records, errors, warnings) in sorted(summary.functions.items(),
+                                                    key=lambda item: (-item[1][1], -item[1][2], -item[1][0])):
+        yield ["function", name, records, errors, warnings, None, None, None, None, None]
+    for (name, function), histogram in sorted(summary.timings.items(), key=lambda item: -item[1].percentile(0.99)):
+        yield ["timing", f"{name} {function}", histogram.count, None, None, round(histogram.mean, 3),
+               round(histogram.percentile(0.5), 3), round(histogram.percentile(0.9), 3),
+               round(histogram.percentile(0.99), 3), histogram.maximum]
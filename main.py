@@ -1,5 +1,8 @@
 import argparse
 import configparser
+import contextlib
+import csv
+import getpass
 import json
 import logging
 import logging.config
@@ -8,8 +11,14 @@ import os
 import pathlib
 import signal
 import sys
+import time
+import urllib.parse
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence
 import psycopg2
-import main_gui
+from audit import connection_options, history_changes
+from caching import ChangeListener
+from database import DatabaseManager, Part, PartConflictError, interned_part
+from part_values import parse_range_query
 
 logger = logging.getLogger("DashN2kMonitor")
 
@@ -36,7 +45,9 @@ if sys.platform.startswith('darwin'):
 
 
 def _signal_cntrl_c(os_signal, os_frame):
+    global SHUTDOWN  # pylint: disable=global-statement
     logger.info("Shutdown")
+    SHUTDOWN = True
     if MAIN_GUI:
         MAIN_GUI.close()
 
@@ -47,7 +58,7 @@ def _get_log_level(level) -> int:
         log_level = logging.WARN
     elif level == 2:
         log_level = logging.INFO
-    elif level == 3:
+    elif level >= 3:
         log_level = logging.DEBUG
     return log_level
 
@@ -70,20 +81,380 @@ def _parse_commandline_arguments() -> argparse.Namespace:
     parser.add_argument(
         "-v",
         "--verbose",
-        const=1,
+        action="count",
         default=0,
-        type=int,
-        nargs="?",
-        help="""increase verbosity:
-                        0 = Not set,  1 only warnings, 2 = info, 3 = debug.
-                        No number means info. Default is no verbosity.""",
+        help="""increase verbosity, repeat for more:
+                        -v only warnings, -vv = info, -vvv = debug.
+                        Default is the log_level from the config file.""",
     )
     parser.add_argument("-l", "--logfile", dest="logfilename",
                         default="", help="logfile location", metavar="FILE")
+    _add_cli_commands(parser)
     args = parser.parse_args()
     return args
 
 
+# Headless command line. Any subcommand runs without the GUI (and without
+# importing Tk), writing JSON lines or CSV to stdout, so scripts and CI can
+# query and edit the library directly. No subcommand starts the GUI.
+# The log analyser and the HTTP server are imported only by the subcommands
+# that use them, to keep the quick commands quick.
+
+LOG_LEVELS = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]  # log_analyzer.LEVELS
+
+
+def _add_cli_commands(parser: argparse.ArgumentParser) -> None:
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument("--format", choices=("json", "csv"), default="json",
+                        help="output as JSON lines (default) or CSV with a header row")
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    _add_part_commands(commands, output)
+    _add_import_export_commands(commands, output)
+    _add_module_commands(commands, output)
+    _add_logs_command(commands, output)
+    _add_serve_command(commands, output)
+
+
+def _add_part_commands(commands, output: argparse.ArgumentParser) -> None:
+    """search, get, add and update."""
+    search = commands.add_parser("search", parents=[output], help="search parts like the GUI search bar")
+    search.add_argument("term", nargs="?", default="", help='text, or a value range such as "C 90n..110n"')
+    search.add_argument("--type", dest="component_type", help="only this component type")
+    search.add_argument("--sort", choices=sorted(DatabaseManager.SORTABLE_COLUMNS))
+    search.add_argument("--desc", action="store_true", help="sort descending")
+
+    get = commands.add_parser("get", parents=[output], help="print whole parts")
+    get.add_argument("part_numbers", nargs="+", metavar="KICAD_PART_NUMBER")
+
+    add = commands.add_parser("add", parents=[output], help="add one part")
+    add.add_argument("kicad_part_number")
+    add.add_argument("--set", dest="assignments", action="append", default=[], metavar="COLUMN=VALUE")
+
+    update = commands.add_parser("update", parents=[output], help="set columns on one or more parts")
+    update.add_argument("part_numbers", nargs="+", metavar="KICAD_PART_NUMBER")
+    update.add_argument("--set", dest="assignments", action="append", required=True, metavar="COLUMN=VALUE")
+
+
+def _add_import_export_commands(commands, output: argparse.ArgumentParser) -> None:
+    """import parts/prices, export and history."""
+    import_ = commands.add_parser("import", parents=[output], help="bulk-load parts or supplier prices")
+    import_kinds = import_.add_subparsers(dest="kind", metavar="KIND", required=True)
+    import_parts = import_kinds.add_parser("parts", help="parts from CSV or JSON lines, in one transaction")
+    import_parts.add_argument("file", help='file to read, "-" for stdin')
+    import_parts.add_argument("--input-format", choices=("json", "csv"),
+                              help="default: from the extension, JSON lines for stdin")
+    import_prices = import_kinds.add_parser("prices", help="a supplier price file (CSV)")
+    import_prices.add_argument("supplier_name")
+    import_prices.add_argument("file")
+
+    export = commands.add_parser("export", parents=[output], help="stream whole parts")
+    export.add_argument("--type", dest="component_type", help="only this component type")
+    export.add_argument("--search", dest="term", help="only parts matching this text")
+    export.add_argument("--as-of", metavar="TIMESTAMP", help='the library as it was then, e.g. "2026-03-01 12:00"')
+
+    history = commands.add_parser("history", parents=[output], help="every recorded change to a part")
+    history.add_argument("kicad_part_number")
+
+
+def _add_module_commands(commands, output: argparse.ArgumentParser) -> None:
+    """module list/explode/where-used/nest."""
+    module = commands.add_parser("module", parents=[output], help="module operations")
+    module_actions = module.add_subparsers(dest="action", metavar="ACTION", required=True)
+    module_actions.add_parser("list", help="all modules")
+    explode = module_actions.add_parser("explode", help="every part in a module, through nested modules")
+    explode.add_argument("kicad_part_number")
+    where_used = module_actions.add_parser("where-used", help="every module containing a part or module")
+    where_used.add_argument("kicad_part_number")
+    nest = module_actions.add_parser("nest", help="nest one module inside another")
+    nest.add_argument("parent")
+    nest.add_argument("child")
+    nest.add_argument("--quantity", type=int, default=1)
+
+
+def _add_logs_command(commands, output: argparse.ArgumentParser) -> None:
+    """logs (see _analyze_logs)."""
+    logs = commands.add_parser("logs", parents=[output], help="summarise the JSON log and its rotations")
+    logs.add_argument("--path", type=pathlib.Path, help="the log file (default: from logger_config.json)")
+    logs.add_argument("--level", default="DEBUG", type=str.upper, choices=LOG_LEVELS, help="this level and above")
+    logs.add_argument("--logger", dest="loggers", action="append", default=[], help="only this logger and its children")
+    logs.add_argument("--module", dest="modules", action="append", default=[], help="only records from this module")
+    logs.add_argument("--since", metavar="TIMESTAMP", help='e.g. "2026-03-01 12:00" (local time unless an offset is given)')
+    logs.add_argument("--until", metavar="TIMESTAMP")
+    logs.add_argument("--field", dest="timing_fields", action="append", default=[],
+                      help="also aggregate this numeric field (fields ending in _ms always are)")
+
+
+def _add_serve_command(commands, output: argparse.ArgumentParser) -> None:
+    """serve (see _serve_http_library)."""
+    serve = commands.add_parser("serve", parents=[output], help="serve the library to KiCad over HTTP")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--token", default="", help="require this API token (KiCad sends it from the .kicad_httplib)")
+    serve.add_argument("--httplib", metavar="FILE", help="write a .kicad_httplib pointing at the server")
+    serve.add_argument("--benchmark", type=int, metavar="CLIENTS",
+                       help="instead of serving, measure requests/s with this many concurrent clients")
+
+
+PART_COLUMNS = ["kicad_part_number"] + DatabaseManager.PART_EDIT_COLUMNS
+BOOLEAN_COLUMNS = {"exclude_from_bom", "exclude_from_board", "exclude_from_sim"}
+
+
+def _write_rows(columns: Sequence[str], rows: Iterable[Sequence[object]], output_format: str) -> int:
+    """Stream rows to stdout as JSON lines or CSV. Returns the row count."""
+    count = 0
+    if output_format == "csv":
+        writer = csv.writer(sys.stdout)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    else:
+        for row in rows:
+            sys.stdout.write(json.dumps(dict(zip(columns, row)), default=str) + "\n")
+            count += 1
+    sys.stdout.flush()
+    return count
+
+
+def _coerce(column: str, value: object) -> object:
+    if column not in PART_COLUMNS:
+        raise ValueError(f"Unknown part column: {column}")
+    if column in BOOLEAN_COLUMNS and isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "y", "x")
+    return "" if value is None else value
+
+
+def _parse_assignments(assignments: List[str]) -> Dict[str, object]:
+    changes = {}
+    for assignment in assignments:
+        column, sep, value = assignment.partition("=")
+        if not sep:
+            raise ValueError(f"Expected COLUMN=VALUE, got {assignment!r}")
+        changes[column.strip()] = _coerce(column.strip(), value)
+    return changes
+
+
+def _read_records(path: str, input_format: str) -> Iterator[Dict[str, object]]:
+    """Records from a CSV file (header row) or JSON lines; "-" is stdin."""
+    # stdin is wrapped, not closed: it belongs to the process.
+    with (contextlib.nullcontext(sys.stdin) if path == "-"
+          else open(path, newline="", encoding="utf-8-sig")) as f_in:
+        if input_format == "csv":
+            yield from csv.DictReader(f_in)
+        else:
+            for line in f_in:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _analyze_logs(args: argparse.Namespace) -> int:
+    """Summarise the JSON log: counts per level and function, timing
+    percentiles."""
+    # pylint: disable-next=import-outside-toplevel
+    from log_analyzer import SUMMARY_COLUMNS, LogFilter, analyze, log_path_from_config, log_segments, summary_rows
+    try:
+        log_filter = LogFilter(min_level=args.level, loggers=args.loggers, modules=args.modules,
+                               since=args.since, until=args.until)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    segments = log_segments(args.path or log_path_from_config())
+    if not segments:
+        print(f"No log files at {args.path or log_path_from_config()}", file=sys.stderr)
+        return 1
+    started = time.perf_counter()
+    try:
+        summary = analyze(segments, log_filter, args.timing_fields)
+    except (OSError, EOFError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    logger.info("Read %d lines (%.1f MB) in %.2f s", summary.lines, summary.bytes_read / 1e6,
+                time.perf_counter() - started)
+    _write_rows(SUMMARY_COLUMNS, summary_rows(summary), args.format)
+    return 0
+
+
+def _serve_http_library(args: argparse.Namespace, config: configparser.ConfigParser) -> int:
+    """Run the KiCad HTTP library server until Ctrl-C (or benchmark it)."""
+    from http_library import LibraryServer, benchmark_server, category_id, write_httplib_file  # pylint: disable=import-outside-toplevel
+    settings = dict(config["DATABASE"])
+
+    def make_db_manager() -> DatabaseManager:
+        connection = _make_db_connection(**settings)
+        connection.autocommit = True
+        return DatabaseManager(connection)
+
+    server = LibraryServer(make_db_manager, args.host, args.port, args.token)
+    listener = ChangeListener(lambda: _make_db_connection(**settings), server.invalidate)
+    server.start()
+    listener.start()
+    try:
+        if args.httplib:
+            write_httplib_file(pathlib.Path(args.httplib), server.root_url, token=args.token)
+        if args.benchmark:
+            try:
+                db_manager = make_db_manager()
+            except psycopg2.Error as e:
+                return _report_connection_error(e)
+            counts = db_manager.get_component_type_counts()
+            largest = max(counts, key=counts.get) if counts else ""
+            part_numbers = [row[0] for row in db_manager.get_category_parts(largest)[:20]]
+            db_manager.db_connection.close()
+            paths = ["/categories.json", f"/parts/category/{category_id(largest)}.json"]
+            paths += [f"/parts/{urllib.parse.quote(part_number, safe='')}.json" for part_number in part_numbers]
+            results = benchmark_server(server.root_url, paths, clients=args.benchmark)
+            _write_rows(list(results), [list(results.values())], args.format)
+            return 0
+        print(f"Serving KiCad HTTP library at {server.root_url}", file=sys.stderr)
+        while not SHUTDOWN:
+            time.sleep(0.5)
+    finally:
+        listener.stop()
+        server.stop()
+    return 0
+
+
+# The database subcommands, one handler each. A handler writes its rows to
+# stdout and returns the exit status; _run_cli() looks it up by
+# _cli_command_name(args) ("search", "import parts", "module nest", ...).
+
+def _cli_search(db_manager: DatabaseManager, args: argparse.Namespace) -> int:
+    value_range = parse_range_query(args.term)
+    rows = db_manager.get_parts(component_type_filter=args.component_type,
+                                search_term=None if value_range else args.term or None,
+                                sort_column=args.sort, sort_descending=args.desc, value_range=value_range)
+    _write_rows(DatabaseManager.PART_LIST_COLUMNS, rows, args.format)
+    return 0
+
+
+def _cli_get(db_manager: DatabaseManager, args: argparse.Namespace) -> int:
+    status = 0
+    found = []
+    for kicad_part_number in args.part_numbers:
+        result = db_manager.get_part(kicad_part_number)
+        if result is None:
+            print(f"Not found: {kicad_part_number}", file=sys.stderr)
+            status = 1
+            continue
+        part, version = result
+        found.append([getattr(part, column) for column in PART_COLUMNS] + [version])
+    _write_rows(PART_COLUMNS + ["version"], found, args.format)
+    return status
+
+
+def _cli_add(db_manager: DatabaseManager, args: argparse.Namespace) -> int:
+    part = Part(kicad_part_number=args.kicad_part_number, **_parse_assignments(args.assignments))
+    db_manager.add_part(part)
+    _write_rows(["added"], [[1]], args.format)
+    return 0
+
+
+def _cli_update(db_manager: DatabaseManager, args: argparse.Namespace) -> int:
+    updated = db_manager.bulk_update_parts(args.part_numbers, _parse_assignments(args.assignments))
+    _write_rows(["updated"], [[updated]], args.format)
+    return 1 if updated < len(set(args.part_numbers)) else 0
+
+
+def _cli_import_parts(db_manager: DatabaseManager, args: argparse.Namespace) -> int:
+    input_format = args.input_format or ("csv" if args.file.lower().endswith(".csv") else "json")
+    parts = [interned_part(**{column: _coerce(column, value) for column, value in record.items()})
+             for record in _read_records(args.file, input_format)]
+    _write_rows(["added"], [[db_manager.add_parts(parts)]], args.format)
+    return 0
+
+
+def _cli_import_prices(db_manager: DatabaseManager, args: argparse.Namespace) -> int:
+    offers, breaks = db_manager.import_supplier_prices(args.supplier_name, args.file)
+    _write_rows(["offers", "price_breaks"], [[offers, breaks]], args.format)
+    return 0
+
+
+def _cli_export(db_manager: DatabaseManager, args: argparse.Namespace) -> int:
+    _write_rows(PART_COLUMNS, db_manager.iter_parts(args.component_type, args.term, as_of=args.as_of), args.format)
+    return 0
+
+
+def _cli_history(db_manager: DatabaseManager, args: argparse.Namespace) -> int:
+    changes = history_changes(db_manager.get_part_history(args.kicad_part_number))
+    if not changes:
+        print(f"No history for {args.kicad_part_number}", file=sys.stderr)
+    _write_rows(["changed_at", "changed_by", "action", "column", "before", "after"],
+                ([changed_at, changed_by, action, column, before, after]
+                 for changed_at, changed_by, action, columns in changes
+                 for column, (before, after) in (columns.items() or [(None, (None, None))])),
+                args.format)
+    return 0 if changes else 1
+
+
+def _cli_module_list(db_manager: DatabaseManager, args: argparse.Namespace) -> int:
+    _write_rows(["kicad_part_number", "description", "parts", "submodules"], db_manager.get_modules(), args.format)
+    return 0
+
+
+def _cli_module_explode(db_manager: DatabaseManager, args: argparse.Namespace) -> int:
+    _write_rows(["kicad_part_number", "description", "manufacturer", "manufacturer_part_number", "value",
+                 "quantity", "depth"], db_manager.explode_module(args.kicad_part_number), args.format)
+    return 0
+
+
+def _cli_module_where_used(db_manager: DatabaseManager, args: argparse.Namespace) -> int:
+    _write_rows(["module", "description", "depth", "quantity"], db_manager.get_where_used(args.kicad_part_number),
+                args.format)
+    return 0
+
+
+def _cli_module_nest(db_manager: DatabaseManager, args: argparse.Namespace) -> int:
+    db_manager.add_module_submodule(args.parent, args.child, args.quantity)
+    _write_rows(["nested"], [[1]], args.format)
+    return 0
+
+
+CLI_HANDLERS: Dict[str, Callable[[DatabaseManager, argparse.Namespace], int]] = {
+    "search": _cli_search,
+    "get": _cli_get,
+    "add": _cli_add,
+    "update": _cli_update,
+    "import parts": _cli_import_parts,
+    "import prices": _cli_import_prices,
+    "export": _cli_export,
+    "history": _cli_history,
+    "module list": _cli_module_list,
+    "module explode": _cli_module_explode,
+    "module where-used": _cli_module_where_used,
+    "module nest": _cli_module_nest,
+}
+# Subcommands that write, so need the schema extensions applied first.
+CLI_WRITE_COMMANDS = {"add", "update", "import parts", "import prices", "module nest"}
+
+
+def _cli_command_name(args: argparse.Namespace) -> str:
+    """The CLI_HANDLERS key for args: the command, then its kind or action."""
+    return " ".join(filter(None, (args.command, getattr(args, "kind", None), getattr(args, "action", None))))
+
+
+def _run_cli(args: argparse.Namespace, config: configparser.ConfigParser) -> int:
+    """Run one CLI subcommand against the configured database. Returns the
+    process exit status."""
+    command = _cli_command_name(args)
+    try:
+        connection = _make_db_connection(**dict(config["DATABASE"]))
+    except psycopg2.Error as e:
+        return _report_connection_error(e)
+    db_manager = DatabaseManager(connection)
+    try:
+        if command in CLI_WRITE_COMMANDS:
+            try:
+                db_manager.ensure_schema()
+            except Exception:  # pylint: disable=broad-except
+                logger.warning("Could not apply schema extensions", exc_info=True)
+        return CLI_HANDLERS[command](db_manager, args)
+    except (ValueError, TypeError, PartConflictError, psycopg2.Error) as e:
+        print(f"Error: {str(e).strip()}", file=sys.stderr)
+        return 2
+    finally:
+        connection.close()
+
+
 def _save_config():
     if CONFIG_FILE_PARSER is not None:
         with open(CONFIG_FILENAME, 'w', encoding='utf-8') as configfile:
@@ -98,8 +469,8 @@ def _parse_config():
     CONFIG_FILE_PARSER.defaults()
 
     try:
-        ini_f = open(CONFIG_FILENAME, encoding='utf-8')
-        ini_f.close()
+        with open(CONFIG_FILENAME, encoding='utf-8'):
+            pass
     except FileNotFoundError:
         default = {
             'log_level': 3
@@ -126,6 +497,15 @@ def _parse_config():
     return CONFIG_FILE_PARSER
 
 
+def _app_user() -> str:
+    """The login name of whoever runs the tool, which the audit log records
+    as changed_by ("" if the OS can't say, leaving the database role)."""
+    try:
+        return getpass.getuser()
+    except (OSError, KeyError, ImportError):
+        return ""
+
+
 def _make_db_connection(**kwargs):
     connection = psycopg2.connect(
         user=kwargs["db_user"],
@@ -133,10 +513,17 @@ def _make_db_connection(**kwargs):
         host=kwargs["db_host"],
         port=kwargs["db_port"],
         database=kwargs["db_database"],
+        options=connection_options(_app_user()),
     )
     return connection
 
 
+def _report_connection_error(error: psycopg2.Error) -> int:
+    """One line on stderr instead of a traceback. Returns the exit status."""
+    print(f"Error: could not connect to the database: {str(error).strip().splitlines()[0]}", file=sys.stderr)
+    return 1
+
+
 def _apply_new_db_settings(new_settings: dict):
     """Callback handed to MainGUI so its Database Connection window can
     swap connections at runtime.
@@ -183,6 +570,15 @@ def main():
     if log_level == 0:
         log_level = config.getint('DEFAULT', 'log_level')
 
+    if args.command:
+        # Headless: log to stderr only, keeping stdout for the data.
+        logging.basicConfig(level=_get_log_level(args.verbose) or logging.WARNING, stream=sys.stderr)
+        if args.command == "logs":
+            sys.exit(_analyze_logs(args))
+        if args.command == "serve":
+            sys.exit(_serve_http_library(args, config))
+        sys.exit(_run_cli(args, config))
+
     _setup_logging()
 
     logger.info("Starting up")
@@ -191,11 +587,15 @@ def main():
     db_settings = dict(config['DATABASE'])
     DB_CONNECTION = _make_db_connection(**db_settings)
 
-    global MAIN_GUI
+    # Imported here so the CLI never loads Tk.
+    import main_gui  # pylint: disable=import-outside-toplevel
+
+    global MAIN_GUI  # pylint: disable=global-statement
     MAIN_GUI = main_gui.MainGUI(
         DB_CONNECTION,
         connection_settings=db_settings,
         on_update_connection=_apply_new_db_settings,
+        connection_factory=_make_db_connection,
     )
     try:
         MAIN_GUI.run()
@@ -208,4 +608,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,209 +1,49 @@
 """
 KiCad Database Library Manager - Refactored Version
 """
+import csv
+import logging
+import os
+import pathlib
+import re
+import sqlite3
+import threading
+import webbrowser
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, simpledialog, filedialog
 from typing import Callable, Dict, List, Optional, Tuple
-from dataclasses import dataclass, field
+from dataclasses import replace
 from abc import ABC, abstractmethod
 from ttkbootstrap import Style
-
-
-@dataclass
-class Part:
-    """Data class representing a part in the database."""
-    description: str = ""
-    datasheet: str = ""
-    footprint_ref: str = ""
-    symbol_ref: str = ""
-    model_ref: str = ""
-    kicad_part_number: str = ""
-    manufacturer_part_number: str = ""
-    manufacturer: str = ""
-    manufacturer_part_url: str = ""
-    note: str = ""
-    value: str = ""
-    component_type: str = ""
-    exclude_from_bom: bool = False
-    exclude_from_board: bool = False
-    exclude_from_sim: bool = False
-
-
-@dataclass
-class Module:
-    """Data class representing a module in the database."""
-    description: str = ""
-    datasheet: str = ""
-    footprint_ref: str = ""
-    symbol_ref: str = ""
-    model_ref: str = ""
-    kicad_part_number: str = ""
-    manufacturer_part_number: str = ""
-    manufacturer: str = ""
-    manufacturer_part_url: str = ""
-    note: str = ""
-    value: str = ""
-    parts: List[str] = field(default_factory=list)
-
-
-@dataclass
-class Supplier:
-    """Data class representing a supplier in the database."""
-    supplier_name: str = ""
-    supplier_address: str = ""
-    supplier_web_url: str = ""
-    supplier_phone: str = ""
-    supplier_email: str = ""
-
-
-class DatabaseManager:
-    """Handles all database operations."""
-
-    def __init__(self, db_connection):
-        self.db_connection = db_connection
-        self.cursor = db_connection.cursor()
-
-    def add_part(self, part: Part) -> None:
-        """Add a new part to the database."""
-        sql = """INSERT INTO parts (description, datasheet, footprint_ref,
-                symbol_ref, model_ref, kicad_part_number, manufacturer_part_number,
-                manufacturer, manufacturer_part_url, note, value, component_type,
-                exclude_from_bom, exclude_from_board, exclude_from_sim)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"""
-        values = [
-            part.description, part.datasheet, part.footprint_ref,
-            part.symbol_ref, part.model_ref, part.kicad_part_number,
-            part.manufacturer_part_number, part.manufacturer,
-            part.manufacturer_part_url, part.note, part.value, part.component_type,
-            part.exclude_from_bom, part.exclude_from_board, part.exclude_from_sim
-        ]
-        self.cursor.execute(sql, values)
-        self.db_connection.commit()
-
-    def update_part(self, part: Part) -> None:
-        """Update an existing part in the database."""
-        sql = """UPDATE parts SET description = %s, datasheet = %s, footprint_ref = %s,
-                symbol_ref = %s, model_ref = %s, manufacturer_part_number = %s,
-                manufacturer = %s, manufacturer_part_url = %s, note = %s, value = %s,
-                component_type = %s, exclude_from_bom = %s, exclude_from_board = %s,
-                exclude_from_sim = %s WHERE kicad_part_number = %s"""
-        values = [
-            part.description, part.datasheet, part.footprint_ref,
-            part.symbol_ref, part.model_ref, part.manufacturer_part_number,
-            part.manufacturer, part.manufacturer_part_url, part.note,
-            part.value, part.component_type,
-            part.exclude_from_bom, part.exclude_from_board, part.exclude_from_sim,
-            part.kicad_part_number
-        ]
-        self.cursor.execute(sql, values)
-        self.db_connection.commit()
-
-    # Whitelist mapping of sortable treeview columns to actual DB columns.
-    # Used to build ORDER BY safely (never interpolate raw column names from callers).
-    SORTABLE_COLUMNS = {
-        "kicad_part_number": "kicad_part_number",
-        "description": "description",
-        "component_type": "component_type",
-        "value": "value",
-        "symbol_ref": "symbol_ref",
-        "footprint_ref": "footprint_ref",
-        "manufacturer": "manufacturer",
-        "manufacturer_part_number": "manufacturer_part_number",
-    }
-
-    def get_parts(self, component_type_filter: Optional[str] = None,
-                  search_term: Optional[str] = None,
-                  sort_column: Optional[str] = None,
-                  sort_descending: bool = False) -> List[Tuple]:
-        """Retrieve parts from the database, optionally filtered by component type
-        and/or a search term, and optionally sorted by a whitelisted column."""
-        base_sql = """SELECT kicad_part_number, description, component_type, value,
-                symbol_ref, footprint_ref, manufacturer, manufacturer_part_number
-                FROM parts"""
-
-        conditions = []
-        params: List[str] = []
-
-        if component_type_filter:
-            conditions.append("component_type = %s")
-            params.append(component_type_filter)
-
-        if search_term:
-            conditions.append("""(description ILIKE %s OR kicad_part_number ILIKE %s
-                    OR manufacturer_part_number ILIKE %s OR manufacturer ILIKE %s
-                    OR value ILIKE %s)""")
-            like_term = f"%{search_term}%"
-            params.extend([like_term] * 5)
-
-        sql = base_sql
-        if conditions:
-            sql += " WHERE " + " AND ".join(conditions)
-
-        # Validate sort_column against the whitelist to avoid SQL injection via ORDER BY.
-        if sort_column and sort_column in self.SORTABLE_COLUMNS:
-            direction = "DESC" if sort_descending else "ASC"
-            sql += f" ORDER BY {self.SORTABLE_COLUMNS[sort_column]} {direction}"
-
-        self.cursor.execute(sql, params)
-        return self.cursor.fetchall()
-
-    def get_part_details(self, kicad_part_number: str) -> Optional[Tuple]:
-        """Get detailed information for a specific part."""
-        sql = """SELECT description, datasheet, footprint_ref, symbol_ref, model_ref,
-                manufacturer_part_number, manufacturer, manufacturer_part_url, note,
-                value, component_type, exclude_from_bom, exclude_from_board,
-                exclude_from_sim FROM parts WHERE kicad_part_number = %s"""
-        self.cursor.execute(sql, (kicad_part_number,))
-        return self.cursor.fetchone()
-
-    def get_parts_for_combobox(self) -> Tuple[List[str], Dict[str, str]]:
-        """Get parts data formatted for combobox usage."""
-        self.cursor.execute("SELECT parts_uuid, kicad_part_number FROM parts")
-        parts = self.cursor.fetchall()
-        part_names = [part[1] for part in parts]
-        parts_uuid_map = {part[1]: part[0] for part in parts}
-        return part_names, parts_uuid_map
-
-    def add_module(self, module: Module) -> str:
-        """Add a new module to the database and return its UUID."""
-        module_sql = """INSERT INTO module (description, datasheet, footprint_ref,
-                        symbol_ref, model_ref, kicad_part_number, manufacturer_part_number,
-                        manufacturer, manufacturer_part_url, note, value)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING module_uuid"""
-        values = [
-            module.description, module.datasheet, module.footprint_ref,
-            module.symbol_ref, module.model_ref, module.kicad_part_number,
-            module.manufacturer_part_number, module.manufacturer,
-            module.manufacturer_part_url, module.note, module.value
-        ]
-        self.cursor.execute(module_sql, values)
-        return self.cursor.fetchone()[0]
-
-    def add_module_parts(self, module_uuid: str, part_uuids: List[str]) -> None:
-        """Add parts to a module."""
-        module_parts_sql = "INSERT INTO module_parts (module_uuid, part_uuid) VALUES (%s, %s)"
-        for part_uuid in part_uuids:
-            self.cursor.execute(module_parts_sql, (module_uuid, part_uuid))
-        self.db_connection.commit()
-
-    def add_supplier(self, supplier: Supplier) -> None:
-        """Add a new supplier to the database."""
-        sql = """INSERT INTO supplier (supplier_name, supplier_address, supplier_web_url,
-                supplier_phone, supplier_email) VALUES (%s, %s, %s, %s, %s)"""
-        values = [
-            supplier.supplier_name, supplier.supplier_address, supplier.supplier_web_url,
-            supplier.supplier_phone, supplier.supplier_email
-        ]
-        self.cursor.execute(sql, values)
-        self.db_connection.commit()
+from bom import BomReport, read_bom, resolve_bom, write_bom_csv
+from pricing import DEFAULT_CURRENCY, BomPricing, OfferCache, Supplier, best_quotes, price_bom
+from caching import ChangeEvent, ChangeListener, LookupCache, TTLCache
+from kicad_libraries import LibraryIndex, ValidationReport, default_library_dirs
+from datasheet_store import DatasheetStore
+from prepared import benchmark_search
+from memory_report import held_sizes, part_record_sizes
+from diagnostics import PlanStore, QueryDiagnostics, index_statement, plan_text, shape_id, suggest_indexes, summarize_plan
+from audit import history_changes
+from journal import EditJournal, JournalConflictError, journal_path_for
+from http_library import LibraryServer, write_httplib_file
+from link_checker import LinkChecker, worst_state
+from kicad_dbl import GenerationReport, KicadDblGenerator, MaterializedViewRefresher, benchmark_lookups
+from part_values import ValueRange, parse_range_query
+from database import DatabaseManager, Part, PartConflictError
+from module_tree import Module
+
+logger = logging.getLogger(__name__)
 
 
 class FormValidator:
     """Handles form validation logic."""
 
     @staticmethod
-    def validate_part(part: Part) -> Tuple[bool, str]:
-        """Validate part data. Returns (is_valid, error_message)."""
+    def validate_part(part: Part, library_index: Optional[LibraryIndex] = None) -> Tuple[bool, str]:
+        """Validate part data. Returns (is_valid, error_message).
+
+        With a loaded library_index, the symbol and footprint refs must also
+        resolve in the local KiCad libraries."""
         required_fields = {
             'KiCAD Part Number': part.kicad_part_number,
             'Manufacturer Part Number': part.manufacturer_part_number,
@@ -215,6 +55,12 @@ class FormValidator:
             if not value or not value.strip():
                 return False, f"{field_name} is required."
 
+        if library_index is not None and library_index.loaded:
+            for column, ref in (("symbol_ref", part.symbol_ref), ("footprint_ref", part.footprint_ref)):
+                problem = library_index.check_ref(column, ref.strip())
+                if problem is not None:
+                    return False, problem[0].upper() + problem[1:] + "."
+
         return True, ""
 
 
@@ -238,13 +84,19 @@ class BaseWindow(ABC):
         """Handle form submission."""
         pass
 
-    def _create_form_fields(self, fields: List[str], defaults: Dict[str, str] | None = None) -> None:
-        """Create form fields with labels and entries."""
+    def _create_form_fields(self, fields: List[str], defaults: Dict[str, str] | None = None,
+                            choices: Dict[str, List[str]] | None = None) -> None:
+        """Create form fields with labels and entries. Fields listed in choices
+        get an editable combobox offering those values instead of a plain entry."""
         defaults = defaults or {}
+        choices = choices or {}
 
         for i, items in enumerate(fields):
             ttk.Label(self.window, text=items).grid(row=i, column=0, sticky="e", padx=5, pady=2)
-            entry = ttk.Entry(self.window)
+            if items in choices:
+                entry = ttk.Combobox(self.window, values=choices[items])
+            else:
+                entry = ttk.Entry(self.window)
             entry.grid(row=i, column=1, sticky="ew", padx=5, pady=2)
 
             # Set default values
@@ -257,6 +109,15 @@ class BaseWindow(ABC):
 
             self.entries[items] = entry
 
+    @staticmethod
+    def _lookup_choices(lookups: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        """Map cached lookup lists onto the form fields they feed."""
+        return {
+            "Manufacturer": lookups.get("manufacturers", []),
+            "Footprint Ref": lookups.get("footprint_libraries", []),
+            "Symbol Ref": lookups.get("symbol_libraries", []),
+        }
+
     def _create_exclude_checkboxes(self, row: int, defaults: Dict[str, bool] | None = None) -> int:
         """Create the exclude_from_bom/board/sim checkboxes starting at the given row.
 
@@ -305,10 +166,13 @@ class AddPartWindow(BaseWindow):
     """Window for adding new parts."""
 
     def __init__(self, parent, db_manager: DatabaseManager, component_types: List[str],
-                 refresh_callback):
+                 refresh_callback, lookups: Optional[Dict[str, List[str]]] = None,
+                 library_index: Optional[LibraryIndex] = None):
         self.db_manager = db_manager
         self.component_types = component_types
         self.refresh_callback = refresh_callback
+        self.lookups = lookups or {}
+        self.library_index = library_index
         super().__init__(parent, "Add Part")
 
     def _setup_window(self) -> None:
@@ -317,7 +181,7 @@ class AddPartWindow(BaseWindow):
             "Model Ref", "KiCad Part Number", "Manufacturer Part Number",
             "Manufacturer", "Manufacturer Part URL", "Note", "Value"
         ]
-        self._create_form_fields(fields)
+        self._create_form_fields(fields, choices=self._lookup_choices(self.lookups))
 
         # Component Type Combobox
         row = len(fields)
@@ -351,7 +215,7 @@ class AddPartWindow(BaseWindow):
         )
 
         # Validate
-        is_valid, error_msg = FormValidator.validate_part(part)
+        is_valid, error_msg = FormValidator.validate_part(part, self.library_index)
         if not is_valid:
             messagebox.showerror("Error", error_msg)
             return
@@ -367,45 +231,59 @@ class AddPartWindow(BaseWindow):
 class EditPartWindow(BaseWindow):
     """Window for editing existing parts."""
 
+    FIELD_COLUMNS = {
+        "Description": "description",
+        "Datasheet": "datasheet",
+        "Footprint Ref": "footprint_ref",
+        "Symbol Ref": "symbol_ref",
+        "Model Ref": "model_ref",
+        "Manufacturer Part Number": "manufacturer_part_number",
+        "Manufacturer": "manufacturer",
+        "Manufacturer Part URL": "manufacturer_part_url",
+        "Note": "note",
+        "Value": "value",
+    }
+
     def __init__(self, parent, db_manager: DatabaseManager, component_types: List[str],
-                 kicad_part_number: str, refresh_callback):
+                 kicad_part_number: str, refresh_callback, lookups: Optional[Dict[str, List[str]]] = None,
+                 library_index: Optional[LibraryIndex] = None):
         self.db_manager = db_manager
         self.component_types = component_types
         self.kicad_part_number = kicad_part_number
         self.refresh_callback = refresh_callback
+        self.library_index = library_index
+        self.lookups = lookups or {}
+        self.original: Optional[Part] = None
+        self.version: Optional[str] = None
         super().__init__(parent, "Edit Part")
 
     def _setup_window(self) -> None:
-        # Get existing part details
-        part_details = self.db_manager.get_part_details(self.kicad_part_number)
-        if not part_details:
+        # Get the existing part and its row version; the version makes the
+        # save a compare-and-swap (see DatabaseManager.update_part)
+        loaded = self.db_manager.get_part(self.kicad_part_number)
+        if not loaded:
             messagebox.showerror("Error", "Part not found")
             self.destroy()
             return
-
-        fields = [
-            "Description", "Datasheet", "Footprint Ref", "Symbol Ref",
-            "Model Ref", "Manufacturer Part Number", "Manufacturer",
-            "Manufacturer Part URL", "Note", "Value"
-        ]
+        self.original, self.version = loaded
 
         # Create defaults dictionary
-        defaults = {field: str(part_details[i]) for i, field in enumerate(fields)}
-        self._create_form_fields(fields, defaults)
+        defaults = {label: getattr(self.original, column) for label, column in self.FIELD_COLUMNS.items()}
+        fields = list(self.FIELD_COLUMNS)
+        self._create_form_fields(fields, defaults, self._lookup_choices(self.lookups))
 
         # Component Type Combobox
         row = len(fields)
         ttk.Label(self.window, text="Component Type").grid(row=row, column=0, sticky="e", padx=5, pady=2)
         self.component_type_combobox = ttk.Combobox(self.window, values=self.component_types)
         self.component_type_combobox.grid(row=row, column=1, sticky="ew", padx=5, pady=2)
-        self.component_type_combobox.set(part_details[10])  # Set current component type
+        self.component_type_combobox.set(self.original.component_type)  # Set current component type
 
         # Exclude checkboxes, pre-populated from existing values
-        # part_details indices: 11=exclude_from_bom, 12=exclude_from_board, 13=exclude_from_sim
         exclude_defaults = {
-            "exclude_from_bom": bool(part_details[11]),
-            "exclude_from_board": bool(part_details[12]),
-            "exclude_from_sim": bool(part_details[13]),
+            "exclude_from_bom": self.original.exclude_from_bom,
+            "exclude_from_board": self.original.exclude_from_board,
+            "exclude_from_sim": self.original.exclude_from_sim,
         }
         row = self._create_exclude_checkboxes(row + 1, exclude_defaults)
 
@@ -432,17 +310,816 @@ class EditPartWindow(BaseWindow):
         )
 
         # Validate
-        is_valid, error_msg = FormValidator.validate_part(part)
+        is_valid, error_msg = FormValidator.validate_part(part, self.library_index)
         if not is_valid:
             messagebox.showerror("Error", error_msg)
             return
 
+        self._save(part, self.original, self.version)
+
+    def _save(self, part: Part, original: Part, version: str) -> None:
+        """Write the changed columns; on a conflict, merge or ask."""
+        try:
+            self.db_manager.update_part(part, original, version)
+        except PartConflictError as conflict:
+            self._resolve_conflict(part, original, conflict)
+            return
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to update part: {str(e)}")
+            return
+        self.refresh_callback()
+        self.destroy()
+
+    def _resolve_conflict(self, part: Part, original: Part, conflict: PartConflictError) -> None:
+        """Someone saved this part after we loaded it. Our edits are re-applied
+        on top of their version; fields we both changed differently go to the
+        conflict dialog."""
+        if conflict.current is None:
+            messagebox.showerror("Error", f"{part.kicad_part_number} was deleted by someone else.")
+            return
+        mine = DatabaseManager.changed_columns(original, part)
+        theirs = set(DatabaseManager.changed_columns(original, conflict.current))
+        merged = replace(conflict.current, **{column: getattr(part, column) for column in mine})
+        contested = [column for column in mine
+                     if column in theirs and getattr(part, column) != getattr(conflict.current, column)]
+        if not contested:
+            self._save(merged, conflict.current, conflict.version)
+            return
+
+        def on_resolved(keep_mine: Dict[str, bool]) -> None:
+            resolved = replace(merged, **{column: getattr(conflict.current, column)
+                                          for column, mine_wins in keep_mine.items() if not mine_wins})
+            self._save(resolved, conflict.current, conflict.version)
+
+        ConflictWindow(self.window, part.kicad_part_number, original, part, conflict.current, contested, on_resolved)
+
+
+class ConflictWindow(BaseWindow):
+    """Shows fields that were changed both here and by someone else since
+    the edit started, and lets the user pick which value to keep for each."""
+
+    def __init__(self, parent, kicad_part_number: str, original: Part, mine: Part, theirs: Part,
+                 columns: List[str], on_resolved: Callable[[Dict[str, bool]], None]):
+        self.kicad_part_number = kicad_part_number
+        self.original = original
+        self.mine = mine
+        self.theirs = theirs
+        self.columns = columns
+        self.on_resolved = on_resolved
+        self.choice_vars: Dict[str, tk.StringVar] = {}
+        super().__init__(parent, f"Edit Conflict - {kicad_part_number}")
+
+    def _setup_window(self) -> None:
+        ttk.Label(self.window, text=f"{self.kicad_part_number} was changed by someone else while you were editing it.").grid(
+            row=0, column=0, columnspan=5, sticky="w", padx=5, pady=5)
+        for col, heading in enumerate(("Field", "Original", "Yours", "Theirs", "Keep")):
+            ttk.Label(self.window, text=heading).grid(row=1, column=col, sticky="w", padx=5)
+        for row, column in enumerate(self.columns, start=2):
+            ttk.Label(self.window, text=column.replace("_", " ").title()).grid(row=row, column=0, sticky="e", padx=5, pady=2)
+            for col, part in enumerate((self.original, self.mine, self.theirs), start=1):
+                ttk.Label(self.window, text=str(getattr(part, column))).grid(row=row, column=col, sticky="w", padx=5, pady=2)
+            self.choice_vars[column] = tk.StringVar(value="Yours")
+            ttk.Combobox(self.window, textvariable=self.choice_vars[column], values=["Yours", "Theirs"],
+                         state="readonly", width=8).grid(row=row, column=4, padx=5, pady=2)
+        button_frame = ttk.Frame(self.window)
+        button_frame.grid(row=len(self.columns) + 2, column=0, columnspan=5, pady=10)
+        ttk.Button(button_frame, text="Save", command=self._on_submit).pack(side="left", padx=(0, 5))
+        ttk.Button(button_frame, text="Cancel", command=self.destroy).pack(side="left")
+
+    def _on_submit(self) -> None:
+        choices = {column: var.get() == "Yours" for column, var in self.choice_vars.items()}
+        self.destroy()
+        self.on_resolved(choices)
+
+
+class BulkEditWindow(BaseWindow):
+    """Window for setting the same field values on many selected parts at once.
+
+    Any field left blank (or "Unchanged" for the exclude flags) is not touched;
+    tick "Clear" beside a field to blank it on every part.
+    """
+
+    FIELD_COLUMNS = {
+        "Description": "description",
+        "Datasheet": "datasheet",
+        "Footprint Ref": "footprint_ref",
+        "Symbol Ref": "symbol_ref",
+        "Model Ref": "model_ref",
+        "Manufacturer Part Number": "manufacturer_part_number",
+        "Manufacturer": "manufacturer",
+        "Manufacturer Part URL": "manufacturer_part_url",
+        "Note": "note",
+        "Value": "value",
+    }
+
+    FLAG_CHOICES = ["Unchanged", "Yes", "No"]
+
+    def __init__(self, parent, db_manager: DatabaseManager, component_types: List[str],
+                 kicad_part_numbers: List[str], refresh_callback, lookups: Optional[Dict[str, List[str]]] = None):
+        self.db_manager = db_manager
+        self.component_types = component_types
+        self.kicad_part_numbers = kicad_part_numbers
+        self.refresh_callback = refresh_callback
+        self.lookups = lookups or {}
+        super().__init__(parent, f"Bulk Edit ({len(kicad_part_numbers)} parts)")
+
+    def _setup_window(self) -> None:
+        fields = list(self.FIELD_COLUMNS)
+        # Blank defaults so the usual "db_footprints:"/"db_library:" prefixes
+        # aren't mistaken for an edit.
+        self._create_form_fields(fields, {name: "" for name in fields}, self._lookup_choices(self.lookups))
+        self.clear_vars: Dict[str, tk.BooleanVar] = {}
+        for row, label in enumerate(fields):
+            var = tk.BooleanVar(value=False)
+            entry = self.entries[label]
+            ttk.Checkbutton(self.window, text="Clear", variable=var,
+                            command=lambda entry=entry, var=var: entry.config(state="disabled" if var.get() else "normal")
+                            ).grid(row=row, column=2, sticky="w", padx=5, pady=2)
+            self.clear_vars[label] = var
+
+        row = len(fields)
+        ttk.Label(self.window, text="Component Type").grid(row=row, column=0, sticky="e", padx=5, pady=2)
+        self.component_type_combobox = ttk.Combobox(self.window, values=self.component_types)
+        self.component_type_combobox.grid(row=row, column=1, sticky="ew", padx=5, pady=2)
+
+        self.flag_comboboxes: Dict[str, ttk.Combobox] = {}
+        for label, key in [("Exclude from BOM", "exclude_from_bom"),
+                           ("Exclude from Board", "exclude_from_board"),
+                           ("Exclude from Sim", "exclude_from_sim")]:
+            row += 1
+            ttk.Label(self.window, text=label).grid(row=row, column=0, sticky="e", padx=5, pady=2)
+            combobox = ttk.Combobox(self.window, values=self.FLAG_CHOICES, state="readonly")
+            combobox.set(self.FLAG_CHOICES[0])
+            combobox.grid(row=row, column=1, sticky="ew", padx=5, pady=2)
+            self.flag_comboboxes[key] = combobox
+
+        self._create_submit_button("Apply", row + 1)
+
+    def _collect_changes(self) -> Dict[str, object]:
+        """Gather only the fields the user actually filled in or cleared."""
+        changes: Dict[str, object] = {}
+        for label, column in self.FIELD_COLUMNS.items():
+            value = self.entries[label].get()
+            if self.clear_vars[label].get():
+                changes[column] = ""
+            elif value.strip():
+                changes[column] = value
+        component_type = self.component_type_combobox.get()
+        if component_type:
+            changes["component_type"] = component_type
+        for key, combobox in self.flag_comboboxes.items():
+            choice = combobox.get()
+            if choice != "Unchanged":
+                changes[key] = choice == "Yes"
+        return changes
+
+    def _on_submit(self) -> None:
+        changes = self._collect_changes()
+        if not changes:
+            messagebox.showerror("Error", "Nothing to change - fill in or clear at least one field.")
+            return
+
+        count = len(self.kicad_part_numbers)
+        if not messagebox.askyesno("Confirm Bulk Edit",
+                                   f"Update {len(changes)} field(s) on {count} part(s)?"):
+            return
+
         try:
-            self.db_manager.update_part(part)
+            updated = self.db_manager.bulk_update_parts(self.kicad_part_numbers, changes)
             self.refresh_callback()
+            messagebox.showinfo("Bulk Edit", f"Updated {updated} part(s).")
             self.destroy()
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to update part: {str(e)}")
+            messagebox.showerror("Error", f"Failed to update parts: {str(e)}")
+
+
+class FindReplaceWindow(BaseWindow):
+    """Window for a find/replace over one column, either across the selected
+    parts or across everything matching the current filter and search."""
+
+    def __init__(self, parent, db_manager: DatabaseManager, kicad_part_numbers: Optional[List[str]],
+                 facet_filters: Dict[str, List[object]], search_term: Optional[str],
+                 value_range: Optional[ValueRange], refresh_callback):
+        self.db_manager = db_manager
+        # None means "everything matching the current filter/search"
+        self.kicad_part_numbers = kicad_part_numbers
+        self.facet_filters = {facet: list(values) for facet, values in facet_filters.items()}
+        self.search_term = search_term
+        self.value_range = value_range
+        self.refresh_callback = refresh_callback
+        self._pending_changes: List[Tuple[str, str, str]] = []
+        super().__init__(parent, "Find / Replace")
+
+    def _setup_window(self) -> None:
+        ttk.Label(self.window, text="Column").grid(row=0, column=0, sticky="e", padx=5, pady=2)
+        self.column_combobox = ttk.Combobox(self.window, values=sorted(self.db_manager.FIND_REPLACE_COLUMNS), state="readonly")
+        self.column_combobox.set("footprint_ref")
+        self.column_combobox.grid(row=0, column=1, sticky="ew", padx=5, pady=2)
+
+        for row, name in enumerate(["Find", "Replace With"], start=1):
+            ttk.Label(self.window, text=name).grid(row=row, column=0, sticky="e", padx=5, pady=2)
+            entry = ttk.Entry(self.window)
+            entry.grid(row=row, column=1, sticky="ew", padx=5, pady=2)
+            self.entries[name] = entry
+
+        self.regex_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.window, text="Regular expression (\\1 for groups)",
+                        variable=self.regex_var).grid(row=3, column=1, sticky="w", padx=5, pady=2)
+
+        scope = f"{len(self.kicad_part_numbers)} selected part(s)" if self.kicad_part_numbers is not None \
+            else "all parts matching the current filter/search"
+        ttk.Label(self.window, text=f"Scope: {scope}").grid(row=4, column=0, columnspan=2, sticky="w", padx=5, pady=2)
+
+        self.preview_label = ttk.Label(self.window, text="")
+        self.preview_label.grid(row=5, column=0, columnspan=2, sticky="w", padx=5, pady=2)
+        ttk.Button(self.window, text="Preview", command=self._preview).grid(row=6, column=0, columnspan=2, pady=2)
+
+        self._create_submit_button("Replace", 7)
+
+    def _preview(self) -> bool:
+        """Refresh the affected-row count. Returns False if the inputs are bad."""
+        try:
+            self._pending_changes = self.db_manager.preview_find_replace(
+                self.column_combobox.get(),
+                self.entries["Find"].get(),
+                self.entries["Replace With"].get(),
+                use_regex=self.regex_var.get(),
+                kicad_part_numbers=self.kicad_part_numbers,
+                search_term=self.search_term,
+                value_range=self.value_range,
+                facet_filters=self.facet_filters,
+            )
+        except re.error as e:
+            messagebox.showerror("Error", f"Invalid regular expression: {str(e)}")
+            return False
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to preview replace: {str(e)}")
+            return False
+
+        text = f"{len(self._pending_changes)} part(s) will change"
+        if self._pending_changes:
+            kicad_part_number, old_value, new_value = self._pending_changes[0]
+            text += f"\ne.g. {kicad_part_number}: '{old_value}' -> '{new_value}'"
+        self.preview_label.config(text=text)
+        return True
+
+    def _on_submit(self) -> None:
+        if not self._preview():
+            return
+        if not self._pending_changes:
+            messagebox.showinfo("Find / Replace", "No parts match.")
+            return
+        if not messagebox.askyesno("Confirm Replace", f"Rewrite {len(self._pending_changes)} part(s)?"):
+            return
+
+        try:
+            updated, skipped = self.db_manager.update_parts_column(self.column_combobox.get(), self._pending_changes)
+            self.refresh_callback()
+            message = f"Updated {updated} part(s)."
+            if skipped:
+                message += (f"\n\nSkipped {len(skipped)} part(s) changed since the preview: "
+                            f"{', '.join(skipped[:10])}{' ...' if len(skipped) > 10 else ''}")
+            messagebox.showinfo("Find / Replace", message)
+            self.destroy()
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to replace: {str(e)}")
+
+
+class DuplicatesWindow(BaseWindow):
+    """Window listing likely duplicate parts and merging them on request."""
+
+    def __init__(self, parent, db_manager: DatabaseManager, refresh_callback):
+        self.db_manager = db_manager
+        self.refresh_callback = refresh_callback
+        super().__init__(parent, "Duplicate Parts")
+
+    def _setup_window(self) -> None:
+        self.window.rowconfigure(0, weight=1)
+        self.groups_tree = ttk.Treeview(self.window, columns=("reason",), height=15)
+        self.groups_tree.heading("#0", text="Group / KiCad Part Number")
+        self.groups_tree.heading("reason", text="Reason")
+        self.groups_tree.column("#0", width=350)
+        self.groups_tree.column("reason", width=150)
+        self.groups_tree.grid(row=0, column=0, columnspan=2, sticky="nsew", padx=5, pady=5)
+
+        self.summary_label = ttk.Label(self.window, text="Select the part to keep, then Merge.")
+        self.summary_label.grid(row=1, column=0, columnspan=2, sticky="w", padx=5)
+
+        self._create_submit_button("Merge Into Selected", 2)
+        self._load_groups()
+
+    def _load_groups(self) -> None:
+        """(Re)scan the database and fill the tree, one node per group."""
+        self.groups_tree.delete(*self.groups_tree.get_children())
+        try:
+            groups = self.db_manager.find_duplicate_groups()
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to scan for duplicates: {str(e)}")
+            return
+
+        for group in groups:
+            group_id = self.groups_tree.insert("", "end", text=f"{group.key} ({len(group.kicad_part_numbers)} parts)",
+                                               values=(group.reason,), open=True)
+            for kicad_part_number in group.kicad_part_numbers:
+                self.groups_tree.insert(group_id, "end", text=kicad_part_number)
+        self.summary_label.config(text=f"{len(groups)} duplicate group(s). Select the part to keep, then Merge.")
+
+    def _on_submit(self) -> None:
+        selected = self.groups_tree.selection()
+        parent_id = self.groups_tree.parent(selected[0]) if selected else ""
+        if not parent_id:
+            messagebox.showerror("Error", "Select the part to keep inside a group.")
+            return
+
+        keep = self.groups_tree.item(selected[0], "text")
+        others = [self.groups_tree.item(child, "text") for child in self.groups_tree.get_children(parent_id)]
+        others = [pn for pn in others if pn != keep]
+        if not messagebox.askyesno("Confirm Merge",
+                                   f"Keep {keep} and delete {len(others)} duplicate(s)?\n\n" + "\n".join(others)):
+            return
+
+        try:
+            self.db_manager.merge_parts(keep, others)
+            self.refresh_callback()
+            self._load_groups()
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to merge parts: {str(e)}")
+
+
+class RefValidationWindow(BaseWindow):
+    """Window checking every part's symbol/footprint ref against local KiCad
+    libraries. Indexing runs on a worker thread so the window stays live."""
+
+    def __init__(self, parent, db_manager: DatabaseManager, symbol_dirs: List[str], footprint_dirs: List[str],
+                 on_index_loaded: Callable[[LibraryIndex], None]):
+        self.db_manager = db_manager
+        self.symbol_dirs = symbol_dirs
+        self.footprint_dirs = footprint_dirs
+        self.on_index_loaded = on_index_loaded
+        self._worker: Optional[threading.Thread] = None
+        self._result: Optional[Tuple[LibraryIndex, Optional[ValidationReport], Optional[Exception]]] = None
+        super().__init__(parent, "Validate Symbol/Footprint Refs")
+
+    def _setup_window(self) -> None:
+        self._create_form_fields(["Symbol Directories", "Footprint Directories"], defaults={
+            "Symbol Directories": os.pathsep.join(self.symbol_dirs),
+            "Footprint Directories": os.pathsep.join(self.footprint_dirs),
+        })
+        self.window.rowconfigure(2, weight=1)
+        columns = ("component_type", "column", "ref", "problem")
+        self.results_tree = ttk.Treeview(self.window, columns=columns, height=15)
+        self.results_tree.heading("#0", text="KiCad Part Number")
+        for column, heading, width in zip(columns, ("Component Type", "Field", "Ref", "Problem"), (110, 100, 220, 280)):
+            self.results_tree.heading(column, text=heading)
+            self.results_tree.column(column, width=width)
+        self.results_tree.column("#0", width=150)
+        self.results_tree.grid(row=2, column=0, columnspan=2, sticky="nsew", padx=5, pady=5)
+
+        self.summary_label = ttk.Label(self.window, text=f"Directories are separated by '{os.pathsep}'.")
+        self.summary_label.grid(row=3, column=0, columnspan=2, sticky="w", padx=5)
+        self._create_submit_button("Validate", 4)
+
+    @staticmethod
+    def _split_dirs(text: str) -> List[str]:
+        return [path.strip() for path in text.split(os.pathsep) if path.strip()]
+
+    def _on_submit(self) -> None:
+        if self._worker is not None and self._worker.is_alive():
+            return
+        symbol_dirs = self._split_dirs(self.entries["Symbol Directories"].get())
+        footprint_dirs = self._split_dirs(self.entries["Footprint Directories"].get())
+        if not symbol_dirs and not footprint_dirs:
+            messagebox.showerror("Error", "Enter at least one library directory.")
+            return
+        try:
+            part_refs = self.db_manager.get_part_refs()
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to load part refs: {str(e)}")
+            return
+
+        self.symbol_dirs[:] = symbol_dirs
+        self.footprint_dirs[:] = footprint_dirs
+        index = LibraryIndex(symbol_dirs, footprint_dirs)
+
+        def work() -> None:
+            try:
+                self._result = (index, index.validate(part_refs), None)
+            except Exception as e:  # pylint: disable=broad-except
+                self._result = (index, None, e)
+
+        self._result = None
+        self.summary_label.config(text=f"Indexing libraries and checking {len(part_refs)} parts...")
+        self._worker = threading.Thread(target=work, name="ref-validator", daemon=True)
+        self._worker.start()
+        self.window.after(100, self._poll_worker)
+
+    def _poll_worker(self) -> None:
+        if self._result is None:
+            self.window.after(100, self._poll_worker)
+            return
+        index, report, error = self._result
+        if error is not None:
+            messagebox.showerror("Error", f"Failed to validate refs: {str(error)}")
+            return
+        self.on_index_loaded(index)
+        self.results_tree.delete(*self.results_tree.get_children())
+        for problem in report.problems:
+            self.results_tree.insert("", "end", text=problem.kicad_part_number,
+                                     values=(problem.component_type, problem.column, problem.ref, problem.problem))
+        self.summary_label.config(text=(
+            f"{len(report.problems)} dangling ref(s) in {report.parts_checked} parts. "
+            f"Indexed {report.libraries_indexed} libraries ({report.libraries_reparsed} re-read) in "
+            f"{report.index_ms:.0f} ms, checked in {report.check_ms:.0f} ms."))
+
+
+class BomWindow(BaseWindow):
+    """Window showing a KiCad BOM resolved against the database, with
+    quantities totalled per part, modules expanded and the best supplier
+    offer for each part."""
+
+    def __init__(self, parent, db_manager: DatabaseManager, bom_path: str, offer_cache: Optional[OfferCache] = None):
+        self.db_manager = db_manager
+        self.bom_path = bom_path
+        self.offer_cache = offer_cache
+        self.report: Optional[BomReport] = None
+        self.pricing: Optional[BomPricing] = None
+        super().__init__(parent, f"BOM - {pathlib.Path(bom_path).name}")
+
+    def _setup_window(self) -> None:
+        self._create_form_fields(["Build Quantity", "Currency"],
+                                 defaults={"Build Quantity": "1", "Currency": DEFAULT_CURRENCY})
+        ttk.Button(self.window, text="Resolve", command=self._resolve).grid(row=2, column=1, sticky="e", padx=5)
+
+        self.window.rowconfigure(3, weight=1)
+        columns = ("quantity", "description", "manufacturer", "mpn", "references", "via",
+                   "supplier", "unit_price", "extended_price")
+        self.bom_tree = ttk.Treeview(self.window, columns=columns, height=20)
+        self.bom_tree.heading("#0", text="KiCad Part Number")
+        for column, heading, width in zip(columns, ("Qty", "Description", "Manufacturer", "MPN", "References", "Via Module",
+                                                    "Supplier", "Unit Price", "Extended"),
+                                          (50, 220, 120, 140, 200, 120, 120, 80, 90)):
+            self.bom_tree.heading(column, text=heading)
+            self.bom_tree.column(column, width=width)
+        self.bom_tree.grid(row=3, column=0, columnspan=2, sticky="nsew", padx=5, pady=5)
+
+        self.summary_label = ttk.Label(self.window, text="")
+        self.summary_label.grid(row=4, column=0, columnspan=2, sticky="w", padx=5)
+        self._create_submit_button("Export CSV...", 5)
+        self._resolve()
+
+    def _resolve(self) -> None:
+        """Read the BOM file and resolve it with one database query."""
+        try:
+            multiplier = int(self.entries["Build Quantity"].get() or "1")
+            self.report = resolve_bom(self.db_manager, read_bom(self.bom_path), multiplier)
+            currency = self.entries["Currency"].get().strip().upper() or DEFAULT_CURRENCY
+            self.pricing = price_bom(self.db_manager, self.report, self.offer_cache, currency)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to resolve BOM: {str(e)}")
+            return
+
+        quotes = {line.kicad_part_number: line.quote for line in self.pricing.lines}
+        self.bom_tree.delete(*self.bom_tree.get_children())
+        for part in self.report.parts:
+            quote = quotes.get(part.kicad_part_number)
+            pricing = ("", "", "") if quote is None else (
+                quote.offer.supplier_name + (" (short)" if not quote.offer.in_stock(part.quantity) else ""),
+                f"{quote.unit_price:.4f} {quote.offer.currency}", f"{quote.extended_price:.2f}")
+            self.bom_tree.insert("", "end", text=part.kicad_part_number, values=(
+                part.quantity, part.description, part.manufacturer, part.manufacturer_part_number,
+                " ".join(part.references), " ".join(part.via_modules)) + pricing)
+        for line in self.report.unresolved:
+            self.bom_tree.insert("", "end", text=line.kicad_part_number,
+                                 values=(line.quantity, "UNRESOLVED", "", "", " ".join(line.references), ""))
+        other_currency = (f" ({len(self.pricing.other_currency)} only offered in other currencies)"
+                          if self.pricing.other_currency else "")
+        self.summary_label.config(text=(
+            f"{self.report.lines_read} line(s) -> {len(self.report.parts)} part(s), "
+            f"{len(self.report.unresolved)} unresolved, in {self.report.elapsed_ms:.0f} ms. "
+            f"Total {self.pricing.total:.2f} {self.pricing.currency}; {len(self.pricing.unpriced)} unpriced"
+            f"{other_currency}, {len(self.pricing.short)} short of stock (priced in {self.pricing.elapsed_ms:.0f} ms)."))
+
+    def _on_submit(self) -> None:
+        if self.report is None:
+            return
+        path = filedialog.asksaveasfilename(parent=self.window, title="Export Resolved BOM",
+                                            defaultextension=".csv", filetypes=[("CSV", "*.csv")])
+        if not path:
+            return
+        try:
+            write_bom_csv(self.report, path)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to export BOM: {str(e)}")
+
+
+class ModuleBrowserWindow(BaseWindow):
+    """Window listing modules and showing the fully exploded contents of the
+    selected one, with a form for nesting one module inside another."""
+
+    def __init__(self, parent, db_manager: DatabaseManager, module_cache: TTLCache):
+        self.db_manager = db_manager
+        self.module_cache = module_cache
+        super().__init__(parent, "Modules")
+
+    def _setup_window(self) -> None:
+        self.window.rowconfigure(0, weight=1)
+        self.window.rowconfigure(1, weight=2)
+        self.modules_tree = ttk.Treeview(self.window, columns=("description", "parts", "submodules"), height=8)
+        for column, heading, width in (("#0", "Module", 150), ("description", "Description", 250),
+                                       ("parts", "Parts", 60), ("submodules", "Submodules", 80)):
+            self.modules_tree.heading(column, text=heading)
+            self.modules_tree.column(column, width=width)
+        self.modules_tree.grid(row=0, column=0, columnspan=2, sticky="nsew", padx=5, pady=5)
+        self.modules_tree.bind("<<TreeviewSelect>>", lambda _: self._show_contents())
+
+        columns = ("quantity", "description", "manufacturer", "mpn", "depth")
+        self.contents_tree = ttk.Treeview(self.window, columns=columns, height=12)
+        self.contents_tree.heading("#0", text="KiCad Part Number")
+        for column, heading, width in zip(columns, ("Qty", "Description", "Manufacturer", "MPN", "Depth"),
+                                          (50, 220, 120, 140, 50)):
+            self.contents_tree.heading(column, text=heading)
+            self.contents_tree.column(column, width=width)
+        self.contents_tree.grid(row=1, column=0, columnspan=2, sticky="nsew", padx=5, pady=5)
+
+        ttk.Label(self.window, text="Add Submodule").grid(row=2, column=0, sticky="e", padx=5, pady=2)
+        self.submodule_combobox = ttk.Combobox(self.window)
+        self.submodule_combobox.grid(row=2, column=1, sticky="ew", padx=5, pady=2)
+        ttk.Label(self.window, text="Quantity").grid(row=3, column=0, sticky="e", padx=5, pady=2)
+        self.quantity_entry = ttk.Entry(self.window)
+        self.quantity_entry.insert(0, "1")
+        self.quantity_entry.grid(row=3, column=1, sticky="ew", padx=5, pady=2)
+        self._create_submit_button("Add Submodule", 4)
+        self._load_modules()
+
+    def _load_modules(self) -> None:
+        self.modules_tree.delete(*self.modules_tree.get_children())
+        try:
+            modules = self.module_cache.get_or_load(("modules",), self.db_manager.get_modules)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to load modules: {str(e)}")
+            return
+        for kicad_part_number, description, part_count, submodule_count in modules:
+            self.modules_tree.insert("", "end", text=kicad_part_number, values=(description, part_count, submodule_count))
+        self.submodule_combobox["values"] = [module[0] for module in modules]
+
+    def _selected_module(self) -> Optional[str]:
+        selected = self.modules_tree.selection()
+        return self.modules_tree.item(selected[0], "text") if selected else None
+
+    def _show_contents(self) -> None:
+        """Show the selected module's parts, expanded through nested modules."""
+        module = self._selected_module()
+        self.contents_tree.delete(*self.contents_tree.get_children())
+        if module is None:
+            return
+        try:
+            contents = self.module_cache.get_or_load(("explode", module), lambda: self.db_manager.explode_module(module))
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to explode module: {str(e)}")
+            return
+        for kicad_part_number, description, manufacturer, mpn, _value, quantity, depth in contents:
+            self.contents_tree.insert("", "end", text=kicad_part_number,
+                                      values=(quantity, description, manufacturer, mpn, depth))
+
+    def _on_submit(self) -> None:
+        parent_module = self._selected_module()
+        child_module = self.submodule_combobox.get().strip()
+        if parent_module is None or not child_module:
+            messagebox.showerror("Error", "Select a module, then the module to nest inside it.")
+            return
+        try:
+            self.db_manager.add_module_submodule(parent_module, child_module, int(self.quantity_entry.get() or "1"))
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to add submodule: {str(e)}")
+            return
+        self._load_modules()
+
+
+class WhereUsedWindow(BaseWindow):
+    """Window listing every module that uses a part, directly or nested."""
+
+    def __init__(self, parent, db_manager: DatabaseManager, module_cache: TTLCache, kicad_part_number: str):
+        self.db_manager = db_manager
+        self.module_cache = module_cache
+        self.kicad_part_number = kicad_part_number
+        super().__init__(parent, f"Where Used - {kicad_part_number}")
+
+    def _setup_window(self) -> None:
+        self.window.rowconfigure(0, weight=1)
+        self.users_tree = ttk.Treeview(self.window, columns=("description", "depth", "quantity"), height=15)
+        for column, heading, width in (("#0", "Module", 150), ("description", "Description", 250),
+                                       ("depth", "Depth", 60), ("quantity", "Qty per Module", 100)):
+            self.users_tree.heading(column, text=heading)
+            self.users_tree.column(column, width=width)
+        self.users_tree.grid(row=0, column=0, columnspan=2, sticky="nsew", padx=5, pady=5)
+        self.summary_label = ttk.Label(self.window, text="")
+        self.summary_label.grid(row=1, column=0, columnspan=2, sticky="w", padx=5)
+        self._create_submit_button("Refresh", 2)
+        self._load()
+
+    def _load(self) -> None:
+        self.users_tree.delete(*self.users_tree.get_children())
+        try:
+            users = self.module_cache.get_or_load(
+                ("where_used", self.kicad_part_number), lambda: self.db_manager.get_where_used(self.kicad_part_number))
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to find where {self.kicad_part_number} is used: {str(e)}")
+            users = []
+        for module, description, depth, quantity in users:
+            self.users_tree.insert("", "end", text=module, values=(description, depth, quantity))
+        self.summary_label.config(text=f"{len(users)} module(s) use {self.kicad_part_number}.")
+
+    def _on_submit(self) -> None:
+        """Re-run the lookup, bypassing the cached result, to pick up module
+        edits made since the window was opened."""
+        self.module_cache.invalidate(("where_used", self.kicad_part_number))
+        self._load()
+
+
+class PartHistoryWindow(BaseWindow):
+    """Window listing every recorded change to a part, newest first, with
+    the before/after value of each changed column."""
+
+    def __init__(self, parent, db_manager: DatabaseManager, kicad_part_number: str):
+        self.db_manager = db_manager
+        self.kicad_part_number = kicad_part_number
+        super().__init__(parent, f"History - {kicad_part_number}")
+
+    def _setup_window(self) -> None:
+        self.window.rowconfigure(0, weight=1)
+        self.history_tree = ttk.Treeview(self.window, columns=("by", "before", "after"), height=18)
+        for column, heading, width in (("#0", "When / Column", 220), ("by", "By", 100),
+                                       ("before", "Before", 220), ("after", "After", 220)):
+            self.history_tree.heading(column, text=heading)
+            self.history_tree.column(column, width=width)
+        self.history_tree.grid(row=0, column=0, columnspan=2, sticky="nsew", padx=5, pady=5)
+        self.summary_label = ttk.Label(self.window, text="")
+        self.summary_label.grid(row=1, column=0, columnspan=2, sticky="w", padx=5)
+        self._create_submit_button("Refresh", 2)
+        self._load()
+
+    def _load(self) -> None:
+        self.history_tree.delete(*self.history_tree.get_children())
+        try:
+            changes = history_changes(self.db_manager.get_part_history(self.kicad_part_number))
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to load history of {self.kicad_part_number}: {str(e)}")
+            changes = []
+        for changed_at, changed_by, action, columns in reversed(changes):
+            item = self.history_tree.insert("", "end", text=f"{changed_at:%Y-%m-%d %H:%M:%S} {action}",
+                                            values=(changed_by, "", ""), open=True)
+            for column, (before, after) in columns.items():
+                self.history_tree.insert(item, "end", text=column,
+                                         values=("", "" if before is None else before, "" if after is None else after))
+        self.summary_label.config(text=f"{len(changes)} recorded change(s).")
+
+    def _on_submit(self) -> None:
+        """Reload the history, picking up changes made since it was opened."""
+        self._load()
+
+
+class QueryPlansWindow(BaseWindow):
+    """Window listing captured slow query shapes with the plan of the latest
+    capture of the selected one, and the index advisor's suggestions."""
+
+    def __init__(self, parent, db_manager: DatabaseManager, diagnostics: QueryDiagnostics):
+        self.db_manager = db_manager
+        self.diagnostics = diagnostics
+        super().__init__(parent, "Slow Query Plans")
+
+    def _setup_window(self) -> None:
+        self.window.rowconfigure(0, weight=1)
+        self.window.rowconfigure(1, weight=2)
+        self.shapes_tree = ttk.Treeview(self.window, columns=("captures", "max_ms", "mean_ms", "seq_scans"), height=8)
+        for column, heading, width in (("#0", "Query", 420), ("captures", "Captures", 70), ("max_ms", "Max ms", 70),
+                                       ("mean_ms", "Mean ms", 70), ("seq_scans", "Seq Scans", 150)):
+            self.shapes_tree.heading(column, text=heading)
+            self.shapes_tree.column(column, width=width)
+        self.shapes_tree.grid(row=0, column=0, columnspan=2, sticky="nsew", padx=5, pady=5)
+        self.shapes_tree.bind("<<TreeviewSelect>>", lambda _: self._show_plan())
+
+        self.plan_view = tk.Text(self.window, height=16, wrap="none")
+        self.plan_view.grid(row=1, column=0, columnspan=2, sticky="nsew", padx=5, pady=5)
+
+        self.advice_tree = ttk.Treeview(self.window, columns=("scan_ms", "shapes", "requires"), height=6)
+        for column, heading, width in (("#0", "Suggested Index", 520), ("scan_ms", "Seq Scan ms", 90),
+                                       ("shapes", "Queries", 60), ("requires", "Needs", 70)):
+            self.advice_tree.heading(column, text=heading)
+            self.advice_tree.column(column, width=width)
+        self.advice_tree.grid(row=2, column=0, columnspan=2, sticky="nsew", padx=5, pady=5)
+
+        self.summary_label = ttk.Label(self.window, text="")
+        self.summary_label.grid(row=3, column=0, columnspan=2, sticky="w", padx=5)
+        ttk.Button(self.window, text="Clear", command=self._clear).grid(row=4, column=0, sticky="w", padx=5)
+        self._create_submit_button("Export...", 4)
+        self._load()
+
+    def _index_definitions(self) -> Dict[str, List[str]]:
+        try:
+            return self.db_manager.get_index_definitions()
+        except Exception:  # pylint: disable=broad-except
+            self.db_manager.db_connection.rollback()
+            logger.warning("Could not read existing indexes", exc_info=True)
+            return {}
+
+    def _load(self) -> None:
+        self.shapes_tree.delete(*self.shapes_tree.get_children())
+        self.advice_tree.delete(*self.advice_tree.get_children())
+        self.latest: Dict[str, List[dict]] = {}
+        for _captured_at, shape, _params, _duration_ms, explain in self.diagnostics.store.captures():
+            self.latest.setdefault(shape_id(shape), explain)
+        for key, shape, captures, max_ms, mean_ms in self.diagnostics.store.shapes():
+            scans = sorted({scan["relation"] for scan in summarize_plan(self.latest[key])["seq_scans"]})
+            self.shapes_tree.insert("", "end", iid=key, text=shape[:200],
+                                    values=(captures, f"{max_ms:.0f}", f"{mean_ms:.0f}", ", ".join(scans)))
+        advice = self.diagnostics.advise(self._index_definitions())
+        for entry in advice:
+            self.advice_tree.insert("", "end", text=entry["statement"],
+                                    values=(f"{entry['seq_scan_ms']:.0f}", entry["shapes"], entry["requires"]))
+        self.summary_label.config(text=f"{len(self.latest)} query shape(s) captured, {len(advice)} index suggestion(s). "
+                                       f"Capture threshold: {self.diagnostics.threshold_ms:g} ms.")
+
+    def _show_plan(self) -> None:
+        selected = self.shapes_tree.selection()
+        self.plan_view.delete("1.0", tk.END)
+        if not selected:
+            return
+        explain = self.latest[selected[0]]
+        shape = self.shapes_tree.item(selected[0], "text")
+        suggestions = [index_statement(*suggestion) for suggestion in suggest_indexes(explain)]
+        self.plan_view.insert("1.0", shape + "\n\n" + plan_text(explain)
+                              + ("\n\nWould use:\n" + "\n".join(suggestions) if suggestions else ""))
+
+    def _clear(self) -> None:
+        if messagebox.askyesno("Clear Plans", "Delete all captured plans?", parent=self.window):
+            self.diagnostics.store.clear()
+            self.plan_view.delete("1.0", tk.END)
+            self._load()
+
+    def _on_submit(self) -> None:
+        path = filedialog.asksaveasfilename(parent=self.window, title="Export Query Plans",
+                                            defaultextension=".jsonl", filetypes=[("JSON lines", "*.jsonl")])
+        if not path:
+            return
+        try:
+            count = self.diagnostics.export(pathlib.Path(path), self._index_definitions())
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to export query plans: {str(e)}")
+            return
+        self.summary_label.config(text=f"Exported {count} captured plan(s) to {path}")
+
+
+class OffersWindow(BaseWindow):
+    """Window listing every supplier offer and price break for a part's MPN."""
+
+    def __init__(self, parent, db_manager: DatabaseManager, offer_cache: OfferCache,
+                 kicad_part_number: str, manufacturer_part_number: str):
+        self.db_manager = db_manager
+        self.offer_cache = offer_cache
+        self.kicad_part_number = kicad_part_number
+        self.manufacturer_part_number = manufacturer_part_number
+        super().__init__(parent, f"Offers - {kicad_part_number}")
+
+    def _setup_window(self) -> None:
+        self._create_form_fields(["Quantity"], defaults={"Quantity": "1"})
+        ttk.Button(self.window, text="Best Price", command=self._on_submit).grid(row=1, column=1, sticky="e", padx=5)
+        self.window.rowconfigure(2, weight=1)
+        columns = ("supplier_part_number", "stock", "price")
+        self.offers_tree = ttk.Treeview(self.window, columns=columns, height=15)
+        for column, heading, width in (("#0", "Supplier / Break", 180), ("supplier_part_number", "Supplier PN", 150),
+                                       ("stock", "Stock", 80), ("price", "Unit Price", 100)):
+            self.offers_tree.heading(column, text=heading)
+            self.offers_tree.column(column, width=width)
+        self.offers_tree.grid(row=2, column=0, columnspan=2, sticky="nsew", padx=5, pady=5)
+        self.summary_label = ttk.Label(self.window, text="")
+        self.summary_label.grid(row=3, column=0, columnspan=2, sticky="w", padx=5)
+
+        try:
+            self.offers = next(iter(self.offer_cache.get_offers(self.db_manager, [self.manufacturer_part_number]).values()), [])
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to load offers: {str(e)}")
+            self.offers = []
+        for offer in self.offers:
+            offer_id = self.offers_tree.insert("", "end", text=offer.supplier_name, open=True, values=(
+                offer.supplier_part_number, "" if offer.stock is None else offer.stock, offer.currency))
+            for min_quantity, unit_price in offer.breaks:
+                self.offers_tree.insert(offer_id, "end", text=f"{min_quantity}+", values=("", "", f"{unit_price:.4f}"))
+        self.summary_label.config(text=f"{len(self.offers)} offer(s) for {self.manufacturer_part_number}.")
+
+    def _on_submit(self) -> None:
+        try:
+            quantity = int(self.entries["Quantity"].get())
+        except ValueError:
+            messagebox.showerror("Error", "Quantity must be a whole number.")
+            return
+        quotes = best_quotes(self.offers, quantity)
+        if not quotes:
+            self.summary_label.config(text=f"No offer covers a quantity of {quantity}.")
+            return
+        self.summary_label.config(text=f"Best for {quantity}: " + "; ".join(
+            f"{quote.offer.supplier_name} at {quote.unit_price:.4f} {currency} = {quote.extended_price:.2f} {currency}"
+            + ("" if quote.offer.in_stock(quantity) else " (not enough stock)")
+            for currency, quote in sorted(quotes.items())))
 
 
 class AddModuleWindow(BaseWindow):
@@ -524,8 +1201,8 @@ class AddModuleWindow(BaseWindow):
 
         try:
             module_uuid = self.db_manager.add_module(module)
-            if part_uuids:
-                self.db_manager.add_module_parts(module_uuid, part_uuids)
+            # add_module_parts commits the module too, so call it even with no parts.
+            self.db_manager.add_module_parts(module_uuid, part_uuids)
             self.destroy()
         except Exception as e:
             messagebox.showerror("Error", f"Failed to add module: {str(e)}")
@@ -651,14 +1328,24 @@ class DatabaseConnectionWindow(BaseWindow):
 class MainGUI:
     """Main application window."""
 
+    # Seed list of component types, so a fresh database still offers the usual
+    # categories. Whatever the database actually uses is merged in from the
+    # lookup cache (see _component_types).
     COMPONENT_TYPES = [
         '', 'Resistor', 'Capacitor', 'Connector', 'Diode', 'Electro Mechanical',
         'Mechanical', 'Inductor', 'Opto', 'OpAmp', 'Transister', 'Power Supply IC', 'Semiconductor'
     ]
 
+    # How long lookup lists are trusted without a change notification, and how
+    # often the GUI checks whether they were reloaded.
+    LOOKUP_TTL_SECONDS = 300.0
+    LOOKUP_POLL_MS = 2000
+    # Widgets whose Ctrl+Z/Ctrl+Y edit their own text, not the database.
+    TEXT_WIDGET_CLASSES = {"Entry", "TEntry", "TCombobox", "TSpinbox", "Spinbox", "Text"}
+
     def __init__(self, db_connection, connection_settings: Optional[Dict[str, object]] = None,
-                 on_update_connection: Optional[Callable[[Dict[str, object]], object]] = None):
-        self.db_manager = DatabaseManager(db_connection)
+                 on_update_connection: Optional[Callable[[Dict[str, object]], object]] = None,
+                 connection_factory: Optional[Callable[..., object]] = None):
         # Current DB connection settings (host/port/database/user/password), used to
         # pre-fill the DatabaseConnectionWindow. Owned by the caller (main.py), which
         # is responsible for actually persisting them (e.g. to the .ini file).
@@ -668,12 +1355,235 @@ class MainGUI:
         # on failure rather than returning anything, so MainGUI knows not to swap in
         # a broken connection.
         self.on_update_connection = on_update_connection
-        self.current_component_type_filter: Optional[str] = None
+        # Opens an extra connection from a settings dict (main.py's
+        # _make_db_connection). Background work - the lookup cache refresh and
+        # the change listener - gets its own connections from this so it never
+        # interleaves with the GUI's transactions. Without it, lookups load
+        # inline on the GUI connection and only local writes invalidate them.
+        self.connection_factory = connection_factory
+        self._lookup_connection = None
+        self._change_listener: Optional[ChangeListener] = None
+        self.lookup_cache = LookupCache(self._load_lookup_lists, ttl=self.LOOKUP_TTL_SECONDS,
+                                        background=connection_factory is not None)
+        self._lookup_version_shown = -1
+        # Set once the user generates a .kicad_dbl; from then on it is kept in
+        # sync incrementally after every change.
+        self.dbl_generator: Optional[KicadDblGenerator] = None
+        self._view_refresher: Optional[MaterializedViewRefresher] = None
+        # Local KiCad library index, once the ref validator has built one;
+        # the part windows then check refs against it too.
+        self.library_index: Optional[LibraryIndex] = None
+        self.library_symbol_dirs, self.library_footprint_dirs = default_library_dirs()
+        # Datasheet/manufacturer URL checking: the checker runs on its own
+        # thread; part_links maps part numbers to the URLs it was given.
+        self.link_checker: Optional[LinkChecker] = None
+        self.part_links: Dict[str, Tuple[str, str]] = {}
+        self._url_part_numbers: Dict[str, List[str]] = {}
+        self._tree_items: Dict[str, str] = {}
+        # Module browser/where-used results, keyed by ("explode"|"where_used",
+        # part number). Any module or parts write clears it, since a change
+        # to one nested module changes every module above it.
+        self.module_cache: TTLCache = TTLCache(ttl=self.LOOKUP_TTL_SECONDS)
+        # Supplier offers keyed by normalised MPN, shared by BOM pricing and
+        # the offers window; cleared whenever offers are imported.
+        self.offer_cache = OfferCache(ttl=self.LOOKUP_TTL_SECONDS)
+        # Local datasheet mirror, opened on first use.
+        self.datasheet_store: Optional[DatasheetStore] = None
+        # KiCad HTTP library server, while Tools > Serve KiCad HTTP Library is on.
+        self.http_library: Optional[LibraryServer] = None
+        # Undo/redo history for the connected database, kept on disk.
+        self.journal: Optional[EditJournal] = None
+        # Slow query plan capture, while Tools > Capture Slow Query Plans is on.
+        self.query_diagnostics: Optional[QueryDiagnostics] = None
+        self.db_manager = self._open_db_manager(db_connection)
+        # Facet selections: facet name -> selected values (OR'd within a facet,
+        # AND'd across facets). The component type filter menu is just a
+        # shortcut onto the "component_type" facet.
+        self.facet_filters: Dict[str, List[object]] = {}
+        # Value range picked from the filter menu; a range typed into the
+        # search bar takes precedence while it's there.
+        self.current_value_range: Optional[ValueRange] = None
         self.sort_column: Optional[str] = None
         self.sort_descending: bool = False
         self._search_after_id: Optional[str] = None
         self._setup_ui()
 
+    def _open_db_manager(self, db_connection) -> DatabaseManager:
+        """Wrap a connection in a DatabaseManager and make sure the derived
+        columns/indexes exist. A schema failure (e.g. a read-only role) is
+        logged rather than fatal - browsing still works without them."""
+        db_manager = DatabaseManager(db_connection)
+        db_manager.add_change_listener(self._on_local_change)
+        if self.journal is not None:
+            self.journal.close()
+        try:
+            self.journal = EditJournal(journal_path_for(self.connection_settings))
+        except OSError:
+            logger.warning("Could not open the edit journal; undo is unavailable", exc_info=True)
+            self.journal = None
+        db_manager.journal = self.journal
+        if self.query_diagnostics is not None:
+            db_manager.set_diagnostics(self.query_diagnostics)
+        if self._view_refresher is None:
+            self._start_view_refresher()
+        if self._view_refresher is not None:
+            db_manager.view_refresher = self._view_refresher.request
+        try:
+            db_manager.ensure_schema(backfill=False)
+        except Exception:  # pylint: disable=broad-except
+            logger.warning("Could not apply schema extensions; value range search may be unavailable", exc_info=True)
+        self._start_backfill(db_manager)
+        return db_manager
+
+    def _start_backfill(self, db_manager: DatabaseManager) -> None:
+        """Fill in derived columns for parts other tools wrote, on a
+        connection of its own so opening the database never waits on the
+        scan. Without a connection factory it runs inline."""
+        if self.connection_factory is None:
+            try:
+                db_manager.backfill_value_index()
+            except Exception:  # pylint: disable=broad-except
+                logger.warning("Could not backfill derived part columns", exc_info=True)
+            return
+        make_db_manager = self._background_db_manager_factory()
+
+        def work() -> None:
+            background = None
+            try:
+                background = make_db_manager()
+                updated = background.backfill_value_index()
+                if updated:
+                    logger.info("Backfilled derived columns of %d parts", updated)
+            except Exception:  # pylint: disable=broad-except
+                logger.warning("Could not backfill derived part columns", exc_info=True)
+            finally:
+                if background is not None:
+                    background.db_connection.close()
+
+        threading.Thread(target=work, name="value-backfill", daemon=True).start()
+
+    def _load_lookup_lists(self) -> Dict[str, List[str]]:
+        """Loader for the lookup cache. In background mode this runs on the
+        cache's refresh thread, so it uses its own autocommit connection."""
+        if self.connection_factory is None:
+            return self.db_manager.get_lookup_lists()
+        if self._lookup_connection is None or self._lookup_connection.closed:
+            self._lookup_connection = self.connection_factory(**self.connection_settings)
+            self._lookup_connection.autocommit = True
+        return DatabaseManager(self._lookup_connection).get_lookup_lists()
+
+    def _on_local_change(self, event: ChangeEvent) -> None:
+        """Drop cached lookups and mark KiCad libraries dirty after our own
+        writes. Called on the Tk thread."""
+        self._on_remote_change(event)
+
+    def _on_remote_change(self, event: ChangeEvent) -> None:
+        """React to a committed write from any session. May run on the
+        ChangeListener thread, so it only flips thread-safe state; the Tk
+        poll loop does the rest."""
+        if event.table == "parts":
+            self.lookup_cache.invalidate()
+        if event.table in ("parts", "module", "module_parts", "module_submodules"):
+            self.module_cache.invalidate()
+        if event.table == "supplier_offers":
+            self.offer_cache.invalidate()
+        if self.dbl_generator is not None:
+            self.dbl_generator.mark_dirty(event)
+        if self.http_library is not None:
+            self.http_library.invalidate(event)
+
+    def _start_change_listener(self) -> None:
+        """LISTEN for other sessions' writes so cached lookups don't go stale."""
+        if self.connection_factory is None:
+            return
+        factory = self.connection_factory
+        settings = dict(self.connection_settings)
+        self._change_listener = ChangeListener(
+            lambda: factory(**settings),
+            self._on_remote_change,
+        )
+        self._change_listener.start()
+
+    def _start_view_refresher(self) -> Optional[MaterializedViewRefresher]:
+        """Start a background refresher for the materialized library views our
+        writes make stale, on its own autocommit connection. Without a
+        connection factory, views are refreshed inline instead."""
+        if self.connection_factory is None:
+            return None
+        self._view_refresher = MaterializedViewRefresher(self._background_db_manager_factory())
+        self._view_refresher.start()
+        return self._view_refresher
+
+    def _background_db_manager_factory(self) -> Callable[[], DatabaseManager]:
+        """Factory for DatabaseManagers on new autocommit connections to the
+        current database, for background services."""
+        factory = self.connection_factory
+        settings = dict(self.connection_settings)
+
+        def make_db_manager() -> DatabaseManager:
+            connection = factory(**settings)
+            connection.autocommit = True
+            return DatabaseManager(connection)
+
+        return make_db_manager
+
+    def _stop_background_services(self) -> None:
+        """Stop the change listener, view refresher, lookup refreshes and any
+        link check, and close the lookup connection once nothing uses it."""
+        if self.link_checker is not None:
+            self.link_checker.cancel()
+        if self._change_listener is not None:
+            self._change_listener.stop()
+            self._change_listener = None
+        if self._view_refresher is not None:
+            self._view_refresher.stop()
+            self._view_refresher = None
+        self._stop_http_library()
+        if not self.lookup_cache.stop(interrupt=self._cancel_lookup_query):
+            logger.warning("Lookup refresh did not stop; leaving its connection open")
+        elif self._lookup_connection is not None:
+            try:
+                self._lookup_connection.close()
+            except Exception:  # pylint: disable=broad-except
+                pass
+            self._lookup_connection = None
+
+    def _cancel_lookup_query(self) -> None:
+        """Interrupt the lookup refresh's query, if it has one running.
+        psycopg2 allows cancel() from another thread."""
+        connection = self._lookup_connection
+        if connection is not None and not connection.closed:
+            try:
+                connection.cancel()
+            except Exception:  # pylint: disable=broad-except
+                pass
+
+    def _component_types(self) -> List[str]:
+        """Seed component types plus any others the database uses, '' first."""
+        known = set(self.COMPONENT_TYPES)
+        extra = [ct for ct in self.lookup_cache.get("component_types") if ct not in known]
+        return self.COMPONENT_TYPES + sorted(extra, key=str.lower)
+
+    def _lookups(self) -> Dict[str, List[str]]:
+        """Cached lookup lists for the part windows' comboboxes."""
+        return {name: self.lookup_cache.get(name)
+                for name in ("manufacturers", "footprint_libraries", "symbol_libraries")}
+
+    def _poll_background_changes(self) -> None:
+        """Act on state changed by background threads: rebuild the filter menu
+        when the lookup cache has reloaded, and bring the KiCad library up to
+        date when writes have dirtied it. Keeps Tk and the GUI connection on
+        the Tk thread."""
+        if self.lookup_cache.version != self._lookup_version_shown:
+            self._lookup_version_shown = self.lookup_cache.version
+            self._populate_filter_menu()
+        if self.dbl_generator is not None and self.dbl_generator.is_dirty:
+            try:
+                self.dbl_generator.regenerate()
+            except Exception:  # pylint: disable=broad-except
+                logger.warning("Incremental KiCad library regeneration failed", exc_info=True)
+        self.root.after(self.LOOKUP_POLL_MS, self._poll_background_changes)
+
     def _setup_ui(self) -> None:
         """Initialize the user interface."""
         self.style = Style(theme='pulse')
@@ -687,6 +1597,10 @@ class MainGUI:
         self._create_main_content()
         self._center_window()
 
+        self.lookup_cache.refresh()
+        self._start_change_listener()
+        self.root.after(self.LOOKUP_POLL_MS, self._poll_background_changes)
+
     def _create_menus(self) -> None:
         """Create the application menu bar."""
         menu_bar = tk.Menu(self.root)
@@ -699,6 +1613,47 @@ class MainGUI:
         file_menu.add_command(label="Exit", command=self.root.quit)
         menu_bar.add_cascade(label="File", menu=file_menu)
 
+        edit_menu = tk.Menu(menu_bar, tearoff=False)
+        edit_menu.add_command(label="Undo", accelerator="Ctrl+Z", command=self._undo)
+        edit_menu.add_command(label="Redo", accelerator="Ctrl+Y", command=self._redo)
+        edit_menu.add_separator()
+        edit_menu.add_command(label="Bulk Edit Selected...", command=self._open_bulk_edit_window)
+        edit_menu.add_command(label="Find / Replace...", command=self._open_find_replace_window)
+        edit_menu.add_separator()
+        edit_menu.add_command(label="Find Duplicates...", command=self._open_duplicates_window)
+        edit_menu.add_separator()
+        edit_menu.add_command(label="Browse Modules...", command=self._open_module_browser)
+        edit_menu.add_command(label="Where Used...", command=self._open_where_used_window)
+        edit_menu.add_command(label="Part History...", command=self._open_part_history_window)
+        edit_menu.add_command(label="Supplier Offers...", command=self._open_offers_window)
+        menu_bar.add_cascade(label="Edit", menu=edit_menu)
+        self.root.bind("<Control-z>", lambda event: self._on_undo_key(event, self._undo))
+        self.root.bind("<Control-y>", lambda event: self._on_undo_key(event, self._redo))
+
+        tools_menu = tk.Menu(menu_bar, tearoff=False)
+        tools_menu.add_command(label="Generate KiCad Library (.kicad_dbl)...", command=self._generate_kicad_library)
+        self.materialize_var = tk.BooleanVar(value=True)
+        tools_menu.add_checkbutton(label="Use Materialized Library Views", variable=self.materialize_var)
+        self.http_library_var = tk.BooleanVar(value=False)
+        tools_menu.add_checkbutton(label="Serve KiCad HTTP Library", variable=self.http_library_var,
+                                   command=self._toggle_http_library)
+        tools_menu.add_command(label="Benchmark Library Lookups", command=self._benchmark_library_lookups)
+        tools_menu.add_command(label="Benchmark Prepared Search", command=self._benchmark_prepared_search)
+        tools_menu.add_command(label="Memory Report", command=self._show_memory_report)
+        self.diagnostics_var = tk.BooleanVar(value=False)
+        tools_menu.add_checkbutton(label="Capture Slow Query Plans", variable=self.diagnostics_var,
+                                   command=self._toggle_query_diagnostics)
+        tools_menu.add_command(label="Slow Query Plans...", command=self._open_query_plans_window)
+        tools_menu.add_separator()
+        tools_menu.add_command(label="Validate Symbol/Footprint Refs...", command=self._open_ref_validation_window)
+        tools_menu.add_command(label="Check Datasheet/URL Links", command=self._start_link_check)
+        tools_menu.add_command(label="Clear Datasheet Cache...", command=self._clear_datasheet_cache)
+        tools_menu.add_separator()
+        tools_menu.add_command(label="Resolve BOM...", command=self._open_bom_window)
+        tools_menu.add_command(label="Import Supplier Price File...", command=self._import_supplier_prices)
+        tools_menu.add_command(label="Export Library As Of...", command=self._export_library_as_of)
+        menu_bar.add_cascade(label="Tools", menu=tools_menu)
+
         settings_menu = tk.Menu(menu_bar, tearoff=False)
         settings_menu.add_command(label="Database Connection...", command=self._open_db_connection_window)
         menu_bar.add_cascade(label="Settings", menu=settings_menu)
@@ -716,8 +1671,11 @@ class MainGUI:
         # Create search bar
         self._create_search_bar(main_frame)
 
-        # Create parts treeview
-        self._setup_parts_treeview(main_frame)
+        # Facet panel on the left, parts treeview filling the rest
+        content_frame = ttk.Frame(main_frame)
+        content_frame.pack(fill=tk.BOTH, expand=True)
+        self._setup_facet_panel(content_frame)
+        self._setup_parts_treeview(content_frame)
 
         # Create button frame
         self._create_button_frame(main_frame)
@@ -758,6 +1716,79 @@ class MainGUI:
         "manufacturer_part_number": "manufacturer_part_number",
     }
 
+    FACET_LABELS = {
+        "component_type": "Component Type",
+        "manufacturer": "Manufacturer",
+        "footprint_library": "Footprint Library",
+        "exclude_from_bom": "Exclude from BOM",
+        "exclude_from_board": "Exclude from Board",
+        "exclude_from_sim": "Exclude from Sim",
+    }
+
+    # Values shown per facet; selected values are always shown on top of these.
+    FACET_DISPLAY_LIMIT = 50
+
+    def _setup_facet_panel(self, parent) -> None:
+        """Setup the facet panel: one node per facet, one child per value with
+        its count. Clicking a value toggles it in the filter."""
+        facet_frame = ttk.Frame(parent, width=220)
+        facet_frame.pack(side=tk.LEFT, fill=tk.Y, padx=(0, 10))
+
+        self.facet_tree = ttk.Treeview(facet_frame, show="tree", selectmode="none")
+        self.facet_tree.column("#0", width=220)
+        self.facet_tree.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+        self.facet_tree.bind("<ButtonRelease-1>", self._on_facet_click)
+
+        ttk.Button(facet_frame, text="Clear Filters", command=lambda: self._filter_by_component_type(None)).pack(side=tk.TOP, fill=tk.X, pady=(5, 0))
+
+        # facet tree item id -> (facet, value)
+        self._facet_items: Dict[str, Tuple[str, object]] = {}
+        self._facet_open: Dict[str, bool] = {facet: facet == "component_type" for facet in self.FACET_LABELS}
+
+    @staticmethod
+    def _facet_value_label(value: object) -> str:
+        if isinstance(value, bool):
+            return "Yes" if value else "No"
+        return str(value) if value != "" else "(none)"
+
+    def _refresh_facets(self, search_term: Optional[str], value_range: Optional[ValueRange]) -> None:
+        """Recount every facet for the current search/filters (one query) and
+        redraw the facet panel."""
+        counts = self.db_manager.get_facet_counts(search_term, value_range, self.facet_filters)
+
+        for facet_id in self.facet_tree.get_children():
+            self._facet_open[facet_id] = bool(self.facet_tree.item(facet_id, "open"))
+        self.facet_tree.delete(*self.facet_tree.get_children())
+        self._facet_items.clear()
+
+        for facet, label in self.FACET_LABELS.items():
+            selected = self.facet_filters.get(facet, [])
+            title = f"{label} ({len(selected)})" if selected else label
+            self.facet_tree.insert("", "end", iid=facet, text=title, open=self._facet_open.get(facet, False))
+
+            shown = counts.get(facet, [])[:self.FACET_DISPLAY_LIMIT]
+            shown_values = {value for value, _count in shown}
+            shown += [(value, 0) for value in selected if value not in shown_values]
+            for value, count in shown:
+                mark = "\u2611" if value in selected else "\u2610"
+                item_id = self.facet_tree.insert(facet, "end", text=f"{mark} {self._facet_value_label(value)}  ({count})")
+                self._facet_items[item_id] = (facet, value)
+
+    def _on_facet_click(self, event) -> None:
+        """Toggle the clicked facet value in the filter and refresh."""
+        item_id = self.facet_tree.identify_row(event.y)
+        if item_id not in self._facet_items:
+            return
+        facet, value = self._facet_items[item_id]
+        selected = self.facet_filters.setdefault(facet, [])
+        if value in selected:
+            selected.remove(value)
+        else:
+            selected.append(value)
+        if not selected:
+            del self.facet_filters[facet]
+        self._refresh_parts_list()
+
     def _setup_parts_treeview(self, parent) -> None:
         """Setup the parts treeview widget."""
         # Create treeview with scrollbar
@@ -775,7 +1806,8 @@ class MainGUI:
         self.tree.bind("<Double-1>", self._on_row_double_click)
 
         # Define columns
-        columns = ("description", "component_type", "value", "symbol_ref", "footprint_ref", "manufacturer", "manufacturer_part_number")
+        columns = ("description", "component_type", "value", "symbol_ref", "footprint_ref", "manufacturer", "manufacturer_part_number",
+                   "links")
         self.tree["columns"] = columns
 
         # Configure column headings, with click-to-sort wired to each one
@@ -788,6 +1820,7 @@ class MainGUI:
             "footprint_ref": "Footprint Reference",
             "manufacturer": "Manufacturer",
             "manufacturer_part_number": "Manufacturer Part Number",
+            "links": "Links",
         }
         for col_id, label in headings.items():
             self.tree.heading(col_id, text=label, command=lambda c=col_id: self._on_column_header_click(c))
@@ -796,6 +1829,7 @@ class MainGUI:
         self.tree.column("#0", width=150)
         for col in columns:
             self.tree.column(col, width=120)
+        self.tree.column("links", width=60)
 
     def _on_column_header_click(self, col_id: str) -> None:
         """Handle a click on a treeview column header: sort by that column,
@@ -839,7 +1873,9 @@ class MainGUI:
         # Left side buttons
         ttk.Button(button_frame, text="Add Part", command=self._open_add_part_window).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Edit Part", command=self._open_edit_part_window).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Bulk Edit", command=self._open_bulk_edit_window).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Add Module", command=self._open_add_module_window).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Open Datasheet", command=self._open_datasheet).pack(side=tk.LEFT, padx=5)
 
         # Right side buttons
         ttk.Button(button_frame, text="Add Supplier", command=self._open_add_supplier_window).pack(side=tk.RIGHT, padx=5)
@@ -851,8 +1887,15 @@ class MainGUI:
     def _create_filter_menu(self) -> None:
         """Create the component type filter menu."""
         self.filter_menu = tk.Menu(self.root, tearoff=0)
+        self._populate_filter_menu()
+
+    def _populate_filter_menu(self) -> None:
+        """(Re)fill the filter menu from the current component type list."""
+        self.filter_menu.delete(0, tk.END)
         self.filter_menu.add_command(label="All", command=lambda: self._filter_by_component_type(None))
-        for component_type in self.COMPONENT_TYPES[1:]:  # Skip empty string
+        self.filter_menu.add_command(label="Value Range...", command=self._prompt_value_range)
+        self.filter_menu.add_separator()
+        for component_type in self._component_types()[1:]:  # Skip empty string
             self.filter_menu.add_command(
                 label=component_type,
                 command=lambda ct=component_type: self._filter_by_component_type(ct)
@@ -867,20 +1910,47 @@ class MainGUI:
         except tk.TclError:
             pass  # Menu might be destroyed
 
+    def _prompt_value_range(self) -> None:
+        """Ask for a value range (e.g. "90n..110n" or "C 90n..110n") and filter by it."""
+        text = simpledialog.askstring("Value Range", "Range, e.g. 90n..110n or C 90n..110n:", parent=self.root)
+        if text is None:
+            return
+        value_range = parse_range_query(text)
+        if value_range is None:
+            messagebox.showerror("Error", f"Not a value range: {text}")
+            return
+        self.current_value_range = value_range
+        self._refresh_parts_list()
+        self.status_bar.config(text=f"Filtered by value: {text.strip()}")
+
+    def _current_search(self) -> Tuple[Optional[str], Optional[ValueRange]]:
+        """Split the search bar into (text search term, value range). Range
+        queries like "C 90n..110n" become a value range instead of ILIKE."""
+        text = self.search_var.get().strip() if hasattr(self, "search_var") else ""
+        value_range = parse_range_query(text)
+        if value_range is not None:
+            return None, value_range
+        return text or None, self.current_value_range
+
     def _filter_by_component_type(self, component_type: Optional[str]) -> None:
-        """Filter parts by component type."""
-        self.current_component_type_filter = component_type
+        """Filter parts by component type. None clears every filter."""
+        if component_type is None:
+            self.facet_filters = {}
+            self.current_value_range = None
+        else:
+            self.facet_filters["component_type"] = [component_type]
         self._refresh_parts_list()
         filter_text = component_type or "All"
         self.status_bar.config(text=f"Filtered by: {filter_text}")
 
     def _refresh_parts_list(self, component_type_filter: Optional[str] = None) -> None:
-        """Refresh the parts list in the treeview, applying the current search
-        term and sort column/direction. component_type_filter, if given,
-        updates the persisted filter (used by callers like AddPartWindow's
-        refresh_callback that don't know about the current filter state)."""
+        """Refresh the parts list and facet counts, applying the current search
+        term, facet selections and sort column/direction. component_type_filter,
+        if given, replaces the component type facet selection (used by callers
+        like AddPartWindow's refresh_callback that don't know about the
+        current filter state)."""
         if component_type_filter is not None:
-            self.current_component_type_filter = component_type_filter
+            self.facet_filters["component_type"] = [component_type_filter]
 
         # Clear existing items
         for item in self.tree.get_children():
@@ -888,22 +1958,221 @@ class MainGUI:
 
         # Fetch and display parts
         try:
-            search_term = self.search_var.get().strip() if hasattr(self, "search_var") else ""
+            search_term, value_range = self._current_search()
             parts = self.db_manager.get_parts(
-                self.current_component_type_filter,
-                search_term=search_term or None,
+                search_term=search_term,
                 sort_column=self.sort_column,
                 sort_descending=self.sort_descending,
+                value_range=value_range,
+                facet_filters=self.facet_filters,
             )
+            self._tree_items = {}
             for part in parts:
-                self.tree.insert("", "end", text=part[0], values=part[1:])
+                self._tree_items[part[0]] = self.tree.insert("", "end", text=part[0],
+                                                             values=part[1:] + (self._link_state(part[0]),))
+            self._refresh_facets(search_term, value_range)
             self.status_bar.config(text=f"{len(parts)} part(s)")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load parts: {str(e)}")
 
+    def _link_state(self, kicad_part_number: str) -> str:
+        """Worst link state of a part's datasheet/manufacturer URL, or "" if unchecked."""
+        if self.link_checker is None or kicad_part_number not in self.part_links:
+            return ""
+        states = []
+        for url in self.part_links[kicad_part_number]:
+            result = self.link_checker.result(url)
+            states.append(result.state if result is not None else None)
+        return worst_state(states)
+
+    def _start_link_check(self) -> None:
+        """Check every part's datasheet and manufacturer URL in the background."""
+        if self.link_checker is not None and self.link_checker.running:
+            messagebox.showinfo("Link Check", "A link check is already running.")
+            return
+        try:
+            self.part_links = self.db_manager.get_part_links()
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to load part links: {str(e)}")
+            return
+        self._url_part_numbers = {}
+        for kicad_part_number, urls in self.part_links.items():
+            for url in urls:
+                if url.strip():
+                    self._url_part_numbers.setdefault(url.strip(), []).append(kicad_part_number)
+        self.link_checker = LinkChecker()
+        self.link_checker.start(url for urls in self.part_links.values() for url in urls)
+        self._poll_link_check()
+
+    def _poll_link_check(self) -> None:
+        """Show link check progress and fill in the Links column of shown rows."""
+        if self.link_checker is None:
+            return
+        done, total = self.link_checker.progress()
+        changed = {pn for url in self.link_checker.take_finished() for pn in self._url_part_numbers.get(url, ())}
+        for kicad_part_number in changed:
+            item = self._tree_items.get(kicad_part_number)
+            if item is not None:
+                self.tree.set(item, "links", self._link_state(kicad_part_number))
+        if self.link_checker.running:
+            self.status_bar.config(text=f"Checking links: {done}/{total}")
+            self.root.after(1000, self._poll_link_check)
+        else:
+            states = [self._link_state(pn) for pn in self.part_links]
+            self.status_bar.config(text=f"Checked {total} links: {states.count('dead')} part(s) with dead links, "
+                                        f"{states.count('stale')} stale, {states.count('error')} unreachable")
+
+    def _open_module_browser(self) -> None:
+        ModuleBrowserWindow(self.root, self.db_manager, self.module_cache)
+
+    def _open_where_used_window(self) -> None:
+        """List the modules that use the selected part."""
+        selected = self._selected_part_numbers()
+        if not selected:
+            messagebox.showerror("Error", "Please select a part first.")
+            return
+        WhereUsedWindow(self.root, self.db_manager, self.module_cache, selected[0])
+
+    def _open_part_history_window(self) -> None:
+        """Show every recorded change to the selected part."""
+        selected = self._selected_part_numbers()
+        if not selected:
+            messagebox.showerror("Error", "Please select a part first.")
+            return
+        PartHistoryWindow(self.root, self.db_manager, selected[0])
+
+    def _export_library_as_of(self) -> None:
+        """Write the parts table as it was at a given time to CSV, e.g. the
+        library a board was released against."""
+        as_of = simpledialog.askstring("Export Library As Of", "Date and time, e.g. 2026-03-01 12:00:", parent=self.root)
+        if not as_of or not as_of.strip():
+            return
+        path = filedialog.asksaveasfilename(title="Export Library As Of", defaultextension=".csv",
+                                            filetypes=[("CSV", "*.csv")])
+        if not path:
+            return
+        try:
+            with open(path, "w", newline="", encoding="utf-8") as f_out:
+                writer = csv.writer(f_out)
+                writer.writerow(["kicad_part_number"] + DatabaseManager.PART_EDIT_COLUMNS)
+                count = 0
+                for row in self.db_manager.iter_parts(as_of=as_of.strip()):
+                    writer.writerow(row)
+                    count += 1
+        except Exception as e:
+            self.db_manager.db_connection.rollback()
+            messagebox.showerror("Error", f"Failed to export library: {str(e)}")
+            return
+        self.status_bar.config(text=f"Exported {count} parts as of {as_of.strip()} to {path}")
+
+    def _open_offers_window(self) -> None:
+        """Show supplier offers for the selected part's MPN."""
+        selected = self._selected_part_numbers()
+        if not selected:
+            messagebox.showerror("Error", "Please select a part first.")
+            return
+        try:
+            details = self.db_manager.get_part_details(selected[0])
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to load part: {str(e)}")
+            return
+        mpn = (details[5] or "").strip() if details else ""
+        if not mpn:
+            messagebox.showinfo("Supplier Offers", f"{selected[0]} has no manufacturer part number.")
+            return
+        OffersWindow(self.root, self.db_manager, self.offer_cache, selected[0], mpn)
+
+    def _import_supplier_prices(self) -> None:
+        """Bulk-import a supplier's price file via COPY."""
+        path = filedialog.askopenfilename(parent=self.root, title="Open Supplier Price File",
+                                          filetypes=[("CSV", "*.csv"), ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            suppliers = self.db_manager.get_supplier_names()
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to load suppliers: {str(e)}")
+            return
+        supplier_name = simpledialog.askstring(
+            "Supplier", "Supplier name:" + (f"\n(known: {', '.join(suppliers[:10])})" if suppliers else ""),
+            parent=self.root)
+        if not supplier_name:
+            return
+        supplier_name = supplier_name.strip()
+        if supplier_name not in suppliers:
+            messagebox.showerror("Unknown Supplier", f"{supplier_name} isn't in the supplier table. Add it first.")
+            return
+        try:
+            offers, breaks = self.db_manager.import_supplier_prices(supplier_name, path)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to import price file: {str(e)}")
+            return
+        messagebox.showinfo("Import Complete", f"Imported {offers} offer(s) with {breaks} price break(s) for {supplier_name}.")
+
+    def _open_bom_window(self) -> None:
+        """Pick a KiCad BOM export and resolve it against the database."""
+        path = filedialog.askopenfilename(
+            parent=self.root, title="Open KiCad BOM",
+            filetypes=[("KiCad BOM", "*.csv *.xml *.net"), ("All files", "*.*")])
+        if path:
+            BomWindow(self.root, self.db_manager, path, self.offer_cache)
+
+    def _get_datasheet_store(self) -> DatasheetStore:
+        if self.datasheet_store is None:
+            self.datasheet_store = DatasheetStore()
+        return self.datasheet_store
+
+    def _open_datasheet(self) -> None:
+        """Open the selected part's datasheet from the local mirror, downloading
+        it in the background first if it isn't there yet."""
+        selected = self._selected_part_numbers()
+        if not selected:
+            messagebox.showerror("Error", "Please select a part first.")
+            return
+        try:
+            details = self.db_manager.get_part_details(selected[0])
+            datasheet = (details[1] or "").strip() if details else ""
+            if not datasheet:
+                messagebox.showinfo("Datasheet", f"{selected[0]} has no datasheet.")
+                return
+            future = self._get_datasheet_store().fetch_summary(datasheet)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to open datasheet: {str(e)}")
+            return
+        self.status_bar.config(text=f"Fetching datasheet for {selected[0]}...")
+        self._wait_for_datasheet(selected[0], future)
+
+    def _wait_for_datasheet(self, kicad_part_number: str, future) -> None:
+        """Poll the fetch_summary() future from the Tk loop; the download and
+        the PDF scan both run on the store's pool."""
+        if not future.done():
+            self.root.after(100, self._wait_for_datasheet, kicad_part_number, future)
+            return
+        try:
+            path, summary = future.result()
+            details = f"{summary.pages} page(s), " if summary.pages else ""
+            self.status_bar.config(text=f"{kicad_part_number}: {summary.title or path.name} ({details}{summary.size // 1024} KiB)")
+            webbrowser.open(path.as_uri())
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to open datasheet: {str(e)}")
+
+    def _clear_datasheet_cache(self) -> None:
+        """Show datasheet mirror usage and offer to empty it."""
+        try:
+            store = self._get_datasheet_store()
+            usage = store.usage()
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to open datasheet cache: {str(e)}")
+            return
+        if messagebox.askyesno("Datasheet Cache",
+                               f"{usage['objects']} file(s) for {usage['urls']} URL(s), "
+                               f"{usage['bytes'] / 1024 ** 2:.1f} of {usage['size_cap'] / 1024 ** 2:.0f} MiB.\n\n"
+                               "Clear the cache?"):
+            store.clear()
+
     def _open_add_part_window(self) -> None:
         """Open the add part window."""
-        AddPartWindow(self.root, self.db_manager, self.COMPONENT_TYPES, self._refresh_parts_list)
+        AddPartWindow(self.root, self.db_manager, self._component_types(), self._refresh_parts_list, self._lookups(), self.library_index)
 
     def _on_row_double_click(self, event) -> None:
         """Open the edit window for whichever row was double-clicked.
@@ -922,7 +2191,7 @@ class MainGUI:
 
         self.tree.selection_set(row_id)
         kicad_part_number = self.tree.item(row_id, "text")
-        EditPartWindow(self.root, self.db_manager, self.COMPONENT_TYPES, kicad_part_number, self._refresh_parts_list)
+        EditPartWindow(self.root, self.db_manager, self._component_types(), kicad_part_number, self._refresh_parts_list, self._lookups(), self.library_index)
 
     def _open_edit_part_window(self) -> None:
         """Open the edit part window."""
@@ -932,7 +2201,37 @@ class MainGUI:
             return
 
         kicad_part_number = self.tree.item(selected_item[0], "text")
-        EditPartWindow(self.root, self.db_manager, self.COMPONENT_TYPES, kicad_part_number, self._refresh_parts_list)
+        EditPartWindow(self.root, self.db_manager, self._component_types(), kicad_part_number, self._refresh_parts_list, self._lookups(), self.library_index)
+
+    def _selected_part_numbers(self) -> List[str]:
+        """KiCad part numbers of all currently selected Treeview rows."""
+        return [self.tree.item(item, "text") for item in self.tree.selection()]
+
+    def _open_bulk_edit_window(self) -> None:
+        """Open the bulk edit window for the selected parts."""
+        selected = self._selected_part_numbers()
+        if not selected:
+            messagebox.showerror("Error", "No parts selected.")
+            return
+        BulkEditWindow(self.root, self.db_manager, self._component_types(), selected, self._refresh_parts_list, self._lookups())
+
+    def _open_find_replace_window(self) -> None:
+        """Open find/replace over the selection, or over the current filter/search
+        results when nothing is selected."""
+        selected = self._selected_part_numbers()
+        search_term, value_range = self._current_search()
+        FindReplaceWindow(
+            self.root, self.db_manager,
+            selected or None,
+            self.facet_filters,
+            search_term,
+            value_range,
+            self._refresh_parts_list,
+        )
+
+    def _open_duplicates_window(self) -> None:
+        """Open the duplicate finder."""
+        DuplicatesWindow(self.root, self.db_manager, self._refresh_parts_list)
 
     def _open_add_module_window(self) -> None:
         """Open the add module window."""
@@ -942,6 +2241,213 @@ class MainGUI:
         """Open the add supplier window."""
         AddSupplierWindow(self.root, self.db_manager)
 
+    def _generate_kicad_library(self) -> None:
+        """Build the .kicad_dbl and its per-category views, then keep them in
+        sync incrementally for the rest of the session."""
+        initial = self.dbl_generator.output_path if self.dbl_generator is not None else pathlib.Path("kicad_lib.kicad_dbl")
+        path = filedialog.asksaveasfilename(
+            parent=self.root, title="Save KiCad Database Library",
+            defaultextension=".kicad_dbl", initialfile=initial.name,
+            filetypes=[("KiCad database library", "*.kicad_dbl")])
+        if not path:
+            return
+
+        self.dbl_generator = KicadDblGenerator(self.db_manager, pathlib.Path(path), self.connection_settings,
+                                               materialized=self.materialize_var.get())
+        try:
+            report = self.dbl_generator.generate_all()
+        except Exception as e:
+            self.dbl_generator = None
+            messagebox.showerror("Error", f"Failed to generate KiCad library: {str(e)}")
+            return
+        self._show_generation_report(report)
+
+    def _show_generation_report(self, report: GenerationReport) -> None:
+        """Summarise a generation run, listing the first few bad refs."""
+        problems = [(ct, pn, problem) for ct, items in report.ref_problems.items() for pn, problem in items]
+        text = f"Generated {len(report.regenerated)} libraries in {report.elapsed_ms:.0f} ms."
+        if problems:
+            text += f"\n\n{len(problems)} part(s) have refs KiCad can't resolve:\n"
+            text += "\n".join(f"{pn} ({ct or 'no type'}): {problem}" for ct, pn, problem in problems[:20])
+            if len(problems) > 20:
+                text += f"\n... and {len(problems) - 20} more"
+        messagebox.showinfo("KiCad Library", text)
+
+    def _open_ref_validation_window(self) -> None:
+        """Open the bulk symbol/footprint ref validator."""
+        RefValidationWindow(self.root, self.db_manager, self.library_symbol_dirs, self.library_footprint_dirs,
+                            self._set_library_index)
+
+    def _set_library_index(self, index: LibraryIndex) -> None:
+        self.library_index = index
+
+    def _benchmark_library_lookups(self) -> None:
+        """Time KiCad-style part lookups on the largest library, raw table vs view."""
+        if self.dbl_generator is None or not self.dbl_generator.libraries:
+            messagebox.showinfo("Benchmark", "Generate the KiCad library first.")
+            return
+        state = max(self.dbl_generator.libraries.values(), key=lambda library: library.part_count)
+        db_manager = self.db_manager
+        try:
+            # On a connection of its own, so the lookups never share the
+            # GUI's transaction.
+            if self.connection_factory is not None:
+                db_manager = self._background_db_manager_factory()()
+            results = benchmark_lookups(db_manager, state)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to benchmark lookups: {str(e)}")
+            return
+        finally:
+            if db_manager is not self.db_manager:
+                db_manager.db_connection.close()
+        kind = "materialized view" if state.materialized else "view"
+        lines = [f"{state.component_type or 'Uncategorised'} ({state.part_count} parts, {kind})", ""]
+        for relation, stats in results.items():
+            lines.append(f"{relation}: p50 {stats['p50_ms']:.2f} ms, p95 {stats['p95_ms']:.2f} ms, "
+                         f"max {stats['max_ms']:.2f} ms over {stats['count']:.0f} lookups")
+        messagebox.showinfo("Benchmark", "\n".join(lines))
+
+    def _benchmark_prepared_search(self) -> None:
+        """Time the parts search with and without prepared statements: the
+        current filters and search, plus searches for a few listed parts."""
+        search_term, value_range = self._current_search()
+        current = {"search_term": search_term, "sort_column": self.sort_column, "sort_descending": self.sort_descending,
+                   "value_range": value_range, "facet_filters": self.facet_filters}
+        searches = [current] + [dict(current, search_term=kicad_part_number[:4])
+                                for kicad_part_number in list(self._tree_items)[:5]]
+        try:
+            results = benchmark_search(self.db_manager, searches)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to benchmark search: {str(e)}")
+            return
+        lines = [f"{len(searches)} search shapes", ""]
+        for mode, stats in results.items():
+            lines.append(f"{mode}: p50 {stats['p50_ms']:.2f} ms, p95 {stats['p95_ms']:.2f} ms, "
+                         f"planning {stats['planning_ms']:.3f} ms over {stats['count']:.0f} searches")
+        if "plain" in results and "prepared" in results:
+            lines.append("")
+            lines.append(f"Planning saved per search: {results['plain']['planning_ms'] - results['prepared']['planning_ms']:.3f} ms")
+        messagebox.showinfo("Benchmark", "\n".join(lines))
+
+    def _show_memory_report(self) -> None:
+        """Bytes per part of what the application holds for parts: the parts
+        list rows (while the list is filled), the per-part maps and lookup
+        lists kept between refreshes, and the whole library as Part records
+        (as an import holds them) before and after slots and interning."""
+        search_term, value_range = self._current_search()
+        try:
+            rows = self.db_manager.get_parts(search_term=search_term, value_range=value_range,
+                                             facet_filters=self.facet_filters)
+            records = part_record_sizes(self.db_manager.iter_parts())
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to load parts: {str(e)}")
+            return
+        held = held_sizes({"Parts list rows": rows, "Treeview item map": self._tree_items,
+                           "Link check URLs": self.part_links, "URL to parts map": self._url_part_numbers,
+                           "Lookup lists": {name: self.lookup_cache.get(name) for name in
+                                            ("component_types", "manufacturers", "footprint_libraries",
+                                             "symbol_libraries")}}, len(rows))
+        lines = [f"Parts list: {len(rows)} parts", ""]
+        lines += [f"{name}: {size:.0f} bytes/part" for name, size in held]
+        lines += ["", f"Library as Part records: {records['parts']} parts", "",
+                  f"Dataclass: {records['dataclass']:.0f} bytes/part",
+                  f"Slotted: {records['slotted']:.0f} bytes/part",
+                  f"Slotted, repeated fields interned: {records['interned']:.0f} bytes/part"]
+        messagebox.showinfo("Memory Report", "\n".join(lines))
+
+    def _toggle_query_diagnostics(self) -> None:
+        """Start or stop capturing EXPLAIN ANALYZE plans of slow queries."""
+        if not self.diagnostics_var.get():
+            self.db_manager.set_diagnostics(None)
+            self.query_diagnostics = None
+            self.status_bar.config(text="Slow query capture off")
+            return
+        threshold = simpledialog.askfloat("Capture Slow Query Plans", "Capture queries slower than (ms):",
+                                          initialvalue=100.0, minvalue=0.0, parent=self.root)
+        if threshold is None:
+            self.diagnostics_var.set(False)
+            return
+        try:
+            self.query_diagnostics = QueryDiagnostics(PlanStore(), threshold_ms=threshold)
+        except (OSError, sqlite3.Error) as e:
+            self.diagnostics_var.set(False)
+            messagebox.showerror("Error", f"Failed to open the plan store: {str(e)}")
+            return
+        self.db_manager.set_diagnostics(self.query_diagnostics)
+        self.status_bar.config(text=f"Capturing plans of queries slower than {threshold:g} ms")
+
+    def _open_query_plans_window(self) -> None:
+        try:
+            diagnostics = self.query_diagnostics or QueryDiagnostics(PlanStore())
+        except (OSError, sqlite3.Error) as e:
+            messagebox.showerror("Error", f"Failed to open the plan store: {str(e)}")
+            return
+        QueryPlansWindow(self.root, self.db_manager, diagnostics)
+
+    def _toggle_http_library(self) -> None:
+        """Start or stop the local KiCad HTTP library server. On start, offer
+        to write a .kicad_httplib file pointing KiCad at it."""
+        if not self.http_library_var.get():
+            self._stop_http_library()
+            self.status_bar.config(text="KiCad HTTP library stopped")
+            return
+        if self.connection_factory is None:
+            self.http_library_var.set(False)
+            messagebox.showerror("Error", "The HTTP library needs its own database connections.")
+            return
+        try:
+            self.http_library = LibraryServer(self._background_db_manager_factory())
+            self.http_library.start()
+        except Exception as e:
+            self.http_library_var.set(False)
+            messagebox.showerror("Error", f"Failed to start HTTP library: {str(e)}")
+            return
+        path = filedialog.asksaveasfilename(title="Save .kicad_httplib (optional)", defaultextension=".kicad_httplib",
+                                            filetypes=[("KiCad HTTP library", "*.kicad_httplib")])
+        if path:
+            write_httplib_file(pathlib.Path(path), self.http_library.root_url)
+        self.status_bar.config(text=f"Serving KiCad HTTP library at {self.http_library.root_url}")
+
+    def _stop_http_library(self) -> None:
+        if self.http_library is not None:
+            self.http_library.stop()
+            self.http_library = None
+        if hasattr(self, "http_library_var"):
+            self.http_library_var.set(False)
+
+    def _on_undo_key(self, event, action: Callable[[], None]) -> None:
+        """Undo/redo the journal from the keyboard, unless the key was
+        pressed in a text field (e.g. the search bar)."""
+        widget = event.widget
+        if hasattr(widget, "winfo_class") and widget.winfo_class() in self.TEXT_WIDGET_CLASSES:
+            return
+        action()
+
+    def _undo(self) -> None:
+        self._replay_journal(undo=True)
+
+    def _redo(self) -> None:
+        self._replay_journal(undo=False)
+
+    def _replay_journal(self, undo: bool) -> None:
+        """Undo or redo the latest journal group and refresh the parts list."""
+        if self.journal is None:
+            return
+        action = "Undo" if undo else "Redo"
+        try:
+            label = self.journal.undo(self.db_manager) if undo else self.journal.redo(self.db_manager)
+        except JournalConflictError as e:
+            messagebox.showwarning(action, f"Cannot {action.lower()}: {e}")
+            return
+        except Exception as e:  # pylint: disable=broad-except
+            messagebox.showerror("Error", f"Failed to {action.lower()}: {str(e)}")
+            return
+        if label is None:
+            self.status_bar.config(text=f"Nothing to {action.lower()}")
+            return
+        self._refresh_parts_list()
+        self.status_bar.config(text=f"{action}: {label}")
+
     def _open_db_connection_window(self) -> None:
         """Open the database connection settings window."""
         DatabaseConnectionWindow(self.root, self, self.connection_settings)
@@ -961,9 +2467,15 @@ class MainGUI:
 
         new_connection = self.on_update_connection(new_settings)
 
-        self.db_manager = DatabaseManager(new_connection)
+        self._stop_background_services()
+        self.dbl_generator = None
         self.connection_settings = new_settings
-        self.current_component_type_filter = None
+        self.db_manager = self._open_db_manager(new_connection)
+        self.lookup_cache.resume()
+        self.lookup_cache.invalidate()
+        self._start_change_listener()
+        self.facet_filters = {}
+        self.current_value_range = None
         self.sort_column = None
         self.sort_descending = False
         if hasattr(self, "search_var"):
@@ -986,7 +2498,16 @@ class MainGUI:
 
     def run(self) -> None:
         """Start the application."""
-        self.root.mainloop()
+        try:
+            self.root.mainloop()
+        finally:
+            self._stop_background_services()
+            if self.datasheet_store is not None:
+                self.datasheet_store.close()
+            if self.journal is not None:
+                self.db_manager.journal = None
+                self.journal.close()
+                self.journal = None
 
     def close(self) -> None:
         """Close the application."""
@@ -1001,4 +2522,4 @@ if __name__ == "__main__":
     # Initialize and run the application
     # app = MainGUI(db_connection)
     # app.run()
-    pass
\ No newline at end of file
+    pass
@@ -0,0 +1,66 @@
+"""
+Memory held for parts, in bytes per part, as Tools > Memory Report shows it.
+
+Only structures the application actually keeps are measured: the parts list
+rows while the Treeview is filled, the GUI's per-part maps, the lookup lists
+and the Part records an import holds until its INSERT. Part records are
+measured as a plain dataclass (what Part was before it was slotted), as the
+slotted Part, and slotted with the repeated fields interned (see
+database.interned_part), all from the same rows.
+
+Sizes come from deep_size(), which counts an object shared by many rows
+(an interned string, say) once.
+"""
+import sys
+from dataclasses import fields, make_dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from database import Part, interned_part
+
+
+def deep_size(obj: object, seen: Optional[set] = None) -> int:
+    """Bytes held by obj and everything it references, counting each object
+    once (so a string shared by many rows is counted once)."""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, int, float, bool, type(None))):
+        return size
+    if isinstance(obj, dict):
+        return size + sum(deep_size(key, seen) + deep_size(value, seen) for key, value in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return size + sum(deep_size(item, seen) for item in obj)
+    if hasattr(obj, "__dict__"):
+        size += deep_size(vars(obj), seen)
+    for slot in getattr(type(obj), "__slots__", ()):
+        if hasattr(obj, slot):
+            size += deep_size(getattr(obj, slot), seen)
+    return size
+
+
+# Part as it was before it was slotted: same fields, instance __dict__.
+_DictPart = make_dataclass("Part", [(f.name, f.type, f.default) for f in fields(Part)])
+
+
+def part_record_sizes(rows: Iterable[Tuple]) -> Dict[str, float]:
+    """Bytes per part of whole parts (kicad_part_number then
+    DatabaseManager.PART_EDIT_COLUMNS, as iter_parts yields them) held as
+    Part records: {"parts", "dataclass", "slotted", "interned"}."""
+    names = ["kicad_part_number"] + [f.name for f in fields(Part) if f.name != "kicad_part_number"]
+    records = [dict(zip(names, row)) for row in rows]
+    count = max(len(records), 1)
+    return {
+        "parts": len(records),
+        "dataclass": deep_size([_DictPart(**record) for record in records]) / count,
+        "slotted": deep_size([Part(**record) for record in records]) / count,
+        "interned": deep_size([interned_part(**record) for record in records]) / count,
+    }
+
+
+def held_sizes(structures: Dict[str, object], parts: int) -> List[Tuple[str, float]]:
+    """(name, bytes per part) for each structure the caller holds, over
+    parts parts."""
+    count = max(parts, 1)
+    return [(name, deep_size(structure) / count) for name, structure in structures.items()]
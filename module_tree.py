@@ -0,0 +1,194 @@
+"""
+Modules: named assemblies of parts that can nest inside each other. The
+recursive queries here explode a module into its parts, find where a part
+or module is used and resolve BOM part numbers through nested modules.
+
+ModuleTreeMixin is part of database.DatabaseManager and works through its
+cursor, _commit and _new_modules.
+"""
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+
+@dataclass(slots=True)
+class Module:
+    """Data class representing a module in the database."""
+    description: str = ""
+    datasheet: str = ""
+    footprint_ref: str = ""
+    symbol_ref: str = ""
+    model_ref: str = ""
+    kicad_part_number: str = ""
+    manufacturer_part_number: str = ""
+    manufacturer: str = ""
+    manufacturer_part_url: str = ""
+    note: str = ""
+    value: str = ""
+    parts: List[str] = field(default_factory=list)
+
+
+class ModuleTreeMixin:
+    """Module queries of DatabaseManager."""
+
+    # Recursive CTE walking down from the modules in module_roots(module_uuid,
+    # root_part_number) through module_submodules. multiplier is how many of
+    # each (sub)module one root contains; path guards against cycles.
+    MODULE_TREE_CTE = """module_tree (root_part_number, module_uuid, multiplier, depth, path) AS (
+                SELECT root_part_number, module_uuid, 1, 0, ARRAY[module_uuid] FROM module_roots
+                UNION ALL
+                SELECT t.root_part_number, s.child_module_uuid, t.multiplier * s.quantity, t.depth + 1,
+                       t.path || s.child_module_uuid
+                FROM module_tree AS t
+                JOIN module_submodules AS s ON s.parent_module_uuid = t.module_uuid
+                WHERE NOT s.child_module_uuid = ANY(t.path))"""
+
+    def add_module(self, module: Module) -> str:
+        """Add a new module to the database and return its UUID."""
+        module_sql = """INSERT INTO module (description, datasheet, footprint_ref,
+                        symbol_ref, model_ref, kicad_part_number, manufacturer_part_number,
+                        manufacturer, manufacturer_part_url, note, value)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                        RETURNING module_uuid, to_jsonb(module)"""
+        values = [
+            module.description, module.datasheet, module.footprint_ref,
+            module.symbol_ref, module.model_ref, module.kicad_part_number,
+            module.manufacturer_part_number, module.manufacturer,
+            module.manufacturer_part_url, module.note, module.value
+        ]
+        try:
+            self.cursor.execute(module_sql, values)
+            module_uuid, row = self.cursor.fetchone()
+        except Exception:
+            self._new_modules.clear()
+            self.db_connection.rollback()
+            raise
+        # Anything left over belonged to a transaction that has since ended.
+        self._new_modules = {str(module_uuid): row}
+        return module_uuid
+
+    def add_module_parts(self, module_uuid: str, part_uuids: List[str]) -> None:
+        """Add parts to a module."""
+        module_parts_sql = "INSERT INTO module_parts (module_uuid, part_uuid) VALUES (%s, %s)"
+        row = self._new_modules.pop(str(module_uuid), None)
+        self._new_modules.clear()
+        try:
+            for part_uuid in part_uuids:
+                self.cursor.execute(module_parts_sql, (module_uuid, part_uuid))
+            journal = None
+            if row is not None:
+                journal = (f"Add module {row.get('kicad_part_number')}",
+                           [{"op": "i", "t": "module", "r": row, "parts": [str(part_uuid) for part_uuid in part_uuids]}])
+            self._commit("module", "module_parts", journal=journal)
+        except Exception:
+            self.db_connection.rollback()
+            raise
+
+    def resolve_bom_part_numbers(self, part_numbers: List[str]) -> List[Tuple]:
+        """Resolve BOM part numbers in one query. Part numbers of parts map to
+        themselves; those of modules expand, through any nested modules, to
+        their parts, with per_unit the count per module. Returns (bom_part_number,
+        module_part_number or None, per_unit, kicad_part_number, description,
+        manufacturer, manufacturer_part_number, value) rows; part numbers
+        matching nothing are simply absent."""
+        if not part_numbers:
+            return []
+        self.cursor.execute("""
+                SELECT p.kicad_part_number, NULL, 1, p.kicad_part_number, p.description,
+                       p.manufacturer, p.manufacturer_part_number, p.value
+                FROM parts AS p
+                WHERE p.kicad_part_number = ANY(%(part_numbers)s)
+                UNION ALL
+                (WITH RECURSIVE module_roots AS (
+                    SELECT m.module_uuid, m.kicad_part_number AS root_part_number
+                    FROM module AS m
+                    WHERE m.kicad_part_number = ANY(%(part_numbers)s)
+                      AND NOT EXISTS (SELECT 1 FROM parts AS direct WHERE direct.kicad_part_number = m.kicad_part_number)
+                ), """ + self.MODULE_TREE_CTE + """
+                SELECT t.root_part_number, t.root_part_number, sum(t.multiplier)::int, p.kicad_part_number,
+                       p.description, p.manufacturer, p.manufacturer_part_number, p.value
+                FROM module_tree AS t
+                JOIN module_parts AS mp ON mp.module_uuid = t.module_uuid
+                JOIN parts AS p ON p.parts_uuid = mp.part_uuid
+                GROUP BY t.root_part_number, p.kicad_part_number, p.description,
+                         p.manufacturer, p.manufacturer_part_number, p.value)""",
+                            {"part_numbers": list(part_numbers)})
+        return self.cursor.fetchall()
+
+    def get_modules(self) -> List[Tuple[str, str, int, int]]:
+        """(kicad_part_number, description, direct part count, submodule count)
+        for every module."""
+        self.cursor.execute("""SELECT m.kicad_part_number, coalesce(m.description, ''),
+                       (SELECT count(*) FROM module_parts AS mp WHERE mp.module_uuid = m.module_uuid)::int,
+                       (SELECT count(*) FROM module_submodules AS s WHERE s.parent_module_uuid = m.module_uuid)::int
+                FROM module AS m ORDER BY m.kicad_part_number""")
+        return self.cursor.fetchall()
+
+    def explode_module(self, kicad_part_number: str) -> List[Tuple[str, str, str, str, str, int, int]]:
+        """Fully expand a module through its nested modules in one recursive
+        query. Returns (kicad_part_number, description, manufacturer,
+        manufacturer_part_number, value, quantity, min depth) per part."""
+        self.cursor.execute("""WITH RECURSIVE module_roots AS (
+                    SELECT module_uuid, kicad_part_number AS root_part_number FROM module WHERE kicad_part_number = %s
+                ), """ + self.MODULE_TREE_CTE + """
+                SELECT p.kicad_part_number, coalesce(p.description, ''), coalesce(p.manufacturer, ''),
+                       coalesce(p.manufacturer_part_number, ''), coalesce(p.value, ''),
+                       sum(t.multiplier)::int, min(t.depth)
+                FROM module_tree AS t
+                JOIN module_parts AS mp ON mp.module_uuid = t.module_uuid
+                JOIN parts AS p ON p.parts_uuid = mp.part_uuid
+                GROUP BY p.kicad_part_number, p.description, p.manufacturer, p.manufacturer_part_number, p.value
+                ORDER BY p.kicad_part_number""", (kicad_part_number,))
+        return self.cursor.fetchall()
+
+    def get_where_used(self, kicad_part_number: str) -> List[Tuple[str, str, int, int]]:
+        """Every module that contains a part (or module, by part number),
+        directly or through nested modules, in one recursive query walking up
+        the module_parts/module_submodules indexes. Returns
+        (module kicad_part_number, description, depth, quantity), depth 1
+        meaning a direct user."""
+        self.cursor.execute("""WITH RECURSIVE users (module_uuid, multiplier, depth, path) AS (
+                    SELECT mp.module_uuid, count(*)::int, 1, ARRAY[mp.module_uuid]
+                    FROM module_parts AS mp
+                    JOIN parts AS p ON p.parts_uuid = mp.part_uuid
+                    WHERE p.kicad_part_number = %(part_number)s
+                    GROUP BY mp.module_uuid
+                    UNION ALL
+                    SELECT s.parent_module_uuid, s.quantity, 1, ARRAY[s.parent_module_uuid]
+                    FROM module_submodules AS s
+                    JOIN module AS child ON child.module_uuid = s.child_module_uuid
+                    WHERE child.kicad_part_number = %(part_number)s
+                    UNION ALL
+                    SELECT s.parent_module_uuid, u.multiplier * s.quantity, u.depth + 1, u.path || s.parent_module_uuid
+                    FROM users AS u
+                    JOIN module_submodules AS s ON s.child_module_uuid = u.module_uuid
+                    WHERE NOT s.parent_module_uuid = ANY(u.path)
+                )
+                SELECT m.kicad_part_number, coalesce(m.description, ''), min(u.depth), sum(u.multiplier)::int
+                FROM users AS u
+                JOIN module AS m ON m.module_uuid = u.module_uuid
+                GROUP BY m.kicad_part_number, m.description
+                ORDER BY min(u.depth), m.kicad_part_number""", {"part_number": kicad_part_number})
+        return self.cursor.fetchall()
+
+    def add_module_submodule(self, parent_part_number: str, child_part_number: str, quantity: int = 1) -> None:
+        """Nest quantity of one module inside another (adding to any existing
+        count). Refuses to create a cycle."""
+        if quantity < 1:
+            raise ValueError("Quantity must be at least 1.")
+        try:
+            if parent_part_number == child_part_number or any(
+                    row[0] == child_part_number for row in self.get_where_used(parent_part_number)):
+                raise ValueError(f"{child_part_number} already contains {parent_part_number}.")
+            self.cursor.execute("""INSERT INTO module_submodules (parent_module_uuid, child_module_uuid, quantity)
+                    SELECT parent.module_uuid, child.module_uuid, %s
+                    FROM module AS parent, module AS child
+                    WHERE parent.kicad_part_number = %s AND child.kicad_part_number = %s
+                    ON CONFLICT (parent_module_uuid, child_module_uuid)
+                    DO UPDATE SET quantity = module_submodules.quantity + EXCLUDED.quantity""",
+                                (quantity, parent_part_number, child_part_number))
+            if self.cursor.rowcount == 0:
+                raise ValueError(f"Unknown module {parent_part_number} or {child_part_number}.")
+            self._commit("module_submodules")
+        except Exception:
+            self.db_connection.rollback()
+            raise
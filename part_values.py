@@ -0,0 +1,371 @@
+"""
+Normalisation helpers for free-text part fields (values and MPNs).
+
+Part values are typed by hand ("4k7", "100nF", "0.1u", "10 kΩ"), so anything
+that wants to compare or range-search them goes through parse_value first,
+which turns them into an SI magnitude and a unit.
+"""
+import re
+from typing import NamedTuple, Optional, Tuple
+
+# Anything that isn't a letter or digit is noise in an MPN ("LM358-N/NOPB" vs "LM358N NOPB").
+# Keep this in step with MPN_KEY_SQL so client- and server-side keys agree.
+_MPN_NOISE_RE = re.compile(r"[^A-Za-z0-9]")
+MPN_KEY_SQL = "upper(regexp_replace(manufacturer_part_number, '[^A-Za-z0-9]', '', 'g'))"
+
+# SI prefixes. Case matters for m/M; k/K are both kilo because "10K" is everywhere.
+PREFIXES = {
+    "f": 1e-15, "p": 1e-12, "n": 1e-9, "u": 1e-6, "m": 1e-3,
+    "k": 1e3, "K": 1e3, "M": 1e6, "G": 1e9, "T": 1e12,
+}
+
+# Unit spellings (lower-cased) to canonical unit.
+UNITS = {
+    "ohm": "ohm", "ohms": "ohm", "r": "ohm",
+    "f": "F", "h": "H", "v": "V", "a": "A", "w": "W", "hz": "Hz",
+}
+
+# Unit assumed when the value doesn't carry one ("10k" on a resistor).
+COMPONENT_TYPE_UNITS = {
+    "Resistor": "ohm",
+    "Capacitor": "F",
+    "Inductor": "H",
+}
+
+# Reference designator letters accepted in range queries ("C 90n..110n").
+DESIGNATOR_COMPONENT_TYPES = {
+    "R": "Resistor",
+    "C": "Capacitor",
+    "L": "Inductor",
+}
+
+# Digits are ASCII only, as in the SQL mirror below.
+_NUMBER_RE = re.compile(r"^(\d+(?:\.\d*)?|\.\d+)([eE][+-]?\d+)?([A-Za-z]*)", re.ASCII)
+
+# RKM / "4k7" style: digits, a multiplier letter standing in for the decimal point, digits.
+_RKM_RE = re.compile(r"^(\d+)([RrpnumkKMG])(\d+)([A-Za-z]*)", re.ASCII)
+
+_LETTERS_RE = re.compile(r"^[A-Za-z]+$")
+
+_DIGITS_RE = re.compile(r"[0-9]+")
+
+# natural_sort_key as an SQL function, so the database can key rows written
+# by any tool (see DatabaseManager.SCHEMA_STATEMENTS). Keep the two in step.
+NATURAL_SORT_KEY_FUNCTION = """CREATE OR REPLACE FUNCTION kicad_natural_sort_key(text) RETURNS text
+        LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE AS $natural$
+    DECLARE
+        value text := lower(coalesce($1, ''));
+        texts text[];
+        digits text[];
+        run text;
+        key text;
+    BEGIN
+        IF value !~ '[0-9]' THEN
+            RETURN value;
+        END IF;
+        -- The text between digit runs, and the runs themselves.
+        texts := regexp_split_to_array(value, '[0-9]+');
+        digits := regexp_split_to_array(value, '[^0-9]+');
+        IF digits[1] = '' THEN
+            digits := digits[2:];
+        END IF;
+        key := texts[1];
+        FOR i IN 1 .. array_length(texts, 1) - 1 LOOP
+            run := ltrim(digits[i], '0');
+            key := key || CASE WHEN length(run) < 10 THEN '0' ELSE '' END || length(run) || run || texts[i + 1];
+        END LOOP;
+        RETURN key;
+    END
+    $natural$"""
+
+# Whitespace as str.split() sees it, as an SQL regex bracket expression.
+_WHITESPACE_SQL = r"[ \t\n\r\f\v\x1c-\x1f\u0085\u00a0\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000]"
+
+# parse_value as SQL functions, so the database can fill value_magnitude and
+# value_unit for rows written by any tool (see DatabaseManager.SCHEMA_STATEMENTS).
+# They read PREFIXES, UNITS and COMPONENT_TYPE_UNITS from here; keep the code
+# in step with _split_suffix, _parse_quantity and parse_value. Magnitudes are
+# worked out in numeric and rounded to 12 significant digits, as parse_value
+# does, so both sides store the same double.
+_PREFIX_SQL = "CASE left(suffix, 1) " + " ".join(f"WHEN '{prefix}' THEN {multiplier!r}"
+                                                  for prefix, multiplier in PREFIXES.items()) + " END"
+_UNIT_SQL = "CASE lower({}) " + " ".join(f"WHEN '{spelling}' THEN '{unit}'" for spelling, unit in UNITS.items()) + " END"
+_TYPE_UNIT_SQL = "CASE component_type " + " ".join(f"WHEN '{component_type}' THEN '{unit}'"
+                                                   for component_type, unit in COMPONENT_TYPE_UNITS.items()) + " ELSE '' END"
+
+PARSE_VALUE_FUNCTIONS = [
+    f"""CREATE OR REPLACE FUNCTION kicad_value_suffix(suffix text, OUT multiplier numeric, OUT unit text)
+            LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE AS $suffix$
+        DECLARE
+            rest text;
+        BEGIN
+            IF suffix = '' THEN
+                multiplier := 1;
+                unit := '';
+                RETURN;
+            END IF;
+            unit := {_UNIT_SQL.format("suffix")};
+            IF unit IS NOT NULL AND suffix NOT IN ('m', 'M') THEN
+                multiplier := 1;
+                RETURN;
+            END IF;
+            IF lower(suffix) LIKE 'meg%' THEN
+                multiplier := 1e6;
+                rest := substr(suffix, 4);
+            ELSE
+                multiplier := {_PREFIX_SQL};
+                rest := substr(suffix, 2);
+            END IF;
+            unit := CASE WHEN rest = '' THEN '' ELSE {_UNIT_SQL.format("rest")} END;
+            IF multiplier IS NULL OR unit IS NULL THEN
+                multiplier := NULL;
+                unit := NULL;
+            END IF;
+        END
+        $suffix$""",
+    r"""CREATE OR REPLACE FUNCTION kicad_value_quantity(word text, OUT magnitude double precision, OUT unit text)
+            LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE AS $quantity$
+        DECLARE
+            m text[];
+            split record;
+            exponent numeric;
+            scaled numeric;
+        BEGIN
+            m := regexp_match(word, '^([0-9]+)([RrpnumkKMG])([0-9]+)([A-Za-z]*)');
+            IF m IS NOT NULL AND substr(word, length(m[1] || m[2] || m[3] || m[4]) + 1, 1) !~ '[0-9]' THEN
+                scaled := (m[1] || '.' || m[3])::numeric;
+                IF m[2] IN ('R', 'r') THEN
+                    unit := 'ohm';
+                ELSE
+                    split := kicad_value_suffix(m[2]);
+                    scaled := scaled * split.multiplier;
+                    unit := '';
+                END IF;
+                IF m[4] <> '' THEN
+                    split := kicad_value_suffix(m[4]);
+                    IF split.multiplier IS DISTINCT FROM 1 THEN
+                        unit := NULL;
+                        RETURN;
+                    END IF;
+                    unit := coalesce(nullif(split.unit, ''), unit);
+                END IF;
+            ELSE
+                m := regexp_match(word, '^([0-9]+(?:\.[0-9]*)?|\.[0-9]+)([eE][+-]?[0-9]+)?([A-Za-z]*)');
+                IF m IS NULL THEN
+                    RETURN;
+                END IF;
+                split := kicad_value_suffix(m[3]);
+                IF split.multiplier IS NULL THEN
+                    RETURN;
+                END IF;
+                unit := split.unit;
+                IF length(m[1]) > 1000 THEN
+                    -- Beyond what numeric reads; left unparsed.
+                    unit := NULL;
+                    RETURN;
+                END IF;
+                -- numeric only reads exponents up to +-1000, and nothing
+                -- beyond that is in a double's range anyway.
+                exponent := coalesce(substr(m[2], 2)::numeric, 0);
+                IF abs(exponent) > 1000 THEN
+                    magnitude := CASE WHEN m[1]::numeric = 0 OR exponent < 0 THEN 0 ELSE 'Infinity'::double precision END;
+                    RETURN;
+                END IF;
+                scaled := (m[1] || coalesce(m[2], ''))::numeric * split.multiplier;
+            END IF;
+
+            -- What a double makes of it: overflow to infinity, underflow to
+            -- zero, otherwise the value to 12 significant digits.
+            magnitude := CASE WHEN scaled > 1.7976931348623157e308 THEN 'Infinity'::double precision
+                              WHEN scaled < 2.5e-324 THEN 0
+                              ELSE to_char(scaled, '9.99999999999EEEE')::double precision END;
+        END
+        $quantity$""",
+    f"""CREATE OR REPLACE FUNCTION kicad_parse_value(value text, component_type text,
+                                                    OUT magnitude double precision, OUT unit text)
+            LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE AS $parse$
+        DECLARE
+            words text[];
+            parsed record;
+        BEGIN
+            words := regexp_split_to_array(
+                regexp_replace(replace(replace(replace(replace(coalesce(value, ''), 'µ', 'u'), 'μ', 'u'),
+                                               'Ω', 'ohm'), 'Ω', 'ohm'),
+                               '^{_WHITESPACE_SQL}+|{_WHITESPACE_SQL}+$', '', 'g'),
+                '{_WHITESPACE_SQL}+');
+            IF words[1] = '' THEN
+                RETURN;
+            END IF;
+            IF array_length(words, 1) > 1 AND words[2] ~ '^[A-Za-z]+$' THEN
+                parsed := kicad_value_quantity(words[1] || words[2]);
+                magnitude := parsed.magnitude;
+                unit := parsed.unit;
+            END IF;
+            IF magnitude IS NULL THEN
+                parsed := kicad_value_quantity(words[1]);
+                magnitude := parsed.magnitude;
+                unit := parsed.unit;
+            END IF;
+            IF magnitude IS NULL THEN
+                unit := NULL;
+            ELSIF unit = '' THEN
+                unit := {_TYPE_UNIT_SQL};
+            END IF;
+        END
+        $parse$""",
+]
+
+_RANGE_RE = re.compile(r"^(?:(?P<designator>[A-Za-z])\s+)?(?P<low>\S*)\s*\.\.\s*(?P<high>\S*)$")
+
+
+class ValueRange(NamedTuple):
+    """A numeric value range query. Either bound may be None (open-ended)."""
+    component_type: Optional[str]
+    unit: str
+    low: Optional[float]
+    high: Optional[float]
+
+
+def normalize_mpn(mpn: str) -> str:
+    """Reduce an MPN to a comparison key: upper case, letters and digits only."""
+    return _MPN_NOISE_RE.sub("", mpn or "").upper()
+
+
+def _fold(text: str) -> str:
+    """Fold the spellings people actually type into plain ASCII."""
+    text = (text or "").strip()
+    text = text.replace("µ", "u").replace("μ", "u")
+    return text.replace("Ω", "ohm").replace("Ω", "ohm")
+
+
+def _clean(text: str) -> str:
+    """_fold, with the spaces taken out."""
+    return re.sub(r"\s+", "", _fold(text))
+
+
+def _split_suffix(suffix: str) -> Optional[Tuple[float, str]]:
+    """Split the letters after the number into (multiplier, unit)."""
+    if not suffix:
+        return 1.0, ""
+    unit = UNITS.get(suffix.lower())
+    if unit and suffix not in ("m", "M"):
+        return 1.0, unit
+    if suffix.lower().startswith("meg"):
+        multiplier, rest = 1e6, suffix[3:]
+    elif suffix[0] in PREFIXES:
+        multiplier, rest = PREFIXES[suffix[0]], suffix[1:]
+    else:
+        return None
+    if not rest:
+        return multiplier, ""
+    unit = UNITS.get(rest.lower())
+    if unit is None:
+        return None
+    return multiplier, unit
+
+
+def _parse_quantity(text: str) -> Optional[Tuple[float, str]]:
+    """Parse one word such as "4k7", "100nF" or "10kohm" into (multiplier
+    applied number, unit); anything after its letters is ignored."""
+    rkm = _RKM_RE.match(text)
+    if rkm and not _DIGITS_RE.match(text, rkm.end()):
+        whole, marker, fraction, suffix = rkm.groups()
+        number = float(f"{whole}.{fraction}")
+        multiplier = 1.0 if marker in "Rr" else PREFIXES[marker]
+        unit = "ohm" if marker in "Rr" else ""
+        if suffix:
+            split = _split_suffix(suffix)
+            if split is None or split[0] != 1.0:
+                return None
+            unit = split[1] or unit
+    else:
+        match = _NUMBER_RE.match(text)
+        if not match:
+            return None
+        mantissa, exponent, suffix = match.groups()
+        number = float(mantissa + (exponent or ""))
+        split = _split_suffix(suffix)
+        if split is None:
+            return None
+        multiplier, unit = split
+    return number * multiplier, unit
+
+
+def parse_value(value: str, component_type: Optional[str] = None) -> Optional[Tuple[float, str]]:
+    """Parse a value string into (SI magnitude, unit).
+
+    Only the leading quantity is read, so "100nF 50V X7R" parses as 1e-7 F
+    and "10k 1%" as 10 kohm. That is the first word, joined with the second
+    when that is all letters and completes its prefix or unit, as in
+    "10 kΩ" or "4k7 ohm". The unit falls back to the component type's usual
+    unit when the value doesn't give one, and to "" when that isn't known
+    either. Returns None when the value doesn't start with a number.
+    """
+    words = _fold(value).split(maxsplit=2)
+    if not words:
+        return None
+    parsed = None
+    if len(words) > 1 and _LETTERS_RE.match(words[1]):
+        parsed = _parse_quantity(words[0] + words[1])
+    if parsed is None:
+        parsed = _parse_quantity(words[0])
+    if parsed is None:
+        return None
+
+    number, unit = parsed
+    if not unit and component_type:
+        unit = COMPONENT_TYPE_UNITS.get(component_type, "")
+    # Round off float noise so "100n" and "0.1u" store the same magnitude.
+    return float(f"{number:.12g}"), unit
+
+
+def normalize_value(value: str, component_type: Optional[str] = None) -> str:
+    """Reduce a value string to a comparison key, so "10k", "10 kΩ", "10K ohm"
+    and "10000R" all compare equal. Unparseable values fall back to their
+    cleaned, lower-cased text. Returns "" for empty values."""
+    parsed = parse_value(value, component_type)
+    if parsed is None:
+        return _clean(value).lower()
+    magnitude, unit = parsed
+    return f"{magnitude:.6g}{unit}"
+
+
+def natural_sort_key(text: str) -> str:
+    """A key that sorts text with runs of digits in numeric order ("R2"
+    before "R10"), when compared byte by byte (COLLATE "C"). Each digit run
+    becomes its length, as two digits, then the digits without leading
+    zeros; letters are lower-cased."""
+    return _DIGITS_RE.sub(lambda match: f"{len(match.group().lstrip('0')):02d}{match.group().lstrip('0')}",
+                          (text or "").lower())
+
+
+def parse_range_query(text: str) -> Optional[ValueRange]:
+    """Parse a range query such as "C 90n..110n", "R ..10k" or "1uH..4.7uH".
+
+    Returns None if text isn't a range query, so callers can fall back to a
+    plain text search.
+    """
+    match = _RANGE_RE.match((text or "").strip())
+    if not match or not (match.group("low") or match.group("high")):
+        return None
+
+    designator = match.group("designator")
+    component_type = None
+    if designator:
+        component_type = DESIGNATOR_COMPONENT_TYPES.get(designator.upper())
+        if component_type is None:
+            return None
+
+    bounds = []
+    unit = ""
+    for bound in (match.group("low"), match.group("high")):
+        if not bound:
+            bounds.append(None)
+            continue
+        parsed = parse_value(bound, component_type)
+        if parsed is None:
+            return None
+        bounds.append(parsed[0])
+        unit = unit or parsed[1]
+
+    return ValueRange(component_type, unit, bounds[0], bounds[1])
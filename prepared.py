@@ -0,0 +1,183 @@
+"""
+Server-side prepared statements for DatabaseManager's hot queries.
+
+The parts list, part details and combobox queries run on every keystroke,
+refresh and window open. PreparedStatements PREPAREs each distinct query
+text (each filter/search/sort shape of get_parts is its own text) once per
+connection and then runs it with EXECUTE by name. Postgres then skips
+parsing on every call, and once it settles on a generic plan (after five
+executions, if that plan is no worse) it skips planning too.
+
+Prepared statements belong to the server session. The registry forgets them
+whenever the connection's backend changes, and re-prepares if the server
+reports one missing (e.g. after DISCARD ALL behind a pooler).
+"""
+import logging
+import re
+import time
+from collections import OrderedDict
+from hashlib import sha1
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from psycopg2 import extensions
+
+logger = logging.getLogger(__name__)
+
+# SQLSTATE invalid_sql_statement_name: EXECUTE of a statement the session doesn't have.
+MISSING_STATEMENT = "26000"
+
+_PLACEHOLDER_RE = re.compile(r"%(s|%)")
+
+
+def to_server_placeholders(sql: str) -> Tuple[str, int]:
+    """Rewrite psycopg2 %s placeholders as $1, $2, ... (and %% as %) for
+    PREPARE. Returns the rewritten text and the parameter count."""
+    count = 0
+
+    def replace(match: "re.Match[str]") -> str:
+        nonlocal count
+        if match.group(1) == "%":
+            return "%"
+        count += 1
+        return f"${count}"
+
+    return _PLACEHOLDER_RE.sub(replace, sql), count
+
+
+class PreparedStatements:
+    """Prepared statements of one connection, keyed by query text.
+
+    At most max_statements are kept; the least recently used is deallocated
+    to make room. With enabled False, execute() is a plain cursor.execute()
+    (used by the benchmark for the baseline).
+    """
+
+    def __init__(self, connection, max_statements: int = 64):
+        self.connection = connection
+        self.max_statements = max_statements
+        self.enabled = True
+        self.prepared = 0
+        self.executed = 0
+        self._names: "OrderedDict[str, str]" = OrderedDict()
+        self._backend_pid = None
+
+    def _check_backend(self) -> None:
+        """Forget everything if the connection now talks to a different
+        server process (reconnected), since its statements went with it."""
+        backend_pid = self.connection.get_backend_pid()
+        if backend_pid != self._backend_pid:
+            if self._names:
+                logger.info("Connection backend changed; re-preparing %d statements on demand", len(self._names))
+            self._names.clear()
+            self._backend_pid = backend_pid
+
+    def _prepare(self, cursor, sql: str) -> str:
+        name = "kdb_" + sha1(sql.encode("utf-8")).hexdigest()[:16]
+        server_sql, _count = to_server_placeholders(sql)
+        cursor.execute(f"PREPARE {name} AS {server_sql}")
+        self._names[sql] = name
+        self.prepared += 1
+        while len(self._names) > self.max_statements:
+            _sql, oldest = self._names.popitem(last=False)
+            cursor.execute(f"DEALLOCATE {oldest}")
+        return name
+
+    def _name(self, cursor, sql: str) -> str:
+        name = self._names.get(sql)
+        if name is None:
+            return self._prepare(cursor, sql)
+        self._names.move_to_end(sql)
+        return name
+
+    def sql_for(self, name: str) -> Optional[str]:
+        """The query text a statement name was prepared from, if known."""
+        for sql, prepared_name in self._names.items():
+            if prepared_name == name:
+                return sql
+        return None
+
+    @staticmethod
+    def _execute_statement(name: str, params: Sequence[object]) -> str:
+        return f"EXECUTE {name} ({', '.join(['%s'] * len(params))})" if params else f"EXECUTE {name}"
+
+    def execute(self, cursor, sql: str, params: Sequence[object] = ()) -> None:
+        """Run sql (psycopg2 %s style) with params as a prepared statement."""
+        if not self.enabled:
+            cursor.execute(sql, params)
+            return
+        self._check_backend()
+        idle = self.connection.get_transaction_status() == extensions.TRANSACTION_STATUS_IDLE
+        name = self._name(cursor, sql)
+        try:
+            cursor.execute(self._execute_statement(name, params), params)
+        except Exception as e:
+            # The session lost its statements behind our back. Only safe to
+            # recover if no transaction of the caller's was under way.
+            if getattr(e, "pgcode", None) != MISSING_STATEMENT or not idle:
+                raise
+            self.connection.rollback()
+            self._names.clear()
+            logger.info("Prepared statement %s was missing; re-preparing", name)
+            name = self._name(cursor, sql)
+            cursor.execute(self._execute_statement(name, params), params)
+        self.executed += 1
+
+    def planning_ms(self, cursor, sql: str, params: Sequence[object] = ()) -> float:
+        """Server-side planning time for one run of sql, as EXPLAIN reports
+        it: of the prepared statement (its cached plan, once there is one)
+        when enabled, otherwise of the plain query."""
+        if self.enabled:
+            self._check_backend()
+            cursor.execute("EXPLAIN (SUMMARY ON, FORMAT JSON) " + self._execute_statement(self._name(cursor, sql), params),
+                           params)
+        else:
+            cursor.execute("EXPLAIN (SUMMARY ON, FORMAT JSON) " + sql, params)
+        return float(cursor.fetchone()[0][0].get("Planning Time", 0.0))
+
+
+def _stats(timings: List[float]) -> Dict[str, float]:
+    ordered = sorted(timings)
+    return {
+        "count": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered),
+        "p50_ms": ordered[len(ordered) // 2],
+        "p95_ms": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        "max_ms": ordered[-1],
+    }
+
+
+def benchmark_search(db_manager, searches: Iterable[Dict[str, object]], repeats: int = 20,
+                     warmup: int = 6) -> Dict[str, Dict[str, float]]:
+    """Time get_parts() for each set of keyword arguments in searches, with
+    plain and with prepared statements, and measure the server's planning
+    time per call both ways. Each query runs warmup times first, so the
+    prepared side is measured once the server has picked its plan.
+
+    Returns {"plain": stats, "prepared": stats}, each with count/mean/p50/
+    p95/max in milliseconds plus "planning_ms", the mean planning time.
+    """
+    searches = list(searches)
+    statements = db_manager.statements
+    was_enabled = statements.enabled
+    results: Dict[str, Dict[str, float]] = {}
+    try:
+        for mode, enabled in (("plain", False), ("prepared", True)):
+            statements.enabled = enabled
+            timings: List[float] = []
+            planning: List[float] = []
+            for search in searches:
+                for _ in range(warmup):
+                    db_manager.get_parts(**search)
+                for _ in range(repeats):
+                    started = time.perf_counter()
+                    db_manager.get_parts(**search)
+                    timings.append((time.perf_counter() - started) * 1000)
+                sql, params = db_manager.parts_query(**search)
+                planning.append(statements.planning_ms(db_manager.cursor, sql, params))
+            if timings:
+                results[mode] = dict(_stats(timings), planning_ms=sum(planning) / len(planning))
+    finally:
+        statements.enabled = was_enabled
+        db_manager.db_connection.rollback()
+    logger.info("Search benchmark over %d queries: %s", len(searches), results)
+    return results
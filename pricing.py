@@ -0,0 +1,343 @@
+"""
+Supplier offers, quantity price breaks and BOM pricing.
+
+Offers live in supplier_offers (one per supplier and MPN) with their price
+breaks in supplier_price_breaks; DatabaseManager.import_supplier_prices()
+bulk-loads a supplier's price file through COPY. Offers are matched to parts
+by normalised MPN (part_values.normalize_mpn), so "LM358-N/NOPB" and
+"LM358N NOPB" find the same offers.
+
+Prices are only ever compared within one currency: best_quotes() picks the
+best offer per currency, and a BOM is priced in one currency, with parts that
+only have offers in other currencies reported rather than converted.
+
+OfferCache keeps the offers it has loaded keyed by normalised MPN, so pricing
+the same or an overlapping BOM again only queries for MPNs it hasn't seen.
+"""
+import bisect
+import csv
+import logging
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bom import BomReport
+from caching import TTLCache
+from part_values import normalize_mpn
+
+logger = logging.getLogger(__name__)
+
+# Columns a supplier price file may have (CSV with a header row, one row per
+# price break). Offer columns repeat on each of an offer's break rows.
+PRICE_FILE_COLUMNS = ("manufacturer_part_number", "supplier_part_number", "stock", "currency",
+                      "min_quantity", "unit_price")
+REQUIRED_PRICE_FILE_COLUMNS = ("manufacturer_part_number", "min_quantity", "unit_price")
+# Currency of offers whose price file has no currency column, and of a BOM
+# priced without naming one.
+DEFAULT_CURRENCY = "USD"
+
+
+@dataclass
+class Offer:
+    """One supplier's offer for an MPN, breaks sorted by min_quantity."""
+    supplier_name: str
+    manufacturer_part_number: str
+    supplier_part_number: str = ""
+    stock: Optional[int] = None
+    currency: str = ""
+    breaks: List[Tuple[int, Decimal]] = field(default_factory=list)
+
+    def unit_price(self, quantity: int) -> Optional[Decimal]:
+        """Price per unit when buying quantity: the break with the largest
+        min_quantity not above it. None if quantity is below every break."""
+        index = bisect.bisect_right([min_quantity for min_quantity, _ in self.breaks], quantity) - 1
+        return self.breaks[index][1] if index >= 0 else None
+
+    def in_stock(self, quantity: int) -> bool:
+        """Unknown stock counts as in stock."""
+        return self.stock is None or self.stock >= quantity
+
+
+@dataclass
+class Quote:
+    """The offer chosen for a quantity of one MPN."""
+    offer: Offer
+    quantity: int
+    unit_price: Decimal
+
+    @property
+    def extended_price(self) -> Decimal:
+        """unit_price times quantity."""
+        return self.unit_price * self.quantity
+
+
+def best_quotes(offers: Iterable[Offer], quantity: int) -> Dict[str, Quote]:
+    """Cheapest offer per currency that can supply quantity, preferring
+    offers with enough stock. Prices are only compared within a currency."""
+    best: Dict[str, Quote] = {}
+    best_keys: Dict[str, Tuple[bool, Decimal]] = {}
+    for offer in offers:
+        price = offer.unit_price(quantity)
+        if price is None:
+            continue
+        key = (not offer.in_stock(quantity), price)
+        if offer.currency not in best_keys or key < best_keys[offer.currency]:
+            best[offer.currency], best_keys[offer.currency] = Quote(offer, quantity, price), key
+    return best
+
+
+def best_quote(offers: Iterable[Offer], quantity: int, currency: str = DEFAULT_CURRENCY) -> Optional[Quote]:
+    """Best offer in currency that can supply quantity (see best_quotes)."""
+    return best_quotes(offers, quantity).get(currency)
+
+
+def offers_from_rows(rows: Iterable[Tuple]) -> Dict[str, List[Offer]]:
+    """Group DatabaseManager.get_offers() rows (offer_id, mpn_key,
+    supplier_name, manufacturer_part_number, supplier_part_number, stock,
+    currency, min_quantity, unit_price; ordered by offer then min_quantity)
+    into Offers per normalised MPN."""
+    offers: Dict[str, List[Offer]] = {}
+    by_id: Dict[int, Offer] = {}
+    for offer_id, mpn_key, supplier_name, mpn, spn, stock, currency, min_quantity, unit_price in rows:
+        offer = by_id.get(offer_id)
+        if offer is None:
+            offer = by_id[offer_id] = Offer(supplier_name, mpn, spn or "", stock, currency or "")
+            offers.setdefault(mpn_key, []).append(offer)
+        if min_quantity is not None:
+            offer.breaks.append((min_quantity, Decimal(unit_price)))
+    return offers
+
+
+class OfferCache:
+    """Offers per normalised MPN, loaded from the database on demand.
+
+    Any committed write to supplier_offers should call invalidate()."""
+
+    def __init__(self, ttl: float = 300.0):
+        self._offers: TTLCache = TTLCache(ttl)
+
+    def invalidate(self) -> None:
+        """Drop every cached offer."""
+        self._offers.invalidate()
+
+    def get_offers(self, db_manager, mpns: Iterable[str]) -> Dict[str, List[Offer]]:
+        """Offers for each MPN (keyed by normalised MPN), fetching all the
+        uncached ones in a single query."""
+        keys = {normalize_mpn(mpn) for mpn in mpns if mpn}
+        keys.discard("")
+        found: Dict[str, List[Offer]] = {}
+        missing = []
+        for key in keys:
+            offers = self._offers.get(key)
+            if offers is None:
+                missing.append(key)
+            else:
+                found[key] = offers
+        if missing:
+            loaded = offers_from_rows(db_manager.get_offers(sorted(missing)))
+            for key in missing:
+                offers = loaded.get(key, [])
+                self._offers.set(key, offers)
+                found[key] = offers
+        return found
+
+
+@dataclass
+class PricedLine:
+    """Pricing for one resolved BOM part."""
+    kicad_part_number: str
+    manufacturer_part_number: str
+    quantity: int
+    quote: Optional[Quote] = None
+
+
+@dataclass
+class BomPricing:
+    """Outcome of price_bom(). other_currency lists the parts left unpriced
+    because their only usable offers are in another currency."""
+    currency: str = DEFAULT_CURRENCY
+    lines: List[PricedLine] = field(default_factory=list)
+    total: Decimal = Decimal(0)
+    unpriced: List[str] = field(default_factory=list)
+    other_currency: List[str] = field(default_factory=list)
+    short: List[str] = field(default_factory=list)
+    elapsed_ms: float = 0.0
+
+
+def price_bom(db_manager, report: BomReport, offer_cache: Optional[OfferCache] = None,
+              currency: str = DEFAULT_CURRENCY) -> BomPricing:
+    """Pick the best offer in currency for every resolved part at its total
+    quantity. Offers in other currencies are never ranked against it; a part
+    that only has those is unpriced and listed in other_currency.
+
+    With an offer_cache, offers come from (and fill) the cache. Without one,
+    DatabaseManager.get_best_prices() picks the best offer per currency
+    server-side. Either way it is at most one query.
+    """
+    started = time.perf_counter()
+    pricing = BomPricing(currency)
+    parts = [part for part in report.parts if part.manufacturer_part_number]
+    pricing.unpriced = [part.kicad_part_number for part in report.parts if not part.manufacturer_part_number]
+
+    quotes: Dict[str, Dict[str, Quote]] = {}
+    if offer_cache is not None:
+        offers = offer_cache.get_offers(db_manager, [part.manufacturer_part_number for part in parts])
+        for part in parts:
+            quotes[part.kicad_part_number] = best_quotes(offers.get(normalize_mpn(part.manufacturer_part_number), []),
+                                                         part.quantity)
+    elif parts:
+        rows = db_manager.get_best_prices([normalize_mpn(part.manufacturer_part_number) for part in parts],
+                                          [part.quantity for part in parts])
+        by_key: Dict[Tuple[str, int], List[Tuple]] = {}
+        for row in rows:
+            by_key.setdefault((row[0], row[1]), []).append(row)
+        for part in parts:
+            part_quotes = quotes[part.kicad_part_number] = {}
+            for row in by_key.get((normalize_mpn(part.manufacturer_part_number), part.quantity), []):
+                _, _, supplier_name, mpn, spn, stock, offer_currency, min_quantity, unit_price = row
+                offer = Offer(supplier_name, mpn, spn or "", stock, offer_currency, [(min_quantity, Decimal(unit_price))])
+                part_quotes[offer_currency] = Quote(offer, part.quantity, Decimal(unit_price))
+
+    for part in parts:
+        part_quotes = quotes.get(part.kicad_part_number, {})
+        quote = part_quotes.get(currency)
+        pricing.lines.append(PricedLine(part.kicad_part_number, part.manufacturer_part_number, part.quantity, quote))
+        if quote is None:
+            pricing.unpriced.append(part.kicad_part_number)
+            if part_quotes:
+                pricing.other_currency.append(part.kicad_part_number)
+            continue
+        pricing.total += quote.extended_price
+        if not quote.offer.in_stock(part.quantity):
+            pricing.short.append(part.kicad_part_number)
+    pricing.elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.info("Priced %d BOM parts in %s (%d unpriced, %d only in other currencies) in %.1f ms", len(pricing.lines),
+                currency, len(pricing.unpriced), len(pricing.other_currency), pricing.elapsed_ms)
+    return pricing
+
+
+@dataclass(slots=True)
+class Supplier:
+    """Data class representing a supplier in the database."""
+    supplier_name: str = ""
+    supplier_address: str = ""
+    supplier_web_url: str = ""
+    supplier_phone: str = ""
+    supplier_email: str = ""
+
+
+class PricingMixin:
+    """Supplier, offer and price queries of DatabaseManager, through its
+    cursor and _commit."""
+
+    def get_supplier_names(self) -> List[str]:
+        """Every supplier_name in the supplier table, sorted."""
+        self.cursor.execute("SELECT supplier_name FROM supplier ORDER BY supplier_name")
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def import_supplier_prices(self, supplier_name: str, path: str) -> Tuple[int, int]:
+        """Bulk-load a supplier price file (CSV, header row, one row per price
+        break; columns from pricing.PRICE_FILE_COLUMNS) through COPY into a
+        staging table, then upsert the offers and replace their breaks.
+        Currencies are upper-cased, defaulting to pricing.DEFAULT_CURRENCY.
+        Returns (offers, price breaks) written. Raises ValueError if
+        supplier_name isn't in the supplier table."""
+        with open(path, newline="", encoding="utf-8-sig") as f_in:
+            header = [column.strip().lower() for column in next(csv.reader(f_in), [])]
+        unknown = [column for column in header if column not in PRICE_FILE_COLUMNS]
+        missing = [column for column in REQUIRED_PRICE_FILE_COLUMNS if column not in header]
+        if unknown or missing:
+            raise ValueError(f"Price file columns must be from {', '.join(PRICE_FILE_COLUMNS)}; "
+                             f"unknown: {', '.join(unknown) or 'none'}, missing: {', '.join(missing) or 'none'}")
+        try:
+            self.cursor.execute("SELECT FROM supplier WHERE supplier_name = %s", (supplier_name,))
+            if self.cursor.fetchone() is None:
+                raise ValueError(f"Unknown supplier: {supplier_name}")
+            self.cursor.execute("""CREATE TEMP TABLE supplier_price_import (
+                    manufacturer_part_number text, supplier_part_number text, stock integer,
+                    currency text, min_quantity integer, unit_price numeric) ON COMMIT DROP""")
+            with open(path, encoding="utf-8-sig") as f_in:
+                self.cursor.copy_expert(f"COPY supplier_price_import ({', '.join(header)}) "
+                                        "FROM STDIN WITH (FORMAT csv, HEADER true)", f_in)
+            self.cursor.execute("""INSERT INTO supplier_offers
+                        (supplier_name, manufacturer_part_number, supplier_part_number, stock, currency)
+                    SELECT DISTINCT ON (manufacturer_part_number)
+                           %s, manufacturer_part_number, supplier_part_number, stock,
+                           coalesce(upper(nullif(trim(currency), '')), %s)
+                    FROM supplier_price_import
+                    WHERE coalesce(manufacturer_part_number, '') <> ''
+                    ORDER BY manufacturer_part_number
+                    ON CONFLICT (supplier_name, manufacturer_part_number) DO UPDATE
+                    SET supplier_part_number = EXCLUDED.supplier_part_number, stock = EXCLUDED.stock,
+                        currency = EXCLUDED.currency, updated_at = now()""", (supplier_name, DEFAULT_CURRENCY))
+            offers = self.cursor.rowcount
+            self.cursor.execute("""DELETE FROM supplier_price_breaks AS b
+                    USING supplier_offers AS o
+                    WHERE b.offer_id = o.offer_id AND o.supplier_name = %s
+                      AND o.manufacturer_part_number IN (SELECT manufacturer_part_number FROM supplier_price_import)""",
+                                (supplier_name,))
+            self.cursor.execute("""INSERT INTO supplier_price_breaks (offer_id, min_quantity, unit_price)
+                    SELECT DISTINCT ON (o.offer_id, i.min_quantity) o.offer_id, i.min_quantity, i.unit_price
+                    FROM supplier_price_import AS i
+                    JOIN supplier_offers AS o
+                      ON o.supplier_name = %s AND o.manufacturer_part_number = i.manufacturer_part_number
+                    WHERE i.min_quantity > 0 AND i.unit_price IS NOT NULL
+                    ORDER BY o.offer_id, i.min_quantity, i.unit_price""", (supplier_name,))
+            breaks = self.cursor.rowcount
+            self._commit("supplier_offers")
+        except Exception:
+            self.db_connection.rollback()
+            raise
+        return offers, breaks
+
+    def get_offers(self, mpn_keys: List[str]) -> List[Tuple]:
+        """Every offer and price break for the given normalised MPNs:
+        (offer_id, mpn_key, supplier_name, manufacturer_part_number,
+        supplier_part_number, stock, currency, min_quantity, unit_price),
+        ordered by offer then min_quantity (see pricing.offers_from_rows)."""
+        if not mpn_keys:
+            return []
+        self.cursor.execute("""SELECT o.offer_id, o.mpn_key, o.supplier_name, o.manufacturer_part_number,
+                       o.supplier_part_number, o.stock, o.currency, b.min_quantity, b.unit_price
+                FROM supplier_offers AS o
+                LEFT JOIN supplier_price_breaks AS b ON b.offer_id = o.offer_id
+                WHERE o.mpn_key = ANY(%s)
+                ORDER BY o.offer_id, b.min_quantity""", (list(mpn_keys),))
+        return self.cursor.fetchall()
+
+    def get_best_prices(self, mpn_keys: List[str], quantities: List[int]) -> List[Tuple]:
+        """Best offer in each currency for each (normalised MPN, quantity)
+        pair in one query: the applicable break per offer comes from a
+        backward scan of the (offer_id, min_quantity) key, then within a
+        currency in-stock offers win, then the lowest unit price. Prices in
+        different currencies are never ranked against each other. Returns
+        (mpn_key, quantity, supplier_name, manufacturer_part_number,
+        supplier_part_number, stock, currency, min_quantity, unit_price);
+        pairs with no usable offer are absent."""
+        if not mpn_keys:
+            return []
+        self.cursor.execute("""SELECT DISTINCT ON (w.mpn_key, w.quantity, o.currency)
+                       w.mpn_key, w.quantity, o.supplier_name, o.manufacturer_part_number, o.supplier_part_number,
+                       o.stock, o.currency, pb.min_quantity, pb.unit_price
+                FROM unnest(%s::text[], %s::integer[]) AS w (mpn_key, quantity)
+                JOIN supplier_offers AS o ON o.mpn_key = w.mpn_key
+                CROSS JOIN LATERAL (
+                    SELECT b.min_quantity, b.unit_price FROM supplier_price_breaks AS b
+                    WHERE b.offer_id = o.offer_id AND b.min_quantity <= w.quantity
+                    ORDER BY b.min_quantity DESC LIMIT 1) AS pb
+                ORDER BY w.mpn_key, w.quantity, o.currency, (o.stock IS NOT NULL AND o.stock < w.quantity),
+                         pb.unit_price""",
+                            (list(mpn_keys), list(quantities)))
+        return self.cursor.fetchall()
+
+    def add_supplier(self, supplier: Supplier) -> None:
+        """Add a new supplier to the database."""
+        sql = """INSERT INTO supplier (supplier_name, supplier_address, supplier_web_url,
+                supplier_phone, supplier_email) VALUES (%s, %s, %s, %s, %s)"""
+        values = [
+            supplier.supplier_name, supplier.supplier_address, supplier.supplier_web_url,
+            supplier.supplier_phone, supplier.supplier_email
+        ]
+        self.cursor.execute(sql, values)
+        self._commit("supplier")
@@ -0,0 +1,60 @@
+"""DatasheetStore.fetch_summary scans the PDF off the calling thread."""
+import pathlib
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import datasheet_store
+from datasheet_store import DatasheetStore
+
+PDF = b"%PDF-1.7\n1 0 obj << /Type /Pages >>\n2 0 obj << /Type /Page >>\n3 0 obj << /Type /Page >>\n" \
+      b"4 0 obj << /Title (LM358 Datasheet) >>\n%%EOF\n"
+
+
+class FetchSummaryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        root = pathlib.Path(self.directory.name)
+        self.pdf_path = root / "lm358.pdf"
+        self.pdf_path.write_bytes(PDF)
+        self.store = DatasheetStore(root / "store")
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def test_summary_of_local_file(self):
+        path, summary = self.store.fetch_summary(str(self.pdf_path)).result(timeout=10)
+        self.assertEqual(path, self.pdf_path.resolve())
+        self.assertEqual((summary.version, summary.pages, summary.title), ("1.7", 2, "LM358 Datasheet"))
+        self.assertEqual(summary.size, len(PDF))
+
+    def test_scan_runs_on_the_pool(self):
+        threads = []
+        real_summary = datasheet_store.pdf_summary
+
+        def recording_summary(path):
+            threads.append(threading.current_thread())
+            return real_summary(path)
+
+        with mock.patch.object(datasheet_store, "pdf_summary", recording_summary):
+            self.store.fetch_summary(str(self.pdf_path)).result(timeout=10)
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+
+    def test_fetch_error_is_the_futures(self):
+        missing = pathlib.Path(self.directory.name) / "missing.pdf"
+        future = self.store.fetch_summary(missing.as_uri())
+        with self.assertRaises(OSError):
+            future.result(timeout=10)
+
+    def test_closed_store_cancels(self):
+        self.store.close()
+        future = self.store.fetch_summary(str(self.pdf_path))
+        self.assertTrue(future.cancelled())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+"""Value duplicate grouping: suffixed values block with their bare forms."""
+import unittest
+
+from bulk_edit import value_duplicate_groups
+
+
+def _groups(rows):
+    return sorted(group.kicad_part_numbers for group in value_duplicate_groups(rows))
+
+
+class ValueDuplicateGroupsTest(unittest.TestCase):
+
+    def test_suffixed_values_group_with_bare_form_only(self):
+        rows = [
+            ("R1", "Resistor", "R_0603", "10k", ""),
+            ("R2", "Resistor", "R_0603", "10k 1%", ""),
+            ("R3", "Resistor", "R_0603", "10 kΩ", ""),
+            ("R4", "Resistor", "R_0603", "10k1", ""),
+            ("R5", "Resistor", "R_0603", "1k 5%", ""),
+            ("R6", "Resistor", "R_0603", "10k 0603", ""),
+        ]
+        self.assertEqual(_groups(rows), [["R1", "R2", "R3", "R6"]])
+
+    def test_capacitor_suffixes(self):
+        rows = [
+            ("C1", "Capacitor", "C_0402", "100n", ""),
+            ("C2", "Capacitor", "C_0402", "100n 50V", ""),
+            ("C3", "Capacitor", "C_0402", "100nF 50V X7R", ""),
+            ("C4", "Capacitor", "C_0402", "100p 50V", ""),
+            ("C5", "Capacitor", "C_0402", "22p C0G", ""),
+            ("C6", "Capacitor", "C_0402", "22p", ""),
+            ("C7", "Capacitor", "C_0402", "220p", ""),
+        ]
+        self.assertEqual(_groups(rows), [["C1", "C2", "C3"], ["C5", "C6"]])
+
+    def test_footprint_and_type_split_blocks(self):
+        rows = [
+            ("R1", "Resistor", "R_0603", "10k 1%", ""),
+            ("R2", "Resistor", "R_0805", "10k", ""),
+            ("L1", "Inductor", "R_0603", "10k", ""),
+        ]
+        self.assertEqual(_groups(rows), [])
+
+    def test_different_mpns_are_alternates(self):
+        rows = [
+            ("R1", "Resistor", "R_0603", "10k", "RC0603FR-0710KL"),
+            ("R2", "Resistor", "R_0603", "10k 1%", "ERJ-3EKF1002V"),
+            ("R3", "Resistor", "R_0603", "10k", ""),
+            ("R4", "Resistor", "R_0603", "10 kΩ", ""),
+        ]
+        self.assertEqual(_groups(rows), [["R3", "R4"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
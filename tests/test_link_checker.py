@@ -0,0 +1,112 @@
+"""LinkChecker against a local http.server standing in for vendor sites."""
+import asyncio
+import http.server
+import threading
+import unittest
+
+from link_checker import STATE_DEAD, STATE_OK, STATE_STALE, LinkChecker, LinkResult
+
+ETAG = '"v1"'
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """Routes: /ok, /moved (301 to /ok), /found (302 to /ok), /missing (404),
+    /get-only (405 to HEAD, 200 to GET). /ok answers 304 to a matching
+    If-None-Match."""
+
+    requests = []
+
+    def do_HEAD(self):  # pylint: disable=invalid-name
+        self._respond("HEAD")
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        self._respond("GET")
+
+    def _respond(self, method):
+        self.requests.append((method, self.path))
+        if self.path == "/ok":
+            if self.headers.get("If-None-Match") == ETAG:
+                self._send(304)
+            else:
+                self._send(200, {"ETag": ETAG})
+        elif self.path == "/moved":
+            self._send(301, {"Location": "/ok"})
+        elif self.path == "/found":
+            self._send(302, {"Location": "/ok"})
+        elif self.path == "/get-only":
+            self._send(405 if method == "HEAD" else 200)
+        else:
+            self._send(404)
+
+    def _send(self, status, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+class LinkCheckerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.thread.join()
+
+    def setUp(self):
+        _Handler.requests = []
+        self.checker = LinkChecker(cache_path=None, timeout=5.0)
+
+    def check(self, path, previous=None):
+        return asyncio.run(self.checker._check(self.base + path, previous))  # pylint: disable=protected-access
+
+    def test_ok(self):
+        result = self.check("/ok")
+        self.assertEqual((result.state, result.status, result.etag), (STATE_OK, 200, ETAG))
+        self.assertEqual(_Handler.requests, [("HEAD", "/ok")])
+
+    def test_permanent_redirect_is_followed_and_stale(self):
+        result = self.check("/moved")
+        self.assertEqual((result.state, result.status), (STATE_STALE, 200))
+        self.assertEqual(result.final_url, self.base + "/ok")
+
+    def test_temporary_redirect_is_followed_and_ok(self):
+        result = self.check("/found")
+        self.assertEqual((result.state, result.final_url), (STATE_OK, self.base + "/ok"))
+
+    def test_not_modified_keeps_previous_result(self):
+        previous = LinkResult(self.base + "/ok", STATE_OK, 200, self.base + "/ok", etag=ETAG, checked_at=1.0)
+        result = self.check("/ok", previous)
+        self.assertEqual(result.state, STATE_OK)
+        self.assertGreater(result.checked_at, 1.0)
+        self.assertEqual(result._replace(checked_at=1.0), previous)
+
+    def test_missing_is_dead(self):
+        result = self.check("/missing")
+        self.assertEqual((result.state, result.status), (STATE_DEAD, 404))
+
+    def test_head_not_allowed_falls_back_to_get(self):
+        result = self.check("/get-only")
+        self.assertEqual((result.state, result.status), (STATE_OK, 200))
+        self.assertEqual(_Handler.requests, [("HEAD", "/get-only"), ("GET", "/get-only")])
+
+    def test_start_checks_in_background(self):
+        self.checker.start([self.base + "/ok", self.base + "/missing", "not a url"])
+        self.checker._thread.join(10)  # pylint: disable=protected-access
+        self.assertEqual(self.checker.progress(), (2, 2))
+        self.assertEqual(self.checker.result(self.base + "/missing").state, STATE_DEAD)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+"""Part record sizes: slots and interning each shrink a bulk list of parts."""
+import unittest
+
+from database import PART_INTERNED_FIELDS, interned_part
+from memory_report import deep_size, part_record_sizes
+
+
+def _row(number):
+    # kicad_part_number, then PART_EDIT_COLUMNS in Part field order.
+    return (f"R{number:05d}", f"Resistor {number}", "", f"db_footprints:R_{number % 3:04d}",
+            f"db_library:R_{number % 2}", "", f"MPN-{number}", "".join(["Yageo"]), "", "", f"{number}k",
+            "".join(["Resis", "tor"]), False, False, False)
+
+
+class MemoryReportTest(unittest.TestCase):
+
+    def test_deep_size_counts_shared_objects_once(self):
+        text = "x" * 1000
+        self.assertLess(deep_size([text, text]), deep_size([text, "y" * 1000]))
+
+    def test_interned_part_shares_repeated_values(self):
+        first = interned_part(component_type="".join(["Capa", "citor"]), manufacturer="".join(["Mu", "rata"]))
+        second = interned_part(component_type="".join(["Capa", "citor"]), manufacturer="".join(["Mu", "rata"]))
+        for name in ("component_type", "manufacturer"):
+            self.assertIs(getattr(first, name), getattr(second, name))
+        self.assertIn("footprint_ref", PART_INTERNED_FIELDS)
+
+    def test_slots_then_interning_shrink_records(self):
+        sizes = part_record_sizes(_row(number) for number in range(500))
+        self.assertEqual(sizes["parts"], 500)
+        self.assertLess(sizes["slotted"], sizes["dataclass"])
+        self.assertLess(sizes["interned"], sizes["slotted"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+"""parse_value on the spellings found in real part values."""
+import unittest
+
+from part_values import parse_range_query, parse_value
+
+
+class ParseValueTest(unittest.TestCase):
+
+    def assertParses(self, value, expected, component_type=None):  # pylint: disable=invalid-name
+        parsed = parse_value(value, component_type)
+        self.assertIsNotNone(parsed, value)
+        self.assertAlmostEqual(parsed[0], expected[0], delta=abs(expected[0]) * 1e-9, msg=value)
+        self.assertEqual(parsed[1], expected[1], value)
+
+    def test_plain_values(self):
+        self.assertParses("10k", (1e4, "ohm"), "Resistor")
+        self.assertParses("100nF", (1e-7, "F"))
+        self.assertParses("0.1u", (1e-7, "F"), "Capacitor")
+        self.assertParses("4k7", (4700, "ohm"), "Resistor")
+        self.assertParses("10000R", (1e4, "ohm"))
+        self.assertParses("1Meg", (1e6, "ohm"), "Resistor")
+        self.assertParses("4.7µH", (4.7e-6, "H"))
+
+    def test_space_before_prefix_or_unit(self):
+        self.assertParses("10 kΩ", (1e4, "ohm"))
+        self.assertParses("10K ohm", (1e4, "ohm"))
+        self.assertParses("4k7 ohm", (4700, "ohm"))
+        self.assertParses("4.7 µF", (4.7e-6, "F"))
+        self.assertParses("100 n", (1e-7, "F"), "Capacitor")
+
+    def test_tolerance_suffix(self):
+        self.assertParses("10k 1%", (1e4, "ohm"), "Resistor")
+        self.assertParses("1k 5%", (1e3, "ohm"), "Resistor")
+        self.assertParses("10 kΩ 0.1%", (1e4, "ohm"))
+
+    def test_voltage_suffix(self):
+        self.assertParses("100n 50V", (1e-7, "F"), "Capacitor")
+        self.assertParses("4u7 50V", (4.7e-6, "F"), "Capacitor")
+        self.assertParses("100nF 16 V", (1e-7, "F"))
+
+    def test_package_suffix(self):
+        self.assertParses("10k 0603", (1e4, "ohm"), "Resistor")
+        self.assertParses("1u 0805 X5R", (1e-6, "F"), "Capacitor")
+
+    def test_dielectric_suffix(self):
+        self.assertParses("22p C0G", (2.2e-11, "F"), "Capacitor")
+        self.assertParses("100nF 50V X7R", (1e-7, "F"))
+        self.assertParses("1n NP0", (1e-9, "F"), "Capacitor")
+
+    def test_trailing_word_that_is_not_a_unit(self):
+        self.assertParses("10 pcs", (10, ""))
+        self.assertParses("100nF V", (1e-7, "F"))
+
+    def test_rkm_value_is_not_a_suffix(self):
+        self.assertParses("10k1", (10100, "ohm"), "Resistor")
+
+    def test_unparseable(self):
+        for value in ("", "   ", "DNP", "abc 10k", "10x"):
+            self.assertIsNone(parse_value(value, "Resistor"), value)
+
+
+class ParseRangeQueryTest(unittest.TestCase):
+
+    def test_designator_and_bounds(self):
+        query = parse_range_query("C 90n..110n")
+        self.assertEqual((query.component_type, query.unit), ("Capacitor", "F"))
+        self.assertAlmostEqual(query.low, 9e-8)
+        self.assertAlmostEqual(query.high, 1.1e-7)
+
+    def test_open_ended(self):
+        query = parse_range_query("R ..10k")
+        self.assertIsNone(query.low)
+        self.assertEqual(query.high, 1e4)
+
+    def test_not_a_range(self):
+        self.assertIsNone(parse_range_query("10k"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+"""Offer ranking and BOM pricing never compare prices across currencies."""
+import unittest
+from decimal import Decimal
+
+from bom import BomReport, ResolvedPart
+from pricing import Offer, OfferCache, best_quote, best_quotes, price_bom
+
+
+def offer(supplier_name, currency, price, stock=None, mpn="LM358"):
+    """An offer with a single price break from 1 up."""
+    return Offer(supplier_name, mpn, stock=stock, currency=currency, breaks=[(1, Decimal(price))])
+
+
+class OfferRows:
+    """Stands in for DatabaseManager.get_offers() over a fixed set of offers."""
+
+    def __init__(self, offers):
+        self.offers = offers
+
+    def get_offers(self, mpn_keys):
+        rows = []
+        for offer_id, item in enumerate(self.offers):
+            if item.manufacturer_part_number in mpn_keys:
+                rows += [(offer_id, item.manufacturer_part_number, item.supplier_name, item.manufacturer_part_number,
+                          "", item.stock, item.currency, min_quantity, unit_price)
+                         for min_quantity, unit_price in item.breaks]
+        return rows
+
+
+class BestQuoteTest(unittest.TestCase):
+
+    def test_ranked_within_each_currency(self):
+        quotes = best_quotes([offer("A", "USD", "0.50"), offer("B", "JPY", "60"), offer("C", "USD", "0.40"),
+                              offer("D", "JPY", "55")], 10)
+        self.assertEqual({currency: quote.offer.supplier_name for currency, quote in quotes.items()},
+                         {"USD": "C", "JPY": "D"})
+
+    def test_cheaper_number_in_another_currency_does_not_win(self):
+        offers = [offer("A", "USD", "0.50"), offer("B", "JPY", "0.10")]
+        self.assertEqual(best_quote(offers, 10, "USD").offer.supplier_name, "A")
+        self.assertIsNone(best_quote(offers, 10, "EUR"))
+
+    def test_in_stock_preferred(self):
+        quote = best_quote([offer("A", "USD", "0.40", stock=5), offer("B", "USD", "0.50", stock=100)], 10)
+        self.assertEqual(quote.offer.supplier_name, "B")
+
+
+class PriceBomTest(unittest.TestCase):
+
+    def test_other_currency_reported_not_totalled(self):
+        database = OfferRows([offer("A", "USD", "0.50", mpn="LM358"), offer("B", "EUR", "0.01", mpn="LM358"),
+                              offer("C", "EUR", "0.20", mpn="NE555")])
+        report = BomReport(parts=[ResolvedPart("IC-1", manufacturer_part_number="LM358", quantity=4),
+                                  ResolvedPart("IC-2", manufacturer_part_number="NE555", quantity=2),
+                                  ResolvedPart("IC-3", quantity=1)])
+        pricing = price_bom(database, report, OfferCache(), "USD")
+        self.assertEqual(pricing.total, Decimal("2.00"))
+        self.assertEqual(pricing.unpriced, ["IC-3", "IC-2"])
+        self.assertEqual(pricing.other_currency, ["IC-2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
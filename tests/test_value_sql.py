@@ -0,0 +1,58 @@
+"""The SQL mirrors of parse_value and natural_sort_key against the Python
+originals. Needs a PostgreSQL database: set KICAD_DB_TEST_DSN to a libpq
+connection string. The functions are created in a transaction that is
+rolled back, so the database is left as it was."""
+import os
+import random
+import unittest
+
+from part_values import NATURAL_SORT_KEY_FUNCTION, PARSE_VALUE_FUNCTIONS, natural_sort_key, parse_value
+
+DSN = os.environ.get("KICAD_DB_TEST_DSN")
+
+VALUES = [
+    "", "  ", "10k", "10k 1%", "10k 0603", "1k 5%", "100n 50V", "4u7 50V", "22p C0G", "10 kΩ", "10K ohm",
+    "10000R", "4k7 ohm", "100nF 50V X7R", "0.1u", "10k1", "DNP", "1e3", "10 pcs", "4.7 µF", "1 Meg", "1megohm",
+    "2M2", "1R0", "4k7F5", "4k7meg", "10 kΩ", "１０k", "10 kä", "1e400", "1e-400", "1e308k", "0e99999",
+]
+
+
+@unittest.skipUnless(DSN, "KICAD_DB_TEST_DSN not set")
+class ValueSqlTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        import psycopg2  # pylint: disable=import-outside-toplevel
+        cls.connection = psycopg2.connect(DSN)
+        cls.cursor = cls.connection.cursor()
+        for statement in [NATURAL_SORT_KEY_FUNCTION] + PARSE_VALUE_FUNCTIONS:
+            cls.cursor.execute(statement)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.connection.rollback()
+        cls.connection.close()
+
+    @staticmethod
+    def _random_values(alphabet, count):
+        rnd = random.Random(1)
+        return ["".join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 12))) for _ in range(count)]
+
+    def test_parse_value(self):
+        values = VALUES + self._random_values("0123456789.eE+-kKmMunpfGTRrohmsFHVAWzegä µΩ%", 5000)
+        for component_type in (None, "Resistor", "Capacitor", "Other"):
+            self.cursor.execute("SELECT v, (kicad_parse_value(v, %s)).* FROM unnest(%s::text[]) AS v",
+                                (component_type, values))
+            for value, magnitude, unit in self.cursor.fetchall():
+                self.assertEqual((magnitude, unit), parse_value(value, component_type) or (None, None),
+                                 f"{value!r} {component_type}")
+
+    def test_natural_sort_key(self):
+        values = VALUES + ["007", "a0b00c", "x1" + "0" * 20] + self._random_values("0123456789aB -", 2000)
+        self.cursor.execute("SELECT v, kicad_natural_sort_key(v) FROM unnest(%s::text[]) AS v", (values,))
+        for value, key in self.cursor.fetchall():
+            self.assertEqual(key, natural_sort_key(value), repr(value))
+
+
+if __name__ == "__main__":
+    unittest.main()